@@ -2,35 +2,124 @@
 Results and Recommendations Page
 """
 
+import math
+
 import streamlit as st
+from utils.assessment_log import AssessmentLog, LogSchema
+from utils.batch_score import collection_name
 from utils.config import (
     ORGANIZATION_SCORING_PATH,
     TECHNICAL_SCORING_PATH,
     LEGAL_SCORING_PATH,
     AMBITION_SCORING_PATH,
-    QUESTIONS_CACHE_KEY,
+    ASSESSMENT_LOG_DIR,
+    ASSESSMENT_LOG_ENABLED,
+    COHORT_PERCENTILES_ENABLED,
+    RESPONSES_CACHE_KEY,
+    RESUME_QUERY_PARAM,
+    SUBMITTED_ASSESSMENT_KEY,
+)
+from utils.loader import (
+    load_cohort_sketches,
+    load_collection_matrix,
+    load_question_bank,
+    load_response_codec,
+    restore_session,
 )
-from utils.loader import load_question_collection
 from utils.navigation import add_navigation_buttons
-from utils.question_renderer import build_contributions_table
+from utils.question_renderer import get_contribution_tables
+from utils.sensitivity import get_bucket_sensitivity
+from utils.timing import rerun_scope, span
 from utils.visualization import render_score_bar
 
 SCORING_CATEGORIES = [ORGANIZATION_SCORING_PATH, LEGAL_SCORING_PATH, TECHNICAL_SCORING_PATH, AMBITION_SCORING_PATH]
 
 DATAFRAME_ROW_HEIGHT = 200
-
-# Redirect to Introduction page on uninitialized app
-if st.session_state.get("questions") is None:
+# Number of answers that raise and lower the score the most to show per scoring category
+MAX_DRIVERS_SHOWN = 3
+CONTRIBUTION_TABLE_LABELS = {
+    "positive": "**Responses contributing to a higher score**",
+    "negative": "**Responses contributing to a lower score**",
+    "neutral": "**Neutral responses**",
+}
+# Number of answer changes that would move a result to a different category to show per scoring category
+MAX_BUCKET_FLIPS_SHOWN = 5
+# Cohort percentiles are only shown once this many assessments have been scored
+MIN_COHORT_SIZE = 20
+
+# Redirect to Introduction page on uninitialized app, unless the session can be restored
+if not restore_session():
     st.switch_page("Introduction.py")
 
 
+def submit_assessment(responses, collection_matrix, collection_scores):
+    """Append the assessment to the assessment log and add its scores to the cohort sketches.
+    Only the user's explicit submission is recorded, once per session, so revised answers are never counted twice:
+    scores can't be taken back out of the cohort's quantile sketches."""
+    collection_names = [collection_name(scoring_category) for scoring_category in SCORING_CATEGORIES]
+    if ASSESSMENT_LOG_ENABLED:
+        with span("log_assessment"):
+            schema = LogSchema.build(responses.index, collection_names, collection_matrix.collections)
+            log = AssessmentLog(ASSESSMENT_LOG_DIR, schema)
+            log.append(log.build_row(responses, collection_matrix.collections, collection_scores))
+    if COHORT_PERCENTILES_ENABLED:
+        with span("update_cohort_sketches"):
+            load_cohort_sketches().add(
+                {name: score.normalized_weighted_score for name, score in zip(collection_names, collection_scores)}
+            )
+    st.session_state[SUBMITTED_ASSESSMENT_KEY] = True
+
+
+def render_submit_assessment(responses, collection_matrix, collection_scores):
+    """Let the user submit their assessment once they are done changing answers."""
+    st.markdown("---")
+    st.subheader("Submit your assessment")
+    if not st.session_state.get(SUBMITTED_ASSESSMENT_KEY):
+        st.write(
+            "Add your answers and scores to the statistics of all submitted assessments. "
+            "Each session can submit once, so please review your answers first."
+        )
+        if st.button("Submit assessment"):
+            with span("submit_assessment"):
+                submit_assessment(responses, collection_matrix, collection_scores)
+    if st.session_state.get(SUBMITTED_ASSESSMENT_KEY):
+        st.success("Thank you, your assessment was submitted. Later changes to your answers are not submitted.")
+
+
+def render_cohort_percentile(scoring_category, question_collection, collection_score):
+    """Show the share of all scored assessments with a lower score in this category, once the cohort is large enough."""
+    cohort_sketches = load_cohort_sketches()
+    name = collection_name(scoring_category)
+    if cohort_sketches.cohort_size(name) < MIN_COHORT_SIZE or math.isnan(collection_score.normalized_weighted_score):
+        return
+    share_below = cohort_sketches.share_below(name, collection_score.normalized_weighted_score)
+    st.caption(
+        f"Your {question_collection.header} score is higher than {share_below:.0%} of the organizations "
+        "that completed this assessment."
+    )
+
+
 def main():
     st.title("Assessment Results")
     st.write("Summary of your assessment and recommendations for your AI/ML project.")
 
-    for scoring_category in SCORING_CATEGORIES:
-        question_collection = load_question_collection(str(scoring_category))
-        collection_score = question_collection.calculate_score(st.session_state[QUESTIONS_CACHE_KEY])
+    question_lookup = load_question_bank()
+    responses = st.session_state[RESPONSES_CACHE_KEY]
+
+    # Categories are scored from the session's running totals, which are started for all of them in one pass
+    with span("load_collection_matrix"):
+        collection_matrix = load_collection_matrix([str(scoring_category) for scoring_category in SCORING_CATEGORIES])
+    with span("score_collections"):
+        collection_scores = collection_matrix.score(responses)
+    # The response code identifies this set of answers, it is also shown below for resuming the assessment
+    with span("response_code"):
+        response_code = load_response_codec().encode(responses)
+    # Answer changes that would move a result are scored with the same weights as the result itself
+    importance_overrides = responses.importance_overrides
+
+    for scoring_category, question_collection, collection_score in zip(
+        SCORING_CATEGORIES, collection_matrix.collections, collection_scores
+    ):
 
         st.subheader(question_collection.header)
 
@@ -41,35 +130,60 @@ def main():
         else:
             st.error(f"Score '{collection_score}' is out of bounds. Please check score thresholds")
 
+        if COHORT_PERCENTILES_ENABLED:
+            with span("cohort_percentile"):
+                render_cohort_percentile(scoring_category, question_collection, collection_score)
+
         if question_collection.thresholds:
-            st.plotly_chart(
-                render_score_bar(collection_score.normalized_weighted_score, question_collection.thresholds),
-                width="content",
-            )
+            with span("render_score_bar"):
+                st.plotly_chart(
+                    render_score_bar(collection_score.normalized_weighted_score, question_collection.thresholds),
+                    width="content",
+                )
+
+        # The breakdown comes sorted by magnitude with the scores, so the largest drivers are its first entries
+        breakdown = collection_score.breakdown
+        for drivers_label, drivers in zip(
+            ["Answers raising this score the most", "Answers lowering this score the most"],
+            breakdown.top_drivers(MAX_DRIVERS_SHOWN),
+        ):
+            if drivers:
+                st.markdown(
+                    f"**{drivers_label}:** " + "; ".join(question_lookup[qid].question_text for qid, _ in drivers)
+                )
+
+        # Show detailed breakdown, the tables of collections whose answers didn't change are reused between reruns
+        with st.expander("Show detailed scoring breakdown"), span("contributions_tables"):
+            tables = get_contribution_tables(question_collection, breakdown, question_lookup, responses)
+            for group, table in tables.items():
+                st.markdown(CONTRIBUTION_TABLE_LABELS[group])
+                st.dataframe(table, row_height=DATAFRAME_ROW_HEIGHT, hide_index=True)
+
+        with st.expander("Show answers that would change this result"):
+            with span("bucket_sensitivity"):
+                bucket_flips = get_bucket_sensitivity(
+                    question_collection, question_lookup, importance_overrides
+                ).bucket_flips(responses)
+            if not bucket_flips:
+                st.write("No single answer change would move this result to a different category.")
+            for flip in bucket_flips[:MAX_BUCKET_FLIPS_SHOWN]:
+                new_header = flip.threshold.header if flip.threshold else "out of bounds"
+                st.markdown(
+                    f"- {question_lookup[flip.question_id].question_text} "
+                    f"Answering **{flip.new_response}** instead of **{flip.current_response}** "
+                    f"would move this result to **{new_header}** (score change {flip.score_delta:+.2f})"
+                )
+
+    if ASSESSMENT_LOG_ENABLED or COHORT_PERCENTILES_ENABLED:
+        render_submit_assessment(responses, collection_matrix, collection_scores)
 
-        # Show detailed breakdown
-        with st.expander("Show detailed scoring breakdown"):
-            question_lookup = st.session_state[QUESTIONS_CACHE_KEY]
-            positive = [(qid, s) for qid, s in collection_score.question_contributions if s > 0]
-            negative = [(qid, s) for qid, s in collection_score.question_contributions if s < 0]
-            neutral = [(qid, s) for qid, s in collection_score.question_contributions if s == 0]
-
-            positive_label = "**Responses contributing to a higher score**"
-            negative_label = "**Responses contributing to a lower score**"
-            neutral_label = "**Neutral responses**"
-
-            for table_label, table_entries in [
-                (positive_label, positive),
-                (negative_label, negative),
-                (neutral_label, neutral),
-            ]:
-                if table_entries:
-                    st.markdown(table_label)
-                    st.dataframe(
-                        build_contributions_table(table_entries, question_lookup),
-                        row_height=DATAFRAME_ROW_HEIGHT,
-                        hide_index=True,
-                    )
+    st.markdown("---")
+    st.subheader("Save your answers")
+    st.write(
+        "Add this to the end of the address of the start page to come back to your answers later, "
+        "or share it with your team."
+    )
+    st.code(f"?{RESUME_QUERY_PARAM}={response_code}", language=None)
 
     st.markdown("---")
     st.markdown(
@@ -81,4 +195,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with rerun_scope("Results"):
+        main()
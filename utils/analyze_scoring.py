@@ -5,22 +5,425 @@ Analyze scoring configurations to determine min and max possible scores.
 This script reads all questions from questions.json and specified scoring configuration
 files, then calculates and displays the minimum and maximum possible scores for
 each scoring configuration based on the weighted average scoring method.
+It also reports how the normalized scores of all possible answer combinations are distributed
+across the thresholds, to help with tuning them.
 
-Usage:
-    python -m utils.analyze_scoring data/*_scoring_questions.json
-    python -m utils.analyze_scoring --questions --scoring_configs /questions.json data/organizational_scoring_questions.json
+Each configuration is checked for question ids that are missing from the question bank or listed more than once,
+and for achievable normalized scores that no threshold covers or thresholds no score can reach. Questions that
+none of the configurations use are reported too.
+
+The question bank is validated once, and the configurations are analyzed in parallel by a pool of worker
+processes that each receive the validated questions once. Reports can be written as text, JSON or CSV.
 
-Arguments:
-    scoring_configs: One or more scoring configuration JSON files to analyze
+Usage:
+    python -m utils.analyze_scoring --scoring_configs data/*_scoring_questions.json
+    python -m utils.analyze_scoring --questions data/questions.json --scoring_configs data/organizational_scoring_questions.json
+    python -m utils.analyze_scoring --format json --output analysis.json --fail_on_issues
 
 Options:
     --questions PATH: Path to questions.json (default: data/questions.json)
+    --scoring_configs PATHS: One or more scoring configuration JSON files to analyze
+        (default: data/*_scoring_questions.json)
+    --answer_frequencies PATH: JSON file of observed answer counts as {question_id: {option_text: count}},
+        used to weight answer combinations instead of treating all answers as equally likely
+    --range_steps N: Number of values range questions are discretized into (default: 21)
+    --workers N: Number of worker processes (default: one per CPU, at most one per configuration)
+    --format FORMAT: text, json (one report of all configurations) or csv (one row per configuration, and one
+        listing the unused questions if there are any)
+        (default: text)
+    --output PATH: Where to write the report (default: stdout)
+    --fail_on_issues: Exit with status 1 if a configuration can't be analyzed or any check finds an issue
 """
 
 import argparse
+import csv
+import json
+import math
+import os
+import sys
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import TextIO
+
+from utils.config import DATA_DIR, QUESTIONS_PATH, SCORING_COLLECTIONS_GLOB
+from utils.models import Question, QuestionBank, QuestionScoringCollection
+from utils.score_distribution import DEFAULT_RANGE_STEPS, weighted_score_distribution
+
+OUTPUT_FORMATS = ("text", "json", "csv")
+CSV_COLUMNS = [
+    "config",
+    "header",
+    "error",
+    "n_questions",
+    "min_raw_score",
+    "max_raw_score",
+    "min_weighted_score",
+    "max_weighted_score",
+    "min_normalized_score",
+    "max_normalized_score",
+    "missing_question_ids",
+    "duplicate_question_ids",
+    "uncovered_ranges",
+    "unreachable_thresholds",
+    "threshold_shares",
+    "percentiles",
+    "unused_question_ids",
+]
+
+
+@dataclass
+class ThresholdAnalysis:
+    """One threshold of a scoring configuration and the answer combinations that fall into it"""
+
+    header: str
+    lower: float
+    """Lower bound of the normalized score (inclusive)"""
+    upper: float
+    """Upper bound of the normalized score (exclusive)"""
+    color: str
+    share: float
+    """Share of answer combinations whose normalized score falls into the threshold"""
+    reachable: bool
+    """Whether any achievable normalized score falls into the threshold"""
+
+
+@dataclass
+class ConfigAnalysis:
+    """Analysis of one scoring configuration file"""
+
+    config: str
+    """Path of the configuration file"""
+    error: str | None = None
+    """Why the configuration couldn't be analyzed, the remaining fields are empty if set"""
+    header: str | None = None
+    question_ids: list[str] = field(default_factory=list)
+    """Question ids of the configuration, in order and including duplicates"""
+    missing_question_ids: list[str] = field(default_factory=list)
+    """Question ids that are not in the question bank"""
+    duplicate_question_ids: list[str] = field(default_factory=list)
+    """Question ids listed more than once, each counted in the score as often as it is listed"""
+    min_raw_score: float | None = None
+    max_raw_score: float | None = None
+    min_weighted_score: float | None = None
+    max_weighted_score: float | None = None
+    min_normalized_score: float | None = None
+    """Lowest achievable normalized weighted score"""
+    max_normalized_score: float | None = None
+    """Highest achievable normalized weighted score"""
+    thresholds: list[ThresholdAnalysis] = field(default_factory=list)
+    uncovered_ranges: list[tuple[float, float]] = field(default_factory=list)
+    """Parts of the achievable normalized score range that no threshold covers, as closed intervals"""
+    outside_thresholds_share: float = 0.0
+    """Share of answer combinations whose normalized score falls outside all thresholds"""
+    distribution_is_exact: bool = True
+    distribution_step: float | None = None
+    """Weighted score grid step, if the distribution was approximated"""
+    percentiles: dict[str, float] = field(default_factory=dict)
+    """Normalized weighted score at percentiles of the answer combinations, keyed like "p50" """
+
+    @property
+    def issues(self) -> list[str]:
+        """Problems found by the checks, empty if the configuration is fine"""
+        if self.error:
+            return [self.error]
+        issues = []
+        if self.missing_question_ids:
+            issues.append(f"question ids not in the question bank: {', '.join(self.missing_question_ids)}")
+        if self.duplicate_question_ids:
+            issues.append(f"question ids listed more than once: {', '.join(self.duplicate_question_ids)}")
+        for low, high in self.uncovered_ranges:
+            issues.append(f"achievable normalized scores in [{low:.3f}, {high:.3f}] are not covered by any threshold")
+        for threshold in self.thresholds:
+            if not threshold.reachable:
+                issues.append(f"threshold '{threshold.header}' can't be reached by any achievable score")
+        return issues
+
+
+def normalized_score_range(min_weighted_score: float, max_weighted_score: float) -> tuple[float, float]:
+    """The lowest and highest achievable normalized weighted score, normalized like `ScoringPlan.score_result`:
+    positive weighted scores by the maximum, the others by the absolute minimum."""
+
+    def normalize(weighted_score: float) -> float:
+        denominator = max_weighted_score if weighted_score > 0 else abs(min_weighted_score)
+        return weighted_score / denominator if denominator else math.nan
+
+    return normalize(min_weighted_score), normalize(max_weighted_score)
+
+
+def threshold_coverage(
+    collection: QuestionScoringCollection, low: float, high: float
+) -> tuple[list[tuple[float, float]], list[bool]]:
+    """Check how the thresholds of a collection cover the achievable normalized score range.
+
+    Thresholds are validated to be contiguous, so only the ends of the range can be left uncovered.
+
+    Args:
+        collection: the scoring collection
+        low: lowest achievable normalized score
+        high: highest achievable normalized score
+
+    Returns:
+        tuple[list[tuple[float, float]], list[bool]]: the uncovered parts of [low, high] as closed intervals,
+            and whether each threshold can be reached by an achievable score
+    """
+    boundaries = collection.threshold_boundaries
+    if not boundaries or math.isnan(low) or math.isnan(high):
+        return [], [False] * len(collection.thresholds or [])
+    uncovered = []
+    if low < boundaries[0]:
+        uncovered.append((low, min(high, boundaries[0])))
+    # Upper bounds are exclusive, so a score exactly at the highest upper bound is not covered either
+    if high >= boundaries[-1]:
+        uncovered.append((max(low, boundaries[-1]), high))
+    reachable = [t.lower <= high and t.upper > low for t in collection.thresholds]
+    return uncovered, reachable
+
+
+def analyze_config(
+    config_path: Path,
+    question_lookup: Mapping[str, Question],
+    answer_frequencies: Mapping[str, Mapping[str, float]] | None = None,
+    range_steps: int = DEFAULT_RANGE_STEPS,
+) -> ConfigAnalysis:
+    """Analyze one scoring configuration file.
+
+    Args:
+        config_path: path of the scoring configuration JSON file
+        question_lookup: dictionary for looking up questions by question id
+        answer_frequencies: optional observed answer counts by question id and option text
+        range_steps: number of values range questions are discretized into
+
+    Returns:
+        ConfigAnalysis: the extremes, threshold distribution and checks of the configuration. A configuration
+            that isn't valid or references unknown question ids is returned with `error` set.
+    """
+    try:
+        question_collection = QuestionScoringCollection.model_validate_json(config_path.read_text())
+    except (OSError, ValueError) as e:
+        return ConfigAnalysis(config=str(config_path), error=f"could not load the configuration: {e}")
+
+    question_ids = list(question_collection.question_ids)
+    analysis = ConfigAnalysis(
+        config=str(config_path),
+        header=question_collection.header,
+        question_ids=question_ids,
+        missing_question_ids=sorted({qid for qid in question_ids if qid not in question_lookup}),
+        duplicate_question_ids=sorted(qid for qid, count in Counter(question_ids).items() if count > 1),
+    )
+    if analysis.missing_question_ids:
+        analysis.error = f"question ids not in the question bank: {', '.join(analysis.missing_question_ids)}"
+        return analysis
+
+    analysis.min_raw_score, analysis.min_weighted_score = question_collection.get_extreme_score(
+        question_lookup, is_min=True
+    )
+    analysis.max_raw_score, analysis.max_weighted_score = question_collection.get_extreme_score(question_lookup)
+    analysis.min_normalized_score, analysis.max_normalized_score = normalized_score_range(
+        analysis.min_weighted_score, analysis.max_weighted_score
+    )
+
+    distribution = weighted_score_distribution(
+        question_collection, question_lookup, answer_frequencies, range_steps=range_steps
+    )
+    analysis.distribution_is_exact = distribution.is_exact
+    analysis.distribution_step = None if distribution.is_exact else distribution.step
+    analysis.percentiles = {f"p{p}": score for p, score in distribution.percentiles().items()}
+
+    analysis.uncovered_ranges, reachable = threshold_coverage(
+        question_collection, analysis.min_normalized_score, analysis.max_normalized_score
+    )
+    # Shares are in threshold order, followed by the share outside all thresholds if there is one
+    bucket_shares = distribution.bucket_shares(question_collection)
+    analysis.outside_thresholds_share = sum(share for threshold, share in bucket_shares if threshold is None)
+    analysis.thresholds = [
+        ThresholdAnalysis(
+            header=threshold.header,
+            lower=threshold.lower,
+            upper=threshold.upper,
+            color=threshold.color,
+            share=share,
+            reachable=is_reachable,
+        )
+        for (threshold, share), is_reachable in zip(bucket_shares, reachable)
+    ]
+    return analysis
+
+
+# Validated questions and options of a worker process, set once per worker by `_init_worker`
+_worker_context: tuple[Mapping[str, Question], Mapping[str, Mapping[str, float]] | None, int] | None = None
+
+
+def _init_worker(
+    question_lookup: Mapping[str, Question], answer_frequencies: Mapping[str, Mapping[str, float]] | None, range_steps: int
+) -> None:
+    global _worker_context
+    _worker_context = (question_lookup, answer_frequencies, range_steps)
+
+
+def _analyze_in_worker(config_path: Path) -> ConfigAnalysis:
+    return analyze_config(config_path, *_worker_context)
+
+
+def analyze_configs(
+    config_paths: list[Path],
+    question_lookup: Mapping[str, Question],
+    answer_frequencies: Mapping[str, Mapping[str, float]] | None = None,
+    range_steps: int = DEFAULT_RANGE_STEPS,
+    workers: int | None = None,
+) -> list[ConfigAnalysis]:
+    """Analyze scoring configuration files in parallel.
+
+    Args:
+        config_paths: paths of the scoring configuration JSON files
+        question_lookup: validated questions by question id, sent to each worker process once
+        answer_frequencies: optional observed answer counts by question id and option text
+        range_steps: number of values range questions are discretized into
+        workers: number of worker processes (default: one per CPU, at most one per configuration).
+            With one worker, the configurations are analyzed in this process.
 
-from utils.models import QuestionBank, QuestionScoringCollection
+    Returns:
+        list[ConfigAnalysis]: the analysis of each configuration, in the order of the paths
+    """
+    workers = min(workers or os.cpu_count() or 1, len(config_paths))
+    if workers <= 1:
+        return [analyze_config(path, question_lookup, answer_frequencies, range_steps) for path in config_paths]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(dict(question_lookup), answer_frequencies, range_steps),
+    ) as executor:
+        return list(executor.map(_analyze_in_worker, config_paths))
+
+
+def unused_question_ids(question_lookup: Mapping[str, Question], analyses: list[ConfigAnalysis]) -> list[str]:
+    """Question ids of the question bank that none of the analyzed configurations use, in question bank order"""
+    used = {qid for analysis in analyses for qid in analysis.question_ids}
+    return [qid for qid in question_lookup if qid not in used]
+
+
+def _finite_or_none(value):
+    """Replace infinite and NaN floats, which JSON can't represent, with None, recursively"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite_or_none(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite_or_none(item) for item in value]
+    return value
+
+
+def write_json(
+    analyses: list[ConfigAnalysis], questions_path: Path, question_lookup: Mapping[str, Question], output: TextIO
+) -> None:
+    """Write one JSON report of all configurations. Unbounded threshold bounds are written as null."""
+    report = {
+        "questions": str(questions_path),
+        "n_questions": len(question_lookup),
+        "unused_question_ids": unused_question_ids(question_lookup, analyses),
+        "configs": [{**asdict(analysis), "issues": analysis.issues} for analysis in analyses],
+    }
+    json.dump(_finite_or_none(report), output, indent=2)
+    output.write("\n")
+
+
+def write_csv(
+    analyses: list[ConfigAnalysis], questions_path: Path, question_lookup: Mapping[str, Question], output: TextIO
+) -> None:
+    """Write one CSV row per configuration. Lists are joined with "; ", threshold shares and percentiles are JSON.
+    If some questions of the question bank aren't used by any configuration, a last row for the question bank
+    lists them in the `unused_question_ids` column."""
+    writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for analysis in analyses:
+        row = {
+            column: getattr(analysis, column, None)
+            for column in CSV_COLUMNS
+            if column not in ("n_questions", "unused_question_ids")
+        }
+        row["n_questions"] = len(analysis.question_ids)
+        row["missing_question_ids"] = "; ".join(analysis.missing_question_ids)
+        row["duplicate_question_ids"] = "; ".join(analysis.duplicate_question_ids)
+        row["uncovered_ranges"] = "; ".join(f"[{low:.6g}, {high:.6g}]" for low, high in analysis.uncovered_ranges)
+        row["unreachable_thresholds"] = "; ".join(t.header for t in analysis.thresholds if not t.reachable)
+        shares = {t.header: t.share for t in analysis.thresholds}
+        if analysis.outside_thresholds_share:
+            shares["Outside all thresholds"] = analysis.outside_thresholds_share
+        row["threshold_shares"] = json.dumps(shares)
+        row["percentiles"] = json.dumps(analysis.percentiles)
+        writer.writerow(row)
+    unused = unused_question_ids(question_lookup, analyses)
+    if unused:
+        writer.writerow(
+            {"config": str(questions_path), "n_questions": len(question_lookup), "unused_question_ids": "; ".join(unused)}
+        )
+
+
+def print_analysis(analysis: ConfigAnalysis, weighting: str) -> None:
+    """Print the analysis of one configuration as text."""
+    print(f"\nScoring Config: {Path(analysis.config).name}")
+    print("-" * 80)
+
+    if analysis.error:
+        print("Error:", analysis.error)
+        print("=" * 80)
+        return
+
+    # Display header if available
+    if analysis.header:
+        print("Header:", analysis.header)
+
+    print(f"Number of questions: {len(analysis.question_ids)}")
+
+    print("\nMinimum Scores:")
+    print("  Minimum weighted score:", analysis.min_weighted_score)
+    print("  Minimum raw score (without importance weighting):", analysis.min_raw_score)
+    print("  Normalized minimum weighted score:", analysis.min_normalized_score)
+
+    print("\nMaximum Scores:")
+    print("  Maximum weighted score:", analysis.max_weighted_score)
+    print("  Maximum raw score (without importance weighting):", analysis.max_raw_score)
+    print("  Normalized maximum weighed score:", analysis.max_normalized_score)
+
+    # Display thresholds if available
+    if analysis.thresholds:
+        print(f"\nThresholds ({len(analysis.thresholds)}):")
+        for i, threshold in enumerate(analysis.thresholds, 1):
+            print(f"  Threshold {i}, Header:", threshold.header)
+            print("\tLower bound (inclusive):", threshold.lower)
+            print("\tUpper bound (exclusive):", threshold.upper)
+            print("\tColor:", threshold.color)
+
+    print(f"\nScore Distribution ({weighting}):")
+    if not analysis.distribution_is_exact:
+        print(f"  Approximated on a grid with weighted score step {analysis.distribution_step:.4g}")
+    if analysis.thresholds:
+        print("  Share of answer combinations per threshold:")
+        for threshold in analysis.thresholds:
+            print(f"\t{threshold.header}: {threshold.share:.2%}")
+        if analysis.outside_thresholds_share:
+            print(f"\tOutside all thresholds: {analysis.outside_thresholds_share:.2%}")
+    print("  Percentiles of normalized weighted score:")
+    for percentile, score in analysis.percentiles.items():
+        print(f"\t{percentile.removeprefix('p')}th: {score:.3f}")
+
+    issues = analysis.issues
+    print(f"\nChecks: {'no issues' if not issues else f'{len(issues)} issue(s)'}")
+    for issue in issues:
+        print(f"  - {issue}")
+
+    print("=" * 80)
+
+
+def print_unused_questions(unused: list[str]) -> None:
+    """Print the questions that none of the configurations use as text."""
+    print(f"\nQuestions not used by any of the scoring configurations: {len(unused) if unused else 'none'}")
+    if unused:
+        print(f"  {', '.join(unused)}")
+    print("=" * 80)
 
 
 def main():
@@ -29,68 +432,75 @@ def main():
     parser.add_argument(
         "--questions",
         type=Path,
+        default=QUESTIONS_PATH,
         help="Path to questions.json (default: data/questions.json)",
     )
     parser.add_argument(
         "--scoring_configs",
         type=Path,
         nargs="+",
-        help="One or more scoring configuration JSON files to analyze",
+        default=sorted(DATA_DIR.glob(SCORING_COLLECTIONS_GLOB)),
+        help="One or more scoring configuration JSON files to analyze (default: data/*_scoring_questions.json)",
+    )
+    parser.add_argument(
+        "--answer_frequencies",
+        type=Path,
+        help="JSON file of observed answer counts by question id and option text (default: all answers equally likely)",
+    )
+    parser.add_argument(
+        "--range_steps",
+        type=int,
+        default=DEFAULT_RANGE_STEPS,
+        help=f"Number of values range questions are discretized into (default: {DEFAULT_RANGE_STEPS})",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Number of worker processes (default: one per CPU, at most one per configuration)"
+    )
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="text", help="Report format (default: text)")
+    parser.add_argument("--output", type=Path, help="Where to write the report (default: stdout)")
+    parser.add_argument(
+        "--fail_on_issues",
+        action="store_true",
+        help="Exit with status 1 if a configuration can't be analyzed or any check finds an issue",
     )
 
     args = parser.parse_args()
 
     questions_path = args.questions
     scoring_configs = args.scoring_configs
+    answer_frequencies = json.loads(args.answer_frequencies.read_text()) if args.answer_frequencies else None
+    # Progress goes to stderr when the report itself is structured
+    log = sys.stdout if args.format == "text" and args.output is None else sys.stderr
 
-    # Load all questions using Pydantic
-    print(f"Loading questions from: {questions_path}")
+    # Load and validate all questions once, the workers receive the validated questions
+    print(f"Loading questions from: {questions_path}", file=log)
     question_bank = QuestionBank.model_validate_json(questions_path.read_text())
     question_lookup = {q.question_id: q for q in question_bank.questions}
-    print(f"Loaded {len(question_lookup)} questions\n")
+    print(f"Loaded {len(question_lookup)} questions\n", file=log)
 
-    print(f"Analyzing {len(scoring_configs)} scoring configuration(s)\n")
-    print("=" * 80)
-
-    # Analyze each scoring config
-    for config_path in scoring_configs:
-        print(f"\nScoring Config: {config_path.name}")
-        print("-" * 80)
-
-        question_collection = QuestionScoringCollection.model_validate_json(config_path.read_text())
-
-        # Display header if available
-        if question_collection.header:
-            print("Header:", question_collection.header)
-
-        print(f"Number of questions: {len(question_collection.question_ids)}")
+    print(f"Analyzing {len(scoring_configs)} scoring configuration(s)\n", file=log)
+    analyses = analyze_configs(scoring_configs, question_lookup, answer_frequencies, args.range_steps, args.workers)
+    unused = unused_question_ids(question_lookup, analyses)
 
-        # Calculate min and max scores
-        min_raw_score, min_weighted_score = question_collection.get_extreme_score(question_lookup, is_min=True)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            write_json(analyses, questions_path, question_lookup, output)
+        elif args.format == "csv":
+            write_csv(analyses, questions_path, question_lookup, output)
+        else:
+            weighting = "observed answer frequencies" if answer_frequencies else "equally likely answers"
+            with redirect_stdout(output):
+                print("=" * 80)
+                for analysis in analyses:
+                    print_analysis(analysis, weighting)
+                print_unused_questions(unused)
+    finally:
+        if args.output:
+            output.close()
 
-        max_raw_score, max_weighted_score = question_collection.get_extreme_score(question_lookup)
-
-        print("\nMinimum Scores:")
-        print("  Minimum weighted score:", min_weighted_score)
-        print("  Minimum raw score (without importance weighting):", min_raw_score)
-        print("  Normalized minimum weighted score:", min_weighted_score / abs(min_weighted_score))
-
-        print("\nMaximum Scores:")
-        print("  Maximum weighted score:", max_weighted_score)
-        print("  Maximum raw score (without importance weighting):", max_raw_score)
-        print("  Normalized maximum weighed score:", max_weighted_score / abs(max_weighted_score))
-
-        # Display thresholds if available
-        if question_collection.thresholds:
-            increasing_order_thresholds = sorted(question_collection.thresholds, key=lambda x: x.lower)
-            print(f"\nThresholds ({len(question_collection.thresholds)}):")
-            for i, threshold in enumerate(increasing_order_thresholds, 1):
-                print(f"  Threshold {i}, Header:", threshold.header)
-                print("\tLower bound (inclusive):", threshold.lower)
-                print("\tUpper bound (exclusive):", threshold.upper)
-                print("\tColor:", threshold.color)
-
-        print("=" * 80)
+    if args.fail_on_issues and (unused or any(analysis.issues for analysis in analyses)):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
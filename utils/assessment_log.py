@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Append-only log of completed assessments in a fixed-width columnar layout, with memory-mapped analytics.
+
+Each completed assessment is one fixed-width row: the completion time, one column per question with the
+answer (option index for categorical questions, value for range questions) and, for every scoring collection,
+the weighted, normalized and raw scores and the index of the matching threshold. The column layout is
+described by a schema stored next to the rows, and every schema (e.g. after the question bank changed) gets
+its own log file, so rows never need to be rewritten.
+
+Appends take an exclusive file lock and write whole rows with O_APPEND, so several Streamlit processes can
+append to the same log. The analytics read the rows through a NumPy memory map in chunks, so statistics over
+millions of assessments never turn rows into Python objects.
+
+Usage:
+    python -m utils.assessment_log
+    python -m utils.assessment_log --log_dir data/assessments --answer_frequencies_output frequencies.json
+
+Options:
+    --log_dir PATH: Directory of the assessment logs (default: data/assessments)
+    --bins N: Number of normalized score histogram bins between -1 and 1 (default: 20)
+    --answer_frequencies_output PATH: Write the answer counts as JSON in the format accepted by
+        `python -m utils.analyze_scoring --answer_frequencies`
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections.abc import Iterator, Sequence
+from dataclasses import asdict, dataclass
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+
+from utils.batch_score import classify_scores
+from utils.config import ASSESSMENT_LOG_DIR
+from utils.models import QuestionScoringCollection, ScoreResult
+from utils.response_store import UNANSWERED, QuestionIndex, ResponseStore
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, appends of whole rows with O_APPEND are still not interleaved there in practice
+    fcntl = None
+
+LOG_FORMAT_VERSION = 1
+# Rows processed at a time by the analytics, bounding memory use for any log size
+CHUNK_ROWS = 1_000_000
+DEFAULT_BINS = 20
+
+
+@dataclass(frozen=True)
+class LogSchema:
+    """Column layout of an assessment log"""
+
+    question_ids: tuple[str, ...]
+    """Question ids in question bank order, one column each"""
+    option_texts: tuple[tuple[str, ...] | None, ...]
+    """Answer option texts of each categorical question, None for range questions"""
+    collection_names: tuple[str, ...]
+    """Scoring collection names, four columns each"""
+    threshold_headers: tuple[tuple[str, ...], ...]
+    """Threshold headers of each collection in threshold order, the bucket columns index into them"""
+    format_version: int = LOG_FORMAT_VERSION
+    """Version of the row layout"""
+
+    @classmethod
+    def build(
+        cls,
+        question_index: QuestionIndex,
+        collection_names: Sequence[str],
+        collections: Sequence[QuestionScoringCollection],
+    ) -> "LogSchema":
+        """Schema for logging responses to a question bank together with scores of the given collections."""
+        return cls(
+            question_ids=question_index.question_ids,
+            option_texts=tuple(
+                None if value_range is not None else texts
+                for texts, value_range in zip(question_index.option_texts, question_index.ranges)
+            ),
+            collection_names=tuple(collection_names),
+            threshold_headers=tuple(tuple(t.header for t in collection.thresholds or []) for collection in collections),
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> "LogSchema":
+        data = json.loads(text)
+        return cls(
+            question_ids=tuple(data["question_ids"]),
+            option_texts=tuple(None if texts is None else tuple(texts) for texts in data["option_texts"]),
+            collection_names=tuple(data["collection_names"]),
+            threshold_headers=tuple(tuple(headers) for headers in data["threshold_headers"]),
+            format_version=data["format_version"],
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=2)
+
+    @cached_property
+    def digest(self) -> str:
+        """Short hash of the schema, naming its log file"""
+        return hashlib.sha256(self.to_json().encode()).hexdigest()[:16]
+
+    @cached_property
+    def dtype(self) -> np.dtype:
+        """Packed little-endian row layout"""
+        fields = [("completed_at", "<f8")]
+        for qid, texts in zip(self.question_ids, self.option_texts):
+            # Categorical answers are option indices with -1 for unanswered, range answers are values with NaN
+            fields.append((f"question:{qid}", "<i2" if texts is not None else "<f4"))
+        for name in self.collection_names:
+            fields.extend(
+                [
+                    (f"{name}:weighted_score", "<f8"),
+                    (f"{name}:normalized_weighted_score", "<f8"),
+                    (f"{name}:raw_response_score", "<f8"),
+                    (f"{name}:bucket", "<i2"),
+                ]
+            )
+        return np.dtype(fields)
+
+
+class AssessmentLog:
+    """One append-only assessment log file and its schema"""
+
+    def __init__(self, log_dir: Path, schema: LogSchema):
+        """
+        Args:
+            log_dir: directory of the assessment logs
+            schema: column layout of the log
+        """
+        self.schema = schema
+        self.path = log_dir / f"assessments-{schema.digest}.bin"
+        """Rows of the log"""
+        self.schema_path = log_dir / f"assessments-{schema.digest}.json"
+        """Schema of the log"""
+
+    @classmethod
+    def open_all(cls, log_dir: Path) -> list["AssessmentLog"]:
+        """All logs in a directory, oldest schema first."""
+        schema_paths = sorted(log_dir.glob("assessments-*.json"), key=lambda path: path.stat().st_mtime)
+        return [cls(log_dir, LogSchema.from_json(path.read_text())) for path in schema_paths]
+
+    def build_row(
+        self,
+        responses: ResponseStore,
+        collections: Sequence[QuestionScoringCollection],
+        scores: Sequence[ScoreResult],
+        completed_at: float | None = None,
+    ) -> np.ndarray:
+        """Build the row of a completed assessment.
+
+        Args:
+            responses: the session's responses, from the question bank the schema was built for
+            collections: the scoring collections in schema order
+            scores: the score of each collection
+            completed_at: completion time as a Unix timestamp (default: now)
+
+        Returns:
+            np.ndarray: a structured array of one row
+        """
+        row = np.zeros(1, dtype=self.schema.dtype)
+        row["completed_at"] = time.time() if completed_at is None else completed_at
+        option_indices = responses.option_indices
+        range_values = responses.range_values
+        for position, (qid, texts) in enumerate(zip(self.schema.question_ids, self.schema.option_texts)):
+            option = option_indices[position]
+            if texts is not None:
+                row[f"question:{qid}"] = option
+            else:
+                row[f"question:{qid}"] = np.nan if option == UNANSWERED else range_values[position]
+        for name, collection, score in zip(self.schema.collection_names, collections, scores):
+            row[f"{name}:weighted_score"] = score.weighted_score
+            row[f"{name}:normalized_weighted_score"] = score.normalized_weighted_score
+            row[f"{name}:raw_response_score"] = score.raw_response_score
+            row[f"{name}:bucket"] = classify_scores(collection, score.normalized_weighted_score)
+        return row
+
+    def response_sets(self, rows: np.ndarray) -> list[dict[str, str | float]]:
+        """Answers of log rows by question id, the inverse of the question columns of `build_row`.
+
+        Args:
+            rows: structured array of log rows
+
+        Returns:
+            list[dict[str, str | float]]: option text or range value of each answered question, one dict per row
+        """
+        response_sets: list[dict[str, str | float]] = [{} for _ in range(len(rows))]
+        for qid, texts in zip(self.schema.question_ids, self.schema.option_texts):
+            for response_set, answer in zip(response_sets, rows[f"question:{qid}"].tolist()):
+                # NaN never equals itself
+                if texts is None and answer == answer:
+                    response_set[qid] = answer
+                elif texts is not None and answer != UNANSWERED:
+                    response_set[qid] = texts[answer]
+        return response_sets
+
+    def append(self, rows: np.ndarray) -> None:
+        """Append rows to the log, safe to call from several processes at once.
+
+        Args:
+            rows: structured array with the schema's dtype
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.schema_path.exists():
+            tmp_path = self.schema_path.with_name(f"{self.schema_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(self.schema.to_json())
+            os.replace(tmp_path, self.schema_path)
+
+        data = np.ascontiguousarray(rows, dtype=self.schema.dtype).tobytes()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            # A writer that died mid-row leaves a partial row, drop it so the following rows stay aligned
+            partial = os.fstat(fd).st_size % self.schema.dtype.itemsize
+            if partial:
+                os.ftruncate(fd, os.fstat(fd).st_size - partial)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+        finally:
+            # Closing the file releases the lock
+            os.close(fd)
+
+    def rows(self) -> np.ndarray:
+        """Memory map of all complete rows, read-only. Empty if nothing was logged yet."""
+        if not self.path.exists():
+            return np.zeros(0, dtype=self.schema.dtype)
+        n_rows = self.path.stat().st_size // self.schema.dtype.itemsize
+        if n_rows == 0:
+            return np.zeros(0, dtype=self.schema.dtype)
+        return np.memmap(self.path, dtype=self.schema.dtype, mode="r", shape=(n_rows,))
+
+    def chunks(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+        """The rows in chunks of at most `chunk_rows`, only one chunk's pages are touched at a time."""
+        rows = self.rows()
+        for start in range(0, len(rows), chunk_rows):
+            yield rows[start : start + chunk_rows]
+
+
+@dataclass
+class LogSummary:
+    """Aggregate statistics of an assessment log"""
+
+    n_assessments: int
+    """Number of logged assessments"""
+    answer_counts: dict[str, dict[str, int]]
+    """Number of times each option was chosen, by question id and option text, for categorical questions"""
+    unanswered_counts: dict[str, int]
+    """Number of assessments that left each question unanswered"""
+    score_histograms: dict[str, list[int]]
+    """Counts of normalized weighted scores per collection in equal bins between -1 and 1, scores outside
+    the range are counted in the first or last bin"""
+    bucket_counts: dict[str, dict[str, int]]
+    """Number of assessments per threshold header of each collection, "Outside all thresholds" if none matched"""
+
+
+def summarize(log: AssessmentLog, bins: int = DEFAULT_BINS, chunk_rows: int = CHUNK_ROWS) -> LogSummary:
+    """Compute answer frequencies, score histograms and threshold shares of a log, one chunk at a time.
+
+    Args:
+        log: the assessment log
+        bins: number of histogram bins between -1 and 1
+        chunk_rows: number of rows processed at a time
+
+    Returns:
+        LogSummary: the aggregate statistics
+    """
+    schema = log.schema
+    categorical = [(qid, texts) for qid, texts in zip(schema.question_ids, schema.option_texts) if texts is not None]
+    # Option index + 1, so unanswered (-1) is counted at index 0
+    option_counts = {qid: np.zeros(len(texts) + 1, dtype=np.int64) for qid, texts in categorical}
+    range_unanswered = {qid: 0 for qid, texts in zip(schema.question_ids, schema.option_texts) if texts is None}
+    histograms = {name: np.zeros(bins, dtype=np.int64) for name in schema.collection_names}
+    buckets = {
+        name: np.zeros(len(headers) + 1, dtype=np.int64)
+        for name, headers in zip(schema.collection_names, schema.threshold_headers)
+    }
+    bin_edges = np.linspace(-1.0, 1.0, bins + 1)
+
+    n_assessments = 0
+    for chunk in log.chunks(chunk_rows):
+        n_assessments += len(chunk)
+        for qid, texts in categorical:
+            option_counts[qid] += np.bincount(chunk[f"question:{qid}"] + 1, minlength=len(texts) + 1)[: len(texts) + 1]
+        for qid in range_unanswered:
+            range_unanswered[qid] += int(np.isnan(chunk[f"question:{qid}"]).sum())
+        for name in schema.collection_names:
+            scores = chunk[f"{name}:normalized_weighted_score"]
+            scores = np.clip(scores[~np.isnan(scores)], -1.0, 1.0)
+            histograms[name] += np.histogram(scores, bins=bin_edges)[0]
+            # Bucket + 1, so out of range (-1) is counted at index 0
+            buckets[name] += np.bincount(chunk[f"{name}:bucket"] + 1, minlength=len(buckets[name]))[: len(buckets[name])]
+
+    return LogSummary(
+        n_assessments=n_assessments,
+        answer_counts={
+            qid: {text: int(count) for text, count in zip(texts, option_counts[qid][1:])} for qid, texts in categorical
+        },
+        unanswered_counts={
+            **{qid: int(option_counts[qid][0]) for qid, _ in categorical},
+            **range_unanswered,
+        },
+        score_histograms={name: histogram.tolist() for name, histogram in histograms.items()},
+        bucket_counts={
+            name: {
+                "Outside all thresholds": int(buckets[name][0]),
+                **{header: int(count) for header, count in zip(headers, buckets[name][1:])},
+            }
+            for name, headers in zip(schema.collection_names, schema.threshold_headers)
+        },
+    )
+
+
+def main():
+    """Main function to report statistics of the logged assessments."""
+    parser = argparse.ArgumentParser(description="Aggregate statistics of the completed assessments")
+    parser.add_argument(
+        "--log_dir",
+        type=Path,
+        default=ASSESSMENT_LOG_DIR,
+        help="Directory of the assessment logs (default: data/assessments)",
+    )
+    parser.add_argument(
+        "--bins",
+        type=int,
+        default=DEFAULT_BINS,
+        help=f"Number of normalized score histogram bins between -1 and 1 (default: {DEFAULT_BINS})",
+    )
+    parser.add_argument(
+        "--answer_frequencies_output",
+        type=Path,
+        help="Write the answer counts of the most recent log as JSON for analyze_scoring --answer_frequencies",
+    )
+
+    args = parser.parse_args()
+
+    logs = AssessmentLog.open_all(args.log_dir)
+    if not logs:
+        print(f"No assessment logs found in {args.log_dir}")
+        return
+
+    summary = None
+    for log in logs:
+        start = time.perf_counter()
+        summary = summarize(log, bins=args.bins)
+        elapsed = time.perf_counter() - start
+        print(f"\n{log.path.name}: {summary.n_assessments} assessments, summarized in {elapsed:.2f}s")
+        if not summary.n_assessments:
+            continue
+
+        for name in log.schema.collection_names:
+            print(f"\n  {name}")
+            for header, count in summary.bucket_counts[name].items():
+                if count or header != "Outside all thresholds":
+                    print(f"\t{header}: {count / summary.n_assessments:.1%}")
+            histogram = summary.score_histograms[name]
+            peak = max(histogram) or 1
+            edges = np.linspace(-1.0, 1.0, args.bins + 1)
+            for low, count in zip(edges, histogram):
+                print(f"\t{low:+.2f} {'#' * round(40 * count / peak)} {count}")
+
+        print("\n  Answer frequencies")
+        for qid, counts in summary.answer_counts.items():
+            answered = sum(counts.values())
+            shares = ", ".join(f"{text}: {count / answered:.0%}" for text, count in counts.items()) if answered else ""
+            print(f"\t{qid} ({summary.unanswered_counts[qid]} unanswered) {shares}")
+
+    if args.answer_frequencies_output and summary is not None:
+        args.answer_frequencies_output.write_text(json.dumps(summary.answer_counts, indent=2))
+        print(f"\nAnswer frequencies written to {args.answer_frequencies_output}")
+
+
+if __name__ == "__main__":
+    main()
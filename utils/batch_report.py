@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Render static HTML result reports for many stored assessments at once.
+
+Each report shows what the Results page shows for one set of answers: the threshold of every scoring category
+with its description, the score bar and the answers that contributed to a higher, lower or neutral score. Reports
+are written to one directory together with an index of all of them, and only need a browser to be viewed.
+
+Everything that is the same for all reports is written once to an assets directory and referenced by the reports:
+the Plotly bundle, the stylesheet and the threshold background of each category's score bar, so a report only
+contains its own scores, tables and score markers. Reports are rendered in parallel by a pool of worker
+processes that each load the question bank and scoring categories once.
+
+Usage:
+    python -m utils.batch_report --output_dir reports
+    python -m utils.batch_report --input responses.csv --output_dir reports --workers 8
+
+Options:
+    --input PATH: CSV file with a header row of question ids, or JSONL file with one {question_id: answer} object
+        per line, as for `python -m utils.batch_score` (default: all logged assessments in data/assessments)
+    --output_dir PATH: Directory the reports, the index and the assets are written to
+    --questions PATH: Path to questions.json (default: data/questions.json)
+    --scoring_configs PATHS: Scoring configuration JSON files (default: the categories of the Results page)
+    --id_column NAME: Input column naming each report (default: id, row numbers if missing)
+    --log_dir PATH: Directory of the assessment logs used without --input (default: data/assessments)
+    --workers N: Number of worker processes (default: one per CPU)
+    --chunk_size N: Reports rendered per task sent to a worker (default: 64)
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import time
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from utils.assessment_log import AssessmentLog
+from utils.batch_score import load_scoring_configs, read_chunks
+from utils.config import (
+    AMBITION_SCORING_PATH,
+    ASSESSMENT_LOG_DIR,
+    LEGAL_SCORING_PATH,
+    ORGANIZATION_SCORING_PATH,
+    QUESTIONS_PATH,
+    TECHNICAL_SCORING_PATH,
+)
+from utils.models import Question, QuestionScoringCollection
+from utils.question_renderer import build_contributions_table
+from utils.response_store import QuestionIndex, ResponseStore
+from utils.visualization import BADGE_COLOR_MAP, get_base_figure_json, score_marker, thresholds_key
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# The categories of the Results page, in its order
+DEFAULT_SCORING_CONFIGS = [ORGANIZATION_SCORING_PATH, LEGAL_SCORING_PATH, TECHNICAL_SCORING_PATH, AMBITION_SCORING_PATH]
+DEFAULT_CHUNK_SIZE = 64
+ASSETS_DIR = "assets"
+PLOTLY_ASSET = "plotly.min.js"
+SCORE_BARS_ASSET = "score_bars.js"
+STYLESHEET_ASSET = "report.css"
+
+STYLESHEET = """
+body { font-family: "Source Sans Pro", sans-serif; max-width: 60rem; margin: 2rem auto; padding: 0 1rem; color: #31333F; }
+.badge { display: block; padding: 0.4rem 0.8rem; border-radius: 0.5rem; color: white; font-weight: 600; }
+.score-bar { width: 100%; height: 150px; }
+table { border-collapse: collapse; width: 100%; margin-bottom: 1rem; font-size: 0.9rem; }
+th, td { border: 1px solid #e6e9ef; padding: 0.3rem 0.5rem; text-align: left; vertical-align: top; }
+th { background: #f0f2f6; }
+.error { color: #FF4B4B; }
+"""
+# Draws a score bar from the shared threshold background of its category and the report's score marker
+SCORE_BARS_SCRIPT = """
+function drawScoreBar(elementId, thresholdsKey, marker) {
+  const base = SCORE_BAR_BACKGROUNDS[thresholdsKey];
+  Plotly.newPlot(elementId, base.data.concat([marker]), base.layout, {displayModeBar: false, responsive: true});
+}
+"""
+CONTRIBUTION_TABLE_LABELS = {
+    "positive": "Responses contributing to a higher score",
+    "negative": "Responses contributing to a lower score",
+    "neutral": "Neutral responses",
+}
+
+
+@dataclass
+class ReportSummary:
+    """What the index shows about one rendered report"""
+
+    report_id: str
+    file_name: str | None = None
+    """Name of the report file, None if it couldn't be rendered"""
+    thresholds: list[str | None] = field(default_factory=list)
+    """Header of the matching threshold of each category, None if the score is outside all thresholds"""
+    error: str | None = None
+    """Why the report couldn't be rendered"""
+
+
+def write_assets(output_dir: Path, collections: Mapping[str, QuestionScoringCollection]) -> None:
+    """Write the assets shared by all reports: the Plotly bundle, the stylesheet and the score bar backgrounds."""
+    from plotly.offline import get_plotlyjs
+
+    assets_dir = output_dir / ASSETS_DIR
+    assets_dir.mkdir(parents=True, exist_ok=True)
+    (assets_dir / PLOTLY_ASSET).write_text(get_plotlyjs(), encoding="utf-8")
+    (assets_dir / STYLESHEET_ASSET).write_text(STYLESHEET, encoding="utf-8")
+    backgrounds = {
+        thresholds_key(collection.thresholds): json.loads(get_base_figure_json(collection.thresholds))
+        for collection in collections.values()
+        if collection.thresholds
+    }
+    (assets_dir / SCORE_BARS_ASSET).write_text(
+        f"const SCORE_BAR_BACKGROUNDS = {json.dumps(backgrounds)};\n{SCORE_BARS_SCRIPT}", encoding="utf-8"
+    )
+
+
+def report_file_name(report_id: str) -> str:
+    """File name of a report: its id with characters that aren't safe in file names replaced"""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", report_id) + ".html"
+
+
+def table_html(table: "pd.DataFrame") -> str:
+    """HTML table of a DataFrame, written directly as it is several times faster than `DataFrame.to_html`"""
+    header = "".join(f"<th>{html.escape(str(column))}</th>" for column in table.columns)
+    rows = "".join(
+        "<tr>" + "".join(f"<td>{'' if value is None else html.escape(str(value))}</td>" for value in row) + "</tr>"
+        for row in zip(*(table[column].tolist() for column in table.columns))
+    )
+    return f"<table><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>"
+
+
+def render_report(
+    report_id: str,
+    responses: ResponseStore,
+    question_lookup: Mapping[str, Question],
+    collections: Mapping[str, QuestionScoringCollection],
+) -> tuple[str, list[str | None]]:
+    """Render the report of one set of answers, like the Results page.
+
+    Args:
+        report_id: name of the report, shown as its title
+        responses: the validated answers
+        question_lookup: dictionary for looking up questions by question id
+        collections: scoring categories by name, in display order
+
+    Returns:
+        tuple[str, list[str | None]]: the report HTML, and the header of the matching threshold of each category
+    """
+    import plotly.io as pio
+
+    sections = []
+    scripts = []
+    threshold_headers = []
+    for c, collection in enumerate(collections.values()):
+        score = collection.calculate_score(question_lookup, responses)
+        section = [f"<h2>{html.escape(collection.header or '')}</h2>"]
+
+        score_bucket = collection.get_score_response(score.normalized_weighted_score)
+        threshold_headers.append(score_bucket.header if score_bucket else None)
+        if score_bucket:
+            color = BADGE_COLOR_MAP.get(score_bucket.color, score_bucket.color)
+            section.append(f'<div class="badge" style="background: {html.escape(color)}">{html.escape(score_bucket.header)}</div>')
+            section.append(f"<p>{html.escape(score_bucket.description)}</p>")
+        else:
+            section.append(f'<p class="error">Score {score.normalized_weighted_score:.2f} is out of bounds.</p>')
+
+        if collection.thresholds:
+            marker = pio.to_json(score_marker(score.normalized_weighted_score), validate=False)
+            section.append(f'<div class="score-bar" id="score-bar-{c}"></div>')
+            scripts.append(f'drawScoreBar("score-bar-{c}", "{thresholds_key(collection.thresholds)}", {marker});')
+
+        section.append("<details><summary>Detailed scoring breakdown</summary>")
+        for group, label in CONTRIBUTION_TABLE_LABELS.items():
+            entries = getattr(score.breakdown, group)
+            if entries:
+                section.append(f"<h4>{label}</h4>")
+                section.append(table_html(build_contributions_table(entries, question_lookup, responses)))
+        section.append("</details>")
+        sections.append("\n".join(section))
+
+    title = html.escape(f"Assessment Results: {report_id}")
+    body = "\n".join(sections)
+    report = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="stylesheet" href="{ASSETS_DIR}/{STYLESHEET_ASSET}">
+<script src="{ASSETS_DIR}/{PLOTLY_ASSET}"></script>
+<script src="{ASSETS_DIR}/{SCORE_BARS_ASSET}"></script>
+</head>
+<body>
+<h1>{title}</h1>
+<p>Summary of your assessment and recommendations for your AI/ML project.</p>
+{body}
+<script>
+{chr(10).join(scripts)}
+</script>
+</body>
+</html>
+"""
+    return report, threshold_headers
+
+
+# Questions and categories of a worker process, set once per worker by `_init_worker`
+_worker_context: tuple[Mapping[str, Question], QuestionIndex, Mapping[str, QuestionScoringCollection], Path] | None = None
+
+
+def _init_worker(
+    question_lookup: Mapping[str, Question], collections: Mapping[str, QuestionScoringCollection], output_dir: Path
+) -> None:
+    global _worker_context
+    _worker_context = (question_lookup, QuestionIndex(question_lookup), collections, output_dir)
+
+
+def _render_chunk(chunk: list[tuple[str, Mapping[str, str | float | None]]]) -> list[ReportSummary]:
+    question_lookup, question_index, collections, output_dir = _worker_context
+    summaries = []
+    for report_id, answers in chunk:
+        summary = ReportSummary(report_id)
+        try:
+            # Answers are validated like widget values; empty CSV cells and unknown columns are not answers
+            responses = ResponseStore(
+                question_index,
+                {qid: answer for qid, answer in answers.items() if qid in question_lookup and answer not in (None, "")},
+            )
+            report, summary.thresholds = render_report(report_id, responses, question_lookup, collections)
+        except ValueError as e:
+            summary.error = str(e)
+        else:
+            summary.file_name = report_file_name(report_id)
+            (output_dir / summary.file_name).write_text(report, encoding="utf-8")
+        summaries.append(summary)
+    return summaries
+
+
+def write_index(output_dir: Path, collections: Mapping[str, QuestionScoringCollection], summaries: list[ReportSummary]) -> None:
+    """Write an index page linking every report, with its thresholds and any rendering errors."""
+    headers = "".join(f"<th>{html.escape(c.header or name)}</th>" for name, c in collections.items())
+    rows = []
+    for summary in summaries:
+        if summary.file_name is None:
+            cells = f'<td colspan="{len(collections)}" class="error">{html.escape(summary.error or "")}</td>'
+            link = html.escape(summary.report_id)
+        else:
+            cells = "".join(f"<td>{html.escape(header or 'Out of bounds')}</td>" for header in summary.thresholds)
+            link = f'<a href="{html.escape(summary.file_name)}">{html.escape(summary.report_id)}</a>'
+        rows.append(f"<tr><td>{link}</td>{cells}</tr>")
+    (output_dir / "index.html").write_text(
+        f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>Assessment Reports</title>
+<link rel="stylesheet" href="{ASSETS_DIR}/{STYLESHEET_ASSET}"></head>
+<body>
+<h1>Assessment Reports ({len(summaries)})</h1>
+<table><thead><tr><th>Report</th>{headers}</tr></thead><tbody>
+{chr(10).join(rows)}
+</tbody></table>
+</body>
+</html>
+""",
+        encoding="utf-8",
+    )
+
+
+def stored_assessments(
+    input_path: Path | None, id_column: str, log_dir: Path
+) -> Iterator[tuple[str, Mapping[str, str | float | None]]]:
+    """Stream (report id, answers) pairs from an input file, or from all assessment logs without one.
+
+    Reports from an input file are named by their id column, or their row number if it is missing or empty.
+    Reports from the logs are named by the log's schema digest and the row number.
+    """
+    if input_path is not None:
+        row_number = 0
+        for chunk in read_chunks(input_path, DEFAULT_CHUNK_SIZE):
+            for answers in chunk:
+                row_number += 1
+                yield str(answers.get(id_column) or f"row-{row_number:06d}"), answers
+        return
+    for log in AssessmentLog.open_all(log_dir):
+        row_number = 0
+        for rows in log.chunks():
+            for answers in log.response_sets(rows):
+                row_number += 1
+                yield f"assessment-{log.schema.digest[:8]}-{row_number:06d}", answers
+
+
+def _unique_ids(
+    assessments: Iterator[tuple[str, Mapping[str, str | float | None]]],
+) -> Iterator[tuple[str, Mapping[str, str | float | None]]]:
+    """Suffix report ids until their file name is unused, so no report overwrites another one or the index.
+    Ids that only differ in characters replaced in file names, or in case, would share a file otherwise."""
+    # Lowercase file names, as they are the same file on case-insensitive file systems
+    used_file_names = {"index.html"}
+    next_suffix: dict[str, int] = {}
+    for report_id, answers in assessments:
+        unique_id = report_id
+        suffix = next_suffix.get(report_id, 2)
+        while report_file_name(unique_id).lower() in used_file_names:
+            unique_id = f"{report_id}-{suffix}"
+            suffix += 1
+        next_suffix[report_id] = suffix
+        used_file_names.add(report_file_name(unique_id).lower())
+        yield unique_id, answers
+
+
+def _chunks(items: Iterator, size: int) -> Iterator[list]:
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def render_reports(
+    assessments: Iterator[tuple[str, Mapping[str, str | float | None]]],
+    question_lookup: Mapping[str, Question],
+    collections: Mapping[str, QuestionScoringCollection],
+    output_dir: Path,
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> list[ReportSummary]:
+    """Render the reports of many assessments in parallel, with their shared assets and an index.
+
+    Args:
+        assessments: (report id, answers by question id) pairs
+        question_lookup: validated questions by question id, sent to each worker process once
+        collections: scoring categories by name, in display order
+        output_dir: directory the reports, the index and the assets are written to
+        workers: number of worker processes (default: one per CPU). With one worker, reports are rendered in
+            this process.
+        chunk_size: number of reports rendered per task sent to a worker
+
+    Returns:
+        list[ReportSummary]: what was rendered for each assessment, in input order
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_assets(output_dir, collections)
+    chunks = _chunks(_unique_ids(iter(assessments)), chunk_size)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        _init_worker(question_lookup, collections, output_dir)
+        summaries = [summary for chunk in chunks for summary in _render_chunk(chunk)]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(dict(question_lookup), collections, output_dir),
+        ) as executor:
+            summaries = [summary for chunk in executor.map(_render_chunk, chunks) for summary in chunk]
+    write_index(output_dir, collections, summaries)
+    return summaries
+
+
+def main():
+    """Main function to render static reports of stored assessments."""
+    parser = argparse.ArgumentParser(description="Render static HTML result reports for stored assessments")
+    parser.add_argument(
+        "--input",
+        type=Path,
+        help="CSV or JSONL file of answers by question id (default: all logged assessments)",
+    )
+    parser.add_argument("--output_dir", type=Path, required=True, help="Directory the reports are written to")
+    parser.add_argument(
+        "--questions",
+        type=Path,
+        default=QUESTIONS_PATH,
+        help="Path to questions.json (default: data/questions.json)",
+    )
+    parser.add_argument(
+        "--scoring_configs",
+        type=Path,
+        nargs="+",
+        default=DEFAULT_SCORING_CONFIGS,
+        help="Scoring configuration JSON files (default: the categories of the Results page)",
+    )
+    parser.add_argument(
+        "--id_column", default="id", help="Input column naming each report (default: id, row numbers if missing)"
+    )
+    parser.add_argument(
+        "--log_dir",
+        type=Path,
+        default=ASSESSMENT_LOG_DIR,
+        help="Directory of the assessment logs used without --input (default: data/assessments)",
+    )
+    parser.add_argument("--workers", type=int, help="Number of worker processes (default: one per CPU)")
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"Reports rendered per task sent to a worker (default: {DEFAULT_CHUNK_SIZE})",
+    )
+
+    args = parser.parse_args()
+
+    question_lookup, collections = load_scoring_configs(args.questions, args.scoring_configs)
+    for name, collection in collections.items():
+        missing = [qid for qid in collection.question_ids if qid not in question_lookup]
+        if missing:
+            raise ValueError(f"Question IDs {missing} from collection '{name}' not found in question bank")
+
+    start = time.perf_counter()
+    summaries = render_reports(
+        stored_assessments(args.input, args.id_column, args.log_dir),
+        question_lookup,
+        collections,
+        args.output_dir,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+    elapsed = time.perf_counter() - start
+
+    failed = [summary for summary in summaries if summary.error]
+    rendered = len(summaries) - len(failed)
+    print(
+        f"Rendered {rendered} reports to {args.output_dir} in {elapsed:.2f}s "
+        f"({rendered / elapsed * 60:.0f} reports/minute)"
+    )
+    for summary in failed:
+        print(f"Could not render {summary.report_id}: {summary.error}")
+
+
+if __name__ == "__main__":
+    main()
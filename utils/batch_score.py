@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Score many response sets at once with NumPy.
+
+Responses are given as a matrix with one row per submission and one column per question id.
+Answers are mapped to scores through per-question option tables, then every scoring collection
+is scored with a handful of array operations instead of calling calculate_score once per submission.
+
+Usage:
+    python -m utils.batch_score --input responses.csv --output scores.csv
+    python -m utils.batch_score --input responses.jsonl --output scores.jsonl --contributions
+
+Arguments:
+    --input PATH: CSV file with a header row of question ids, or JSONL file with one
+        {question_id: answer} object per line
+
+Options:
+    --output PATH: Where to write the scores as CSV or JSONL (default: CSV on stdout)
+    --questions PATH: Path to questions.json (default: data/questions.json)
+    --scoring_configs PATHS: Scoring configuration JSON files (default: data/*_scoring_questions.json)
+    --id_column NAME: Input column copied to the output to identify submissions (default: id)
+    --chunk_size N: Number of submissions read and scored at a time (default: 10000)
+    --contributions: Also write the per-question contribution to each collection's score
+"""
+
+import argparse
+import csv
+import json
+import sys
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from utils.config import DATA_DIR, QUESTIONS_PATH, SCORING_COLLECTIONS_GLOB
+from utils.models import Question, QuestionBank, QuestionScoringCollection, ScoreResult
+
+DEFAULT_CHUNK_SIZE = 10_000
+# Below this many submissions, looking answers up one by one is faster than per-question array operations
+SMALL_BATCH_SIZE = 64
+
+
+@dataclass
+class BatchScoreResult:
+    """Scores of one collection for a batch of submissions, one entry per submission"""
+
+    weighted_score: np.ndarray
+    """Total score of question responses weighted by question importance"""
+    normalized_weighted_score: np.ndarray
+    """Weighted score normalized by the weighted maximum (if > 0) or minimum (if <= 0)"""
+    raw_response_score: np.ndarray
+    """Sum of the raw score for each question without weights"""
+    bucket: np.ndarray
+    """Index of the matching threshold in the collection's thresholds, -1 if no threshold matches"""
+    contributions: np.ndarray
+    """Normalized weighted contribution of each of the collection's questions (submissions x questions),
+    NaN for unanswered questions"""
+
+
+class BatchScorer:
+    """
+    Scores response matrices against several scoring collections at once.
+
+    Option score tables, importance weights and collection extremes are compiled once
+    when the scorer is created.
+    """
+
+    def __init__(self, question_lookup: Mapping[str, Question], collections: Mapping[str, QuestionScoringCollection]):
+        """
+        Args:
+            question_lookup: dictionary for looking up questions by question id
+            collections: scoring collections to evaluate, keyed by a display name
+
+        Raises:
+            ValueError: If a collection references a question id that is not in the question lookup
+        """
+        for name, collection in collections.items():
+            missing = [qid for qid in collection.question_ids if qid not in question_lookup]
+            if missing:
+                raise ValueError(f"Question IDs {missing} from collection '{name}' not found in question bank")
+
+        self.collections = dict(collections)
+        used = {qid for collection in self.collections.values() for qid in collection.question_ids}
+        # Columns of the response matrix, in question bank order
+        self.question_ids = [qid for qid in question_lookup if qid in used]
+        self.question_index = {qid: i for i, qid in enumerate(self.question_ids)}
+
+        questions = [question_lookup[qid] for qid in self.question_ids]
+        self.option_tables = [q.option_scores for q in questions]
+        self.is_range = np.array([q.question_type == "range" for q in questions], dtype=bool)
+        self.weights = np.array([q.importance_score for q in questions], dtype=float)
+
+        # Collections x questions matrix of how often each question is counted in each collection
+        self.membership = np.zeros((len(self.collections), len(self.question_ids)))
+        self.columns: dict[str, np.ndarray] = {}
+        self.max_weighted_score = np.zeros(len(self.collections))
+        self.min_weighted_score = np.zeros(len(self.collections))
+        for c, (name, collection) in enumerate(self.collections.items()):
+            columns = np.array([self.question_index[qid] for qid in collection.question_ids], dtype=np.intp)
+            np.add.at(self.membership[c], columns, 1.0)
+            self.columns[name] = columns
+            plan = collection.get_scoring_plan(question_lookup)
+            self.max_weighted_score[c] = plan.max_weighted_score
+            self.min_weighted_score[c] = plan.min_weighted_score
+
+    def response_scores(self, responses: np.ndarray) -> np.ndarray:
+        """Map a responses matrix to a matrix of raw response scores.
+
+        Args:
+            responses: submissions x questions array of answers in `question_ids` column order.
+                Missing answers can be None, NaN or an empty string.
+
+        Returns:
+            np.ndarray: submissions x questions float array of response scores, NaN where unanswered
+        """
+        responses = np.asarray(responses, dtype=object).reshape(-1, len(self.question_ids))
+        scores = np.full(responses.shape, np.nan)
+        if len(responses) <= SMALL_BATCH_SIZE:
+            return self._response_scores_small(responses, scores)
+
+        for j, option_table in enumerate(self.option_tables):
+            column = responses[:, j]
+            # None, empty strings and NaN (which never equals itself) all mean unanswered
+            missing = np.equal(column, None) | np.equal(column, "") | (column != column)
+            if self.is_range[j]:
+                # For range questions, the response itself is the score
+                scores[~missing, j] = column[~missing].astype(float)
+                continue
+            # Score each distinct answer once, then broadcast back to the submissions
+            unique_answers, inverse = np.unique(column[~missing].astype(str), return_inverse=True)
+            answer_scores = np.array([option_table.get(a, np.nan) for a in unique_answers], dtype=float)
+            scores[~missing, j] = answer_scores[inverse]
+        return scores
+
+    def _response_scores_small(self, responses: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Same as response_scores, looking up each answer directly"""
+        is_range = self.is_range.tolist()
+        for i, row in enumerate(responses.tolist()):
+            for j, answer in enumerate(row):
+                # None, empty strings and NaN (which never equals itself) all mean unanswered
+                if answer is None or answer == "" or answer != answer:
+                    continue
+                # For range questions, the response itself is the score
+                scores[i, j] = float(answer) if is_range[j] else self.option_tables[j].get(answer, np.nan)
+        return scores
+
+    def score(self, responses: np.ndarray) -> dict[str, BatchScoreResult]:
+        """Score a batch of submissions against every collection.
+
+        Args:
+            responses: submissions x questions array of answers in `question_ids` column order
+
+        Returns:
+            dict[str, BatchScoreResult]: scores for each collection, keyed by collection name
+        """
+        scores = self.response_scores(responses)
+        answered = ~np.isnan(scores)
+        raw = np.where(answered, scores, 0.0)
+        weighted = raw * self.weights
+
+        raw_totals = raw @ self.membership.T
+        weighted_totals = weighted @ self.membership.T
+        # Normalize positive totals by the maximum and the rest by the absolute minimum
+        with np.errstate(divide="ignore", invalid="ignore"):
+            normalized = weighted_totals / np.where(
+                weighted_totals > 0, self.max_weighted_score, np.abs(self.min_weighted_score)
+            )
+
+        results = {}
+        for c, (name, collection) in enumerate(self.collections.items()):
+            columns = self.columns[name]
+            contributions = weighted[:, columns]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                contributions = contributions / np.where(
+                    contributions > 0, self.max_weighted_score[c], abs(self.min_weighted_score[c])
+                )
+            contributions[~answered[:, columns]] = np.nan
+
+            results[name] = BatchScoreResult(
+                weighted_score=weighted_totals[:, c],
+                normalized_weighted_score=normalized[:, c],
+                raw_response_score=raw_totals[:, c],
+                bucket=classify_scores(collection, normalized[:, c]),
+                contributions=contributions,
+            )
+        return results
+
+    def score_results(self, results: dict[str, BatchScoreResult]) -> list[dict[str, ScoreResult]]:
+        """Convert batch results into one ScoreResult per collection for every submission.
+
+        Args:
+            results: batch results from `score`
+
+        Returns:
+            list[dict[str, ScoreResult]]: for each submission, the ScoreResult of each collection by name
+        """
+        n_submissions = len(next(iter(results.values())).weighted_score) if results else 0
+        rows: list[dict[str, ScoreResult]] = [{} for _ in range(n_submissions)]
+        for c, (name, result) in enumerate(results.items()):
+            question_ids = self.collections[name].question_ids
+            # Convert to Python floats once per collection rather than once per value
+            columns = zip(
+                result.weighted_score.tolist(),
+                result.normalized_weighted_score.tolist(),
+                result.raw_response_score.tolist(),
+                result.contributions.tolist(),
+            )
+            for row, (weighted, normalized, raw, contributions) in zip(rows, columns):
+                # The values come from validated scoring plans, so skip validating them again
+                row[name] = ScoreResult.model_construct(
+                    weighted_score=weighted,
+                    normalized_weighted_score=normalized,
+                    raw_response_score=raw,
+                    max_weighted_score=float(self.max_weighted_score[c]),
+                    min_weighted_score=float(self.min_weighted_score[c]),
+                    # NaN marks unanswered questions and never equals itself
+                    question_contributions=[
+                        (qid, contribution)
+                        for qid, contribution in zip(question_ids, contributions)
+                        if contribution == contribution
+                    ],
+                )
+        return rows
+
+    def responses_matrix(self, rows: Iterable[Mapping[str, str | float | None]]) -> np.ndarray:
+        """Build a responses matrix from response sets keyed by question id.
+
+        Args:
+            rows: one mapping of question ids to answers per submission
+
+        Returns:
+            np.ndarray: submissions x questions object array in `question_ids` column order
+        """
+        return np.array(
+            [[row.get(qid) for qid in self.question_ids] for row in rows], dtype=object
+        ).reshape(-1, len(self.question_ids))
+
+
+def classify_scores(collection: QuestionScoringCollection, scores: np.ndarray) -> np.ndarray:
+    """Find the threshold bucket of each normalized score with a single sorted search
+    over the collection's threshold boundaries.
+
+    Args:
+        collection: the scoring collection whose thresholds are used
+        scores: array of normalized weighted scores
+
+    Returns:
+        np.ndarray: index into `collection.thresholds` for each score, -1 where no threshold matches
+    """
+    scores = np.asarray(scores, dtype=float)
+    boundaries = np.asarray(collection.threshold_boundaries, dtype=float)
+    if not boundaries.size:
+        return np.full(scores.shape, -1, dtype=np.intp)
+
+    buckets = np.searchsorted(boundaries[:-1], scores, side="right") - 1
+    # Scores outside of [lowest lower bound, highest upper bound) and NaN scores have no bucket
+    return np.where((boundaries[0] <= scores) & (scores < boundaries[-1]), buckets, -1)
+
+
+def collection_name(config_path: Path | str) -> str:
+    """Name of a scoring collection: its file name without the `_scoring_questions.json` suffix"""
+    return Path(config_path).name.removesuffix(".json").removesuffix("_scoring_questions")
+
+
+def load_scoring_configs(
+    questions_path: Path, scoring_configs: list[Path]
+) -> tuple[dict[str, Question], dict[str, QuestionScoringCollection]]:
+    """Load the question bank and scoring collections from JSON files.
+    Collections are named after their file name without the `_scoring_questions.json` suffix.
+
+    Returns:
+        tuple[dict[str, Question], dict[str, QuestionScoringCollection]]: questions by question id,
+            scoring collections by name
+    """
+    question_bank = QuestionBank.model_validate_json(questions_path.read_text())
+    question_lookup = {q.question_id: q for q in question_bank.questions}
+    collections = {
+        collection_name(config_path): (
+            QuestionScoringCollection.model_validate_json(config_path.read_text())
+        )
+        for config_path in scoring_configs
+    }
+    return question_lookup, collections
+
+
+def load_batch_scorer(questions_path: Path, scoring_configs: list[Path]) -> BatchScorer:
+    """Load the question bank and scoring collections from JSON files and compile a BatchScorer."""
+    return BatchScorer(*load_scoring_configs(questions_path, scoring_configs))
+
+
+def read_chunks(input_path: Path, chunk_size: int) -> Iterator[list[dict]]:
+    """Stream the input file as lists of at most chunk_size response sets"""
+    with open(input_path, "r", newline="") as f:
+        if input_path.suffix == ".jsonl":
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        while chunk := list(islice(rows, chunk_size)):
+            yield chunk
+
+
+def _output_rows(
+    scorer: BatchScorer, chunk: list[dict], results: dict[str, BatchScoreResult], id_column: str, contributions: bool
+) -> Iterator[dict]:
+    """Flatten the batch results back into one output record per submission"""
+    for i, row in enumerate(chunk):
+        record = {id_column: row[id_column]} if id_column in row else {}
+        for name, result in results.items():
+            thresholds = scorer.collections[name].thresholds or []
+            bucket = result.bucket[i]
+            record[f"{name}_weighted_score"] = float(result.weighted_score[i])
+            record[f"{name}_normalized_weighted_score"] = float(result.normalized_weighted_score[i])
+            record[f"{name}_raw_response_score"] = float(result.raw_response_score[i])
+            record[f"{name}_bucket"] = thresholds[bucket].header if bucket >= 0 else None
+            if contributions:
+                for qid, contribution in zip(scorer.collections[name].question_ids, result.contributions[i]):
+                    record[f"{name}:{qid}"] = None if np.isnan(contribution) else float(contribution)
+        yield record
+
+
+def main():
+    """Main function to score a file of response sets."""
+    parser = argparse.ArgumentParser(description="Score a CSV or JSONL file of response sets against scoring configurations")
+    parser.add_argument("--input", type=Path, required=True, help="CSV or JSONL file of response sets")
+    parser.add_argument("--output", type=Path, help="CSV or JSONL file to write scores to (default: CSV on stdout)")
+    parser.add_argument(
+        "--questions",
+        type=Path,
+        default=QUESTIONS_PATH,
+        help="Path to questions.json (default: data/questions.json)",
+    )
+    parser.add_argument(
+        "--scoring_configs",
+        type=Path,
+        nargs="+",
+        default=sorted(DATA_DIR.glob(SCORING_COLLECTIONS_GLOB)),
+        help="Scoring configuration JSON files (default: data/*_scoring_questions.json)",
+    )
+    parser.add_argument("--id_column", default="id", help="Input column identifying each submission (default: id)")
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"Number of submissions scored at a time (default: {DEFAULT_CHUNK_SIZE})",
+    )
+    parser.add_argument(
+        "--contributions", action="store_true", help="Also write per-question contributions to each score"
+    )
+
+    args = parser.parse_args()
+
+    scorer = load_batch_scorer(args.questions, args.scoring_configs)
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    write_jsonl = args.output is not None and args.output.suffix == ".jsonl"
+    writer = None
+    try:
+        for chunk in read_chunks(args.input, args.chunk_size):
+            results = scorer.score(scorer.responses_matrix(chunk))
+            for record in _output_rows(scorer, chunk, results, args.id_column, args.contributions):
+                if write_jsonl:
+                    out.write(json.dumps(record) + "\n")
+                    continue
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(record))
+                    writer.writeheader()
+                writer.writerow(record)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
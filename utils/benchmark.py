@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Benchmark question bank loading and scoring on synthetic question banks of configurable size.
+
+For each size, a question bank with a mix of categorical and range questions and a set of scoring collections
+with thresholds are generated into a temporary directory, then each benchmark case is timed with timeit.
+Results can be written as JSON and compared against a stored baseline, to catch regressions in
+`utils.models`, `utils.loader` and the Results page helpers.
+
+Usage:
+    python -m utils.benchmark --output benchmark.json
+    python -m utils.benchmark --sizes 50x1 50000x500 --baseline benchmark.json --tolerance 0.3
+
+Options:
+    --sizes SIZES: Question bank sizes as QUESTIONSxCOLLECTIONS (default: 50x1 500x10 5000x100)
+    --collection_size N: Number of questions in each scoring collection, at most the bank size (default: 50)
+    --range_fraction F: Share of range questions in the bank (default: 0.2)
+    --cases NAMES: Only run these benchmark cases (default: all)
+    --repeat N: Number of timing repeats per case, the median and minimum are reported (default: 5)
+    --seed N: Random seed for the synthetic data (default: 0)
+    --output PATH: Write the results as JSON
+    --baseline PATH: JSON results of an earlier run to compare against
+    --tolerance F: Relative slowdown of the median time over the baseline reported as a regression (default: 0.25)
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+from collections.abc import Callable, Mapping
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from utils.collection_matrix import CollectionMatrix
+from utils.loader import clear_collection_cache, load_question_bank, load_question_collection
+from utils.models import Question, QuestionScoringCollection
+from utils.question_renderer import build_contributions_table, get_contribution_tables
+from utils.response_store import QuestionIndex, ResponseStore
+from utils.visualization import render_score_bar
+
+DEFAULT_SIZES = ["50x1", "500x10", "5000x100"]
+SCORE_VALUES = [-1.0, -0.5, 0.0, 0.5, 1.0]
+THRESHOLD_COLORS = ["red", "yellow", "green"]
+
+
+@dataclass
+class BenchmarkResult:
+    case: str
+    """Name of the benchmark case"""
+    questions: int
+    """Number of questions in the synthetic question bank"""
+    collections: int
+    """Number of scoring collections"""
+    median_us: float
+    """Median time per call over the repeats, in microseconds"""
+    min_us: float
+    """Fastest time per call over the repeats, in microseconds"""
+    calls: int
+    """Number of calls timed in each repeat"""
+
+    @property
+    def key(self) -> tuple[str, int, int]:
+        """Identifies the same case and size across runs"""
+        return self.case, self.questions, self.collections
+
+
+def parse_size(size: str) -> tuple[int, int]:
+    """Parse a QUESTIONSxCOLLECTIONS size such as 500x10.
+
+    Raises:
+        argparse.ArgumentTypeError: If the size is not two positive integers separated by x
+    """
+    try:
+        n_questions, n_collections = (int(part) for part in size.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Size must look like QUESTIONSxCOLLECTIONS, e.g. 500x10: {size}") from None
+    if n_questions < 1 or n_collections < 1:
+        raise argparse.ArgumentTypeError(f"Size must have at least one question and one collection: {size}")
+    return n_questions, n_collections
+
+
+def generate_question_bank(n_questions: int, range_fraction: float, rng: random.Random) -> dict:
+    """Generate the JSON data of a synthetic question bank.
+
+    Args:
+        n_questions: number of questions
+        range_fraction: share of range questions, the rest are categorical with 2 to 5 options
+        rng: random number generator
+
+    Returns:
+        dict: data in the questions.json format
+    """
+    questions = []
+    for i in range(n_questions):
+        question = {
+            "question_id": f"S-{i:05d}",
+            "question_text": f"Synthetic question {i}?",
+            "description": f"Description of synthetic question {i}.",
+            "importance_score": rng.choice([0.5, 1.0, 1.0, 2.0]),
+        }
+        if rng.random() < range_fraction:
+            question["question_type"] = "range"
+            question["answer_options"] = [["Lowest", -1.0], ["Highest", 1.0]]
+        else:
+            question["question_type"] = "categorical"
+            question["answer_options"] = [
+                [f"Option {k}", rng.choice(SCORE_VALUES)] for k in range(rng.randint(2, 5))
+            ]
+        questions.append(question)
+    return {"questions": questions}
+
+
+def generate_collection(question_ids: list[str], collection_size: int, rng: random.Random, name: str) -> dict:
+    """Generate the JSON data of a synthetic scoring collection with three adjacent thresholds.
+
+    Args:
+        question_ids: question ids of the question bank to sample from
+        collection_size: number of questions in the collection, at most the number of question ids
+        rng: random number generator
+        name: header of the collection
+
+    Returns:
+        dict: data in the scoring configuration format
+    """
+    lower, upper = sorted(rng.uniform(-0.8, 0.8) for _ in range(2))
+    bounds = [(None, lower), (lower, upper), (upper, None)]
+    thresholds = []
+    for (low, high), color in zip(bounds, THRESHOLD_COLORS):
+        threshold = {"header": f"{name} {color}", "description": f"{color} result", "color": color}
+        if low is not None:
+            threshold["lower"] = low
+        if high is not None:
+            threshold["upper"] = high
+        thresholds.append(threshold)
+    return {
+        "header": name,
+        "question_ids": rng.sample(question_ids, min(collection_size, len(question_ids))),
+        "thresholds": thresholds,
+    }
+
+
+def random_responses(question_lookup: Mapping[str, Question], rng: random.Random, answered: float = 0.9) -> dict:
+    """A random response set answering about the given share of the questions."""
+    responses = {}
+    for qid, question in question_lookup.items():
+        if rng.random() >= answered:
+            continue
+        if question.question_type == "range":
+            responses[qid] = rng.uniform(-1.0, 1.0)
+        else:
+            responses[qid] = rng.choice(question.answer_options)[0]
+    return responses
+
+
+def time_call(func: Callable[[], object], repeat: int) -> tuple[float, float, int]:
+    """Time a function with timeit, calling it enough times per repeat to take at least 0.2 seconds.
+
+    Returns:
+        tuple[float, float, int]: the median and minimum time per call in microseconds, and the calls per repeat
+    """
+    timer = timeit.Timer(func)
+    calls, _ = timer.autorange()
+    per_call_us = [elapsed / calls * 1e6 for elapsed in timer.repeat(repeat=repeat, number=calls)]
+    return statistics.median(per_call_us), min(per_call_us), calls
+
+
+def benchmark_cases(
+    questions_path: Path, collection_paths: list[Path], rng: random.Random
+) -> dict[str, Callable[[], object]]:
+    """Build the benchmark cases for one generated question bank and its collections.
+    Every case covers all collections, so times grow with the number of collections.
+
+    Args:
+        questions_path: path of the generated question bank
+        collection_paths: paths of the generated scoring collections
+        rng: random number generator for the response set
+
+    Returns:
+        dict[str, Callable[[], object]]: the function to time for each case name
+    """
+    question_lookup = load_question_bank(questions_path)
+    collections: list[QuestionScoringCollection] = [
+        load_question_collection(str(path), questions_path) for path in collection_paths
+    ]
+    responses = random_responses(question_lookup, rng)
+    store = ResponseStore(QuestionIndex(question_lookup), responses)
+    collection_matrix = CollectionMatrix(question_lookup, store.index, collections)
+    scores = [collection.calculate_score(question_lookup, responses) for collection in collections]
+    changed_question = next(iter(collections[0].question_ids))
+    # Range questions are answered with a value from their range, categorical questions with an option text
+    changed_question_options = question_lookup[changed_question].answer_options
+    if question_lookup[changed_question].question_type == "range":
+        changed_options = [float(score) for _, score in changed_question_options]
+    else:
+        changed_options = [text for text, _ in changed_question_options]
+
+    def load_collections_cold():
+        clear_collection_cache()
+        for path in collection_paths:
+            load_question_collection(str(path), questions_path)
+
+    def load_collections_warm():
+        for path in collection_paths:
+            load_question_collection(str(path), questions_path)
+
+    def calculate_scores(scored_responses):
+        for collection in collections:
+            collection.calculate_score(question_lookup, scored_responses)
+
+    def calculate_scores_after_change():
+        # Alternate one answer, so every call updates the running totals of the collections containing it
+        current = store.get(changed_question)
+        store.set_response(changed_question, changed_options[0] if current != changed_options[0] else changed_options[-1])
+        calculate_scores(store)
+
+    def extreme_scores():
+        for collection in collections:
+            collection.get_extreme_score(question_lookup)
+            collection.get_extreme_score(question_lookup, is_min=True)
+
+    def score_responses():
+        for collection, score in zip(collections, scores):
+            collection.get_score_response(score.normalized_weighted_score)
+
+    def contributions_tables():
+        for score in scores:
+            build_contributions_table(score.question_contributions, question_lookup, responses)
+
+    def contribution_tables_unchanged():
+        # Scored from the store, so the tables come from the cache under the unchanged responses' fingerprint
+        for collection in collections:
+            breakdown = collection.calculate_score(question_lookup, store).breakdown
+            get_contribution_tables(collection, breakdown, question_lookup, store)
+
+    def score_bars():
+        for collection, score in zip(collections, scores):
+            render_score_bar(score.normalized_weighted_score, collection.thresholds)
+
+    return {
+        "parse_question_bank": lambda: load_question_bank.__wrapped__(questions_path),
+        "load_question_collection_cold": load_collections_cold,
+        "load_question_collection_warm": load_collections_warm,
+        "calculate_score_dict": lambda: calculate_scores(responses),
+        "calculate_score_store_after_change": calculate_scores_after_change,
+        "collection_matrix_score": lambda: collection_matrix.score(store),
+        "collection_matrix_score_new_session": lambda: collection_matrix.score(ResponseStore(store.index, responses)),
+        "get_extreme_score": extreme_scores,
+        "get_score_response": score_responses,
+        "build_contributions_table": contributions_tables,
+        "get_contribution_tables_unchanged": contribution_tables_unchanged,
+        "render_score_bar": score_bars,
+    }
+
+
+def run_benchmarks(
+    sizes: list[tuple[int, int]],
+    collection_size: int,
+    range_fraction: float,
+    repeat: int,
+    seed: int,
+    cases: list[str] | None = None,
+) -> list[BenchmarkResult]:
+    """Generate synthetic data for each size and time every benchmark case on it.
+
+    Args:
+        sizes: (questions, collections) pairs to benchmark
+        collection_size: number of questions in each scoring collection
+        range_fraction: share of range questions in the question bank
+        repeat: number of timing repeats per case
+        seed: random seed for the synthetic data
+        cases: names of the cases to run, None for all of them
+
+    Returns:
+        list[BenchmarkResult]: the timing of each case at each size
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_questions, n_collections in sizes:
+            rng = random.Random(seed)
+            size_dir = Path(tmp_dir) / f"{n_questions}x{n_collections}"
+            size_dir.mkdir()
+            questions_path = size_dir / "questions.json"
+            bank_data = generate_question_bank(n_questions, range_fraction, rng)
+            questions_path.write_text(json.dumps(bank_data))
+            question_ids = [q["question_id"] for q in bank_data["questions"]]
+            collection_paths = []
+            for c in range(n_collections):
+                collection_path = size_dir / f"collection_{c}_scoring_questions.json"
+                collection_path.write_text(
+                    json.dumps(generate_collection(question_ids, collection_size, rng, f"Collection {c}"))
+                )
+                collection_paths.append(collection_path)
+
+            for case, func in benchmark_cases(questions_path, collection_paths, rng).items():
+                if cases and case not in cases:
+                    continue
+                median_us, min_us, calls = time_call(func, repeat)
+                result = BenchmarkResult(case, n_questions, n_collections, median_us, min_us, calls)
+                print(f"{n_questions:>6}x{n_collections:<4} {case:36} {median_us:14.1f} us median {min_us:14.1f} us min")
+                results.append(result)
+    clear_collection_cache()
+    return results
+
+
+def compare_to_baseline(
+    results: list[BenchmarkResult], baseline: list[BenchmarkResult], tolerance: float
+) -> list[BenchmarkResult]:
+    """Print the change of each case against a baseline run and return the regressions.
+
+    Args:
+        results: results of this run
+        baseline: results of the earlier run
+        tolerance: relative slowdown of the median time that counts as a regression
+
+    Returns:
+        list[BenchmarkResult]: the results whose median time is more than `tolerance` slower than the baseline
+    """
+    baseline_by_key = {result.key: result for result in baseline}
+    regressions = []
+    print("\nCompared to baseline:")
+    for result in results:
+        previous = baseline_by_key.get(result.key)
+        if previous is None:
+            print(f"{result.questions:>6}x{result.collections:<4} {result.case:36} not in baseline")
+            continue
+        change = result.median_us / previous.median_us - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(result)
+            flag = "  REGRESSION"
+        print(f"{result.questions:>6}x{result.collections:<4} {result.case:36} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    """Main function to run the benchmarks and compare them against a baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark loading and scoring on synthetic question banks")
+    parser.add_argument(
+        "--sizes",
+        type=parse_size,
+        nargs="+",
+        default=[parse_size(size) for size in DEFAULT_SIZES],
+        help=f"Question bank sizes as QUESTIONSxCOLLECTIONS (default: {' '.join(DEFAULT_SIZES)})",
+    )
+    parser.add_argument(
+        "--collection_size", type=int, default=50, help="Number of questions in each scoring collection (default: 50)"
+    )
+    parser.add_argument(
+        "--range_fraction", type=float, default=0.2, help="Share of range questions in the bank (default: 0.2)"
+    )
+    parser.add_argument("--cases", nargs="+", help="Only run these benchmark cases (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing repeats per case (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data (default: 0)")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON results of an earlier run to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative slowdown over the baseline reported as a regression (default: 0.25)",
+    )
+
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.collection_size, args.range_fraction, args.repeat, args.seed, args.cases)
+
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": [asdict(result) for result in results],
+                },
+                indent=2,
+            )
+        )
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        baseline_data = json.loads(args.baseline.read_text())
+        baseline = [BenchmarkResult(**result) for result in baseline_data["results"]]
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark cases are more than {args.tolerance:.0%} slower than the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
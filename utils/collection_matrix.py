@@ -0,0 +1,169 @@
+"""
+Score one response set against many scoring collections with one vectorized pass.
+
+All collections are compiled together into a sparse collections x questions weight matrix in CSR layout:
+one nonzero per question occurrence holding the question's importance weight, in collection question order,
+with row pointers delimiting the collections. When a session is first scored, its responses are converted to
+scores with one gather at the nonzeros, and the weighted and raw totals and the weighted score extremes of every
+collection are summed per row with `np.bincount`, applying the session's importance overrides to the weights.
+These start the running totals of every collection in the session's response store, which the store keeps up
+to date as answers change, and each collection's result is built from its totals by
+`QuestionScoringCollection.calculate_score`.
+"""
+
+import dataclasses
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from utils.models import Question, QuestionScoringCollection, ScoreResult
+from utils.response_store import QuestionIndex, ResponseStore
+
+
+class CollectionMatrix:
+    """
+    Sparse collections x questions weight matrix compiled from several scoring collections.
+    Built once per set of collections and shared read-only by every session.
+    """
+
+    def __init__(
+        self,
+        question_lookup: Mapping[str, Question],
+        question_index: QuestionIndex,
+        collections: Sequence[QuestionScoringCollection],
+    ):
+        """
+        Args:
+            question_lookup: dictionary for looking up questions by question id
+            question_index: the question index of the response stores that will be scored
+            collections: scoring collections, one matrix row each
+
+        Raises:
+            ValueError: If a collection references a question id that is not in the question index
+        """
+        self.question_lookup = question_lookup
+        """The question bank the collections' scoring plans are compiled from"""
+        self.collections = list(collections)
+        """The scoring collections in row order"""
+
+        positions = []
+        weights = []
+        indptr = [0]
+        for collection in self.collections:
+            positions.extend(question_index.position(qid) for qid in collection.question_ids)
+            weights.extend(collection.get_scoring_plan(question_lookup).weights)
+            indptr.append(len(positions))
+        self.indptr = np.array(indptr, dtype=np.intp)
+        """Row pointers: the nonzeros of collection c are indptr[c]:indptr[c + 1]"""
+        self.indices = np.array(positions, dtype=np.intp)
+        """Question bank position of each nonzero"""
+        self.data = np.array(weights, dtype=float)
+        """Importance weight of each nonzero from the question bank"""
+        self.row_ids = np.repeat(np.arange(len(self.collections), dtype=np.intp), np.diff(self.indptr))
+        """Collection row of each nonzero"""
+
+        # Per-position option score table padded with NaN, so option index -1 (unanswered) gathers NaN
+        n_options = max((len(scores) for scores in question_index.option_scores), default=0)
+        self.option_table = np.full((len(question_index), n_options + 1), np.nan)
+        for position, scores in enumerate(question_index.option_scores):
+            self.option_table[position, : len(scores)] = scores
+        self.is_range = np.array([value_range is not None for value_range in question_index.ranges], dtype=bool)
+
+        # Lowest and highest option score of each nonzero, for the weighted extremes under importance overrides
+        lowest = np.nanmin(self.option_table, axis=1, initial=np.inf)
+        highest = np.nanmax(self.option_table, axis=1, initial=-np.inf)
+        self.min_option_scores = lowest[self.indices]
+        """Lowest option score of each nonzero"""
+        self.max_option_scores = highest[self.indices]
+        """Highest option score of each nonzero"""
+
+    def response_scores(self, responses: ResponseStore) -> np.ndarray:
+        """Score of the response at every nonzero, NaN where unanswered."""
+        options = np.frombuffer(responses.option_indices, dtype=np.int16)[self.indices]
+        scores = self.option_table[self.indices, options]
+        range_values = responses.range_values
+        if range_values is not None:
+            # For range questions, the response itself is the score
+            is_range = self.is_range[self.indices] & (options >= 0)
+            scores[is_range] = np.frombuffer(range_values, dtype=float)[self.indices[is_range]]
+        return scores
+
+    def _row_sums(self, values: np.ndarray) -> np.ndarray:
+        """Sum of the values at the nonzeros of each collection, in collection question order"""
+        return np.bincount(self.row_ids, weights=values, minlength=len(self.collections))
+
+    def track(self, responses: ResponseStore) -> None:
+        """Start the running totals of every collection the store doesn't keep current totals for,
+        from one vectorized pass over the response scores of all of them.
+
+        Args:
+            responses: the session's response store, including its importance overrides
+        """
+        base_plans = [collection.get_scoring_plan(self.question_lookup) for collection in self.collections]
+        untracked = [
+            c
+            for c, (collection, base_plan) in enumerate(zip(self.collections, base_plans))
+            if responses.totals.get(collection, base_plan) is None
+        ]
+        if not untracked:
+            return
+
+        weights = self.data
+        overridden = None
+        if responses.importance_weights is not None:
+            overrides = np.frombuffer(responses.importance_weights, dtype=float)[self.indices]
+            is_override = ~np.isnan(overrides)
+            if is_override.any():
+                weights = np.where(is_override, overrides, weights)
+                overridden = self._row_sums(is_override) > 0
+
+        scores = self.response_scores(responses)
+        weighted_contributions = scores * weights
+        answered = ~np.isnan(scores)
+        # Unanswered questions add 0.0, which leaves the sums the same as summing only the answered ones
+        weighted_totals = self._row_sums(np.where(answered, weighted_contributions, 0.0)).tolist()
+        raw_totals = self._row_sums(np.where(answered, scores, 0.0)).tolist()
+
+        positions = self.indices.tolist()
+        score_list = scores.tolist()
+        contribution_list = weighted_contributions.tolist()
+        indptr = self.indptr.tolist()
+        if overridden is not None:
+            weight_list = weights.tolist()
+            min_weighted_scores = self._row_sums(self.min_option_scores * weights).tolist()
+            max_weighted_scores = self._row_sums(self.max_option_scores * weights).tolist()
+        for c in untracked:
+            start, end = indptr[c], indptr[c + 1]
+            plan = base_plans[c]
+            if overridden is not None and overridden[c]:
+                # Weights changed in this session, so the cached plan's weights and extremes don't apply
+                plan = dataclasses.replace(
+                    plan,
+                    weights=tuple(weight_list[start:end]),
+                    min_weighted_score=min_weighted_scores[c],
+                    max_weighted_score=max_weighted_scores[c],
+                )
+            responses.totals.track(
+                self.collections[c],
+                base_plans[c],
+                plan,
+                positions[start:end],
+                score_list[start:end],
+                contribution_list[start:end],
+                (weighted_totals[c], raw_totals[c]),
+            )
+
+    def score(self, responses: ResponseStore) -> list[ScoreResult]:
+        """Score a session's responses against every collection.
+
+        Collections are scored from the store's running totals, so scoring again after some answers changed only
+        updates the collections containing them, and an unchanged collection returns its previous result.
+
+        Args:
+            responses: the session's response store, including its importance overrides
+
+        Returns:
+            list[ScoreResult]: the score of each collection, in row order, from `calculate_score`
+        """
+        self.track(responses)
+        return [collection.calculate_score(self.question_lookup, responses) for collection in self.collections]
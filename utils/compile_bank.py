@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Compile the question bank and question collections into a binary artifact for fast cold starts.
+
+The question bank and every collection file are parsed and validated once, then pickled together with
+everything the app otherwise derives from them on first use: the interned question index, each collection's
+scoring plan (option score tables and extremes) and its sorted threshold boundaries. The app loads the
+artifact without validating again, and falls back to the JSON files when the artifact is missing, was
+written by an incompatible version of the models, or any of its source files changed.
+
+Usage:
+    python -m utils.compile_bank
+    python -m utils.compile_bank --questions data/questions.json --output data/compiled_bank.pickle
+
+Options:
+    --questions PATH: Path to questions.json (default: data/questions.json)
+    --collections PATHS: Question collection JSON files (default: data/*_questions.json)
+    --output PATH: Where to write the artifact (default: data/compiled_bank.pickle)
+"""
+
+import argparse
+import gc
+import hashlib
+import os
+import pickle
+import time
+import dataclasses
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+
+import pydantic
+
+from utils.config import COMPILED_BANK_PATH, DATA_DIR, QUESTIONS_PATH
+from utils.models import Question, QuestionBank, QuestionScoringCollection, ScoringPlan, ThresholdResponse
+from utils.response_store import QuestionIndex
+
+ARTIFACT_FORMAT_VERSION = 1
+COLLECTIONS_GLOB = "*_questions.json"
+
+
+@dataclass
+class CompiledBank:
+    """Validated question bank and collections with their precomputed lookup structures"""
+
+    format_version: int
+    """Version of the artifact layout"""
+    model_fingerprint: str
+    """Fingerprint of the model definitions the objects were pickled with, see `model_fingerprint`"""
+    sources: dict[str, str]
+    """SHA-256 digest of each source file, keyed by path relative to the artifact's directory"""
+    questions_source: str
+    """Key of the question bank file in `sources`"""
+    question_lookup: dict[str, Question]
+    """Questions by question id, in question bank order"""
+    question_index: QuestionIndex
+    """Interned question positions and option tables"""
+    collections: dict[str, QuestionScoringCollection]
+    """Validated collections with compiled scoring plans, keyed like `sources`"""
+    artifact_path: Path | None = None
+    """Where the artifact was loaded from, set by `read_artifact`"""
+
+    def current_collection(self, collection_path: Path, collection_bytes: bytes) -> QuestionScoringCollection | None:
+        """The compiled collection of a file, if it was compiled from exactly these contents.
+
+        Args:
+            collection_path: path of the collection JSON file
+            collection_bytes: current contents of the file
+
+        Returns:
+            QuestionScoringCollection | None: the validated collection, or None if it isn't in the artifact or
+                the file changed since it was compiled
+        """
+        key = source_key(collection_path, self.artifact_path)
+        if key not in self.collections or self.sources[key] != hashlib.sha256(collection_bytes).hexdigest():
+            return None
+        return self.collections[key]
+
+
+def model_fingerprint() -> str:
+    """Hash of the pydantic version and the layout of every pickled class: the fields and private attributes of
+    the models, the fields of the scoring plan dataclass and the slots of the question index.
+    Pickled objects are only reused if these definitions haven't changed since they were compiled."""
+    parts = [pydantic.VERSION]
+    for model in (Question, ThresholdResponse, QuestionScoringCollection):
+        parts.append(model.__name__)
+        parts.extend(f"{name}:{field!r}" for name, field in model.model_fields.items())
+        parts.extend(sorted(model.__private_attributes__))
+    parts.append(ScoringPlan.__name__)
+    parts.extend(f"{field.name}:{field.type}" for field in dataclasses.fields(ScoringPlan))
+    parts.append(QuestionIndex.__name__)
+    parts.extend(QuestionIndex.__slots__)
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 digest of a file's contents"""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def source_key(path: Path, artifact_path: Path) -> str:
+    """Key of a source file in an artifact: its path relative to the artifact's directory"""
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(artifact_path.parent))
+
+
+def compile_bank(questions_path: Path, collection_paths: list[Path], artifact_path: Path) -> CompiledBank:
+    """Validate the question bank and collections and precompute their lookup structures.
+
+    Args:
+        questions_path: path of the question bank JSON file
+        collection_paths: paths of the question collection JSON files, display pages and scoring configs
+        artifact_path: where the artifact will be written, source paths are stored relative to it
+
+    Returns:
+        CompiledBank: the compiled question bank
+
+    Raises:
+        ValueError: If a file is invalid or a collection references a question id that is not in the bank
+    """
+    questions_bytes = questions_path.read_bytes()
+    question_lookup = {q.question_id: q for q in QuestionBank.model_validate_json(questions_bytes).questions}
+    questions_source = source_key(questions_path, artifact_path)
+    sources = {questions_source: hashlib.sha256(questions_bytes).hexdigest()}
+
+    collections = {}
+    for collection_path in collection_paths:
+        collection_bytes = collection_path.read_bytes()
+        collection = QuestionScoringCollection.model_validate_json(collection_bytes)
+        missing = [qid for qid in collection.question_ids if qid not in question_lookup]
+        if missing:
+            raise ValueError(f"Question IDs {missing} from {collection_path} not found in question bank")
+        # Compile the scoring plan now, so its option tables and extremes are part of the artifact
+        collection.get_scoring_plan(question_lookup)
+        key = source_key(collection_path, artifact_path)
+        sources[key] = hashlib.sha256(collection_bytes).hexdigest()
+        collections[key] = collection
+
+    return CompiledBank(
+        format_version=ARTIFACT_FORMAT_VERSION,
+        model_fingerprint=model_fingerprint(),
+        sources=sources,
+        questions_source=questions_source,
+        question_lookup=question_lookup,
+        question_index=QuestionIndex(question_lookup),
+        collections=collections,
+    )
+
+
+def write_artifact(compiled: CompiledBank, artifact_path: Path) -> None:
+    """Pickle a compiled question bank, replacing the artifact atomically."""
+    tmp_path = artifact_path.with_name(artifact_path.name + ".tmp")
+    # The fields are pickled as a plain dict, so the artifact doesn't depend on the module CompiledBank was
+    # defined in, which is __main__ when this file is run as a script
+    fields = {f.name: getattr(compiled, f.name) for f in dataclasses.fields(compiled) if f.name != "artifact_path"}
+    with open(tmp_path, "wb") as f:
+        pickle.dump(fields, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, artifact_path)
+
+
+def read_artifact(artifact_path: Path, questions_path: Path) -> CompiledBank | None:
+    """Load a compiled question bank if it is current for the given question bank file.
+
+    The question lookup of the returned bank is read-only, and the collections' scoring plans are bound to it.
+    Collections are only current while their own source file is unchanged, see `CompiledBank.current_collection`.
+
+    Args:
+        artifact_path: path of the artifact written by `write_artifact`
+        questions_path: path of the question bank JSON file the artifact must have been compiled from
+
+    Returns:
+        CompiledBank | None: the compiled bank, or None if the artifact is missing, unreadable, incompatible
+            with the current models, or the question bank changed since it was compiled
+    """
+    if not artifact_path.exists():
+        return None
+
+    # Unpickling allocates many small objects, which would otherwise trigger repeated garbage collections
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(artifact_path, "rb") as f:
+            compiled = CompiledBank(**pickle.load(f))
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError):
+        # A truncated or corrupt artifact, one from an older layout, or one pickled with a newer protocol
+        # (ValueError) falls back to the JSON files
+        return None
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    if (
+        compiled.format_version != ARTIFACT_FORMAT_VERSION
+        or compiled.model_fingerprint != model_fingerprint()
+        or compiled.questions_source != source_key(questions_path, artifact_path)
+        or not questions_path.exists()
+        or compiled.sources[compiled.questions_source] != file_digest(questions_path)
+    ):
+        return None
+
+    compiled.artifact_path = artifact_path
+    # The app shares the lookup between sessions read-only, and cached scoring plans are bound to its identity
+    compiled.question_lookup = MappingProxyType(compiled.question_lookup)
+    for collection in compiled.collections.values():
+        collection._plan_lookup = compiled.question_lookup
+    return compiled
+
+
+def main():
+    """Main function to compile the question bank artifact."""
+    parser = argparse.ArgumentParser(description="Compile the question bank and collections for fast loading")
+    parser.add_argument(
+        "--questions",
+        type=Path,
+        default=QUESTIONS_PATH,
+        help="Path to questions.json (default: data/questions.json)",
+    )
+    parser.add_argument(
+        "--collections",
+        type=Path,
+        nargs="+",
+        default=sorted(DATA_DIR.glob(COLLECTIONS_GLOB)),
+        help=f"Question collection JSON files (default: data/{COLLECTIONS_GLOB})",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=COMPILED_BANK_PATH,
+        help="Where to write the artifact (default: data/compiled_bank.pickle)",
+    )
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    compiled = compile_bank(args.questions, args.collections, args.output)
+    compile_seconds = time.perf_counter() - start
+    write_artifact(compiled, args.output)
+
+    start = time.perf_counter()
+    read_artifact(args.output, args.questions)
+    load_seconds = time.perf_counter() - start
+
+    print(
+        f"Compiled {len(compiled.question_lookup)} questions and {len(compiled.collections)} collections "
+        f"into {args.output} ({args.output.stat().st_size / 1024:.0f} KiB)"
+    )
+    print(f"Validating from JSON: {compile_seconds * 1000:.1f} ms, loading the artifact: {load_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
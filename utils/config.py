@@ -2,6 +2,7 @@
 Configuration and constants
 """
 
+import os
 from pathlib import Path
 
 # Project paths
@@ -11,6 +12,8 @@ DATA_DIR = PROJECT_ROOT / "data"
 # Data file paths
 QUESTIONS_PATH = DATA_DIR / "questions.json"
 INTRO_TEXT_MARKDOWN = DATA_DIR / "intro_text.md"
+# Validated question bank and collections written by `python -m utils.compile_bank`, loaded instead of the JSON files
+COMPILED_BANK_PATH = DATA_DIR / "compiled_bank.pickle"
 
 # Questions around organizational friction, financial resources and buy-in
 ORGANIZATIONAL_QUESTIONS_PATH = DATA_DIR / "organizational_display_questions.json"
@@ -24,5 +27,32 @@ ORGANIZATION_SCORING_PATH = DATA_DIR / "organizational_scoring_questions.json"
 TECHNICAL_SCORING_PATH = DATA_DIR / "technical_scoring_questions.json"
 LEGAL_SCORING_PATH = DATA_DIR / "legal_scoring_questions.json"
 AMBITION_SCORING_PATH = DATA_DIR / "ambition_scoring_questions.json"
+# Pattern matching every scoring configuration in DATA_DIR, used by the command line tools
+SCORING_COLLECTIONS_GLOB = "*_scoring_questions.json"
 
-QUESTIONS_CACHE_KEY = "questions"
+# Session state key for the per-session response overlay (question id -> response)
+RESPONSES_CACHE_KEY = "responses"
+# Session state key marking that this session's assessment was submitted
+SUBMITTED_ASSESSMENT_KEY = "submitted_assessment"
+# Query parameter holding an encoded response set, used to resume a saved assessment
+RESUME_QUERY_PARAM = "r"
+# Session state key for the id this session's responses are saved under in the response backend
+SESSION_ID_KEY = "session_id"
+# Query parameter carrying the session id, so a reconnected session can be restored from the response backend
+SESSION_QUERY_PARAM = "s"
+
+# Where responses are kept besides the session state: "session" keeps them in the serving process only,
+# "sqlite" also saves them to a database shared by all app processes on the host, e.g. RESPONSE_BACKEND=sqlite
+RESPONSE_BACKEND = os.environ.get("RESPONSE_BACKEND", "session")
+RESPONSE_DB_PATH = Path(os.environ.get("RESPONSE_DB_PATH", DATA_DIR / "responses.sqlite3"))
+
+# Submitted assessments are appended to a log here, if enabled with ASSESSMENT_LOG=1
+ASSESSMENT_LOG_DIR = DATA_DIR / "assessments"
+ASSESSMENT_LOG_ENABLED = os.environ.get("ASSESSMENT_LOG", "") == "1"
+# Score sketches of all submitted assessments, for showing cohort percentiles, if enabled with COHORT_PERCENTILES=1
+COHORT_SKETCH_PATH = DATA_DIR / "cohort_sketches.json"
+COHORT_PERCENTILES_ENABLED = os.environ.get("COHORT_PERCENTILES", "") == "1"
+# Time each rerun, log the timings as JSON lines and show them in the sidebar, e.g. RERUN_TIMING=1
+RERUN_TIMING_ENABLED = os.environ.get("RERUN_TIMING", "") == "1"
+# Compare scores from each session's running totals against a full recompute, e.g. SCORE_CONSISTENCY_CHECK=1
+SCORE_CONSISTENCY_CHECK = os.environ.get("SCORE_CONSISTENCY_CHECK", "") == "1"
@@ -2,50 +2,294 @@
 Utility functions for loading questions from JSON files.
 """
 
+import atexit
+import functools
 import json
+import os
+import threading
+import uuid
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import TYPE_CHECKING, TypeVar
 
 import streamlit as st
 
-from utils.models import QuestionScoringCollection, QuestionBank
-from utils.config import QUESTIONS_PATH, QUESTIONS_CACHE_KEY
+from utils.models import Question, QuestionScoringCollection, QuestionBank
+from utils.compile_bank import CompiledBank, read_artifact
+from utils.config import (
+    COHORT_SKETCH_PATH,
+    COMPILED_BANK_PATH,
+    QUESTIONS_PATH,
+    RESPONSE_BACKEND,
+    RESPONSE_DB_PATH,
+    RESPONSES_CACHE_KEY,
+    RESUME_QUERY_PARAM,
+    SESSION_ID_KEY,
+    SESSION_QUERY_PARAM,
+)
+from utils.quantile_sketch import CohortSketches
+from utils.response_codec import ResponseCodec, question_bank_hash
+from utils.response_store import QuestionIndex, ResponseStore
+
+if TYPE_CHECKING:
+    # numpy is only imported when the Results page compiles the collection matrix
+    from utils.collection_matrix import CollectionMatrix
+    # sqlite3 is only imported when the SQLite response backend is configured
+    from utils.response_backend import ResponseBackend
+
+
+T = TypeVar("T")
+
+
+def cache_per_questions_path(load: Callable[[Path], T]) -> Callable[[Path], T]:
+    """
+    Cache a loader once per process and question bank file.
+
+    The path is made absolute before the cache lookup, so calling the loader with the default path, the same path
+    passed explicitly, or a relative path all share one cached object. The uncached loader is `__wrapped__`.
+    """
+    cached_load = functools.lru_cache(maxsize=None)(load)
+
+    @functools.wraps(load)
+    def load_cached(questions_path: Path = QUESTIONS_PATH) -> T:
+        return cached_load(Path(os.path.abspath(questions_path)))
+
+    load_cached.cache_clear = cached_load.cache_clear
+    return load_cached
+
+
+@cache_per_questions_path
+def load_compiled_bank(questions_path: Path = QUESTIONS_PATH) -> CompiledBank | None:
+    """
+    Load the artifact written by `python -m utils.compile_bank` once per process, if it is current.
+
+    Args:
+        questions_path: Path to the question bank JSON file the artifact must have been compiled from
+
+    Returns:
+        CompiledBank | None: the already validated question bank and collections, or None if there is no
+            artifact or it is stale, in which case the JSON files are loaded instead
+    """
+    return read_artifact(COMPILED_BANK_PATH, questions_path)
+
+
+@cache_per_questions_path
+def load_question_bank(questions_path: Path = QUESTIONS_PATH) -> Mapping[str, Question]:
+    """
+    Load all questions from questions.json once per process.
+
+    The returned lookup is read-only and shared by every session, so the question text, options,
+    descriptions and weights are only parsed and validated once no matter how many users are connected.
+    If a current compiled artifact exists, the questions are loaded from it without validating them again.
+
+    Args:
+        questions_path: Path to the question bank JSON file
+
+    Returns:
+        Mapping[str, Question]: read-only lookup of questions by question id, in question bank order
+
+    Raises:
+        FileNotFoundError: If the questions file doesn't exist
+    """
+    compiled = load_compiled_bank(questions_path)
+    if compiled is not None:
+        return compiled.question_lookup
+
+    if not questions_path.exists():
+        raise FileNotFoundError(f"Questions file not found: {questions_path}")
+
+    with open(questions_path, "r") as f:
+        questions_data = json.load(f)
+
+    input_questions = QuestionBank(**questions_data)
+
+    return MappingProxyType({q.question_id: q for q in input_questions.questions})
+
+
+@cache_per_questions_path
+def load_question_index(questions_path: Path = QUESTIONS_PATH) -> QuestionIndex:
+    """
+    Intern the question bank's question ids and answer options once per process,
+    shared by the response stores of all sessions.
+
+    Args:
+        questions_path: Path to the question bank JSON file
+
+    Returns:
+        QuestionIndex: question positions and option tables of the question bank
+    """
+    compiled = load_compiled_bank(questions_path)
+    if compiled is not None:
+        return compiled.question_index
+    return QuestionIndex(load_question_bank(questions_path))
+
+
+@cache_per_questions_path
+def load_response_codec(questions_path: Path = QUESTIONS_PATH) -> ResponseCodec:
+    """
+    Build the codec for saving and resuming response sets once per process.
+    Codes are tied to a hash of the questions file, so codes saved for other versions of the questions are rejected.
+
+    Args:
+        questions_path: Path to the question bank JSON file
+
+    Returns:
+        ResponseCodec: encoder and decoder of response sets for this question bank
+    """
+    return ResponseCodec(load_question_bank(questions_path), question_bank_hash(questions_path.read_bytes()))
+
+
+@functools.cache
+def load_response_backend() -> "ResponseBackend":
+    """
+    Create the backend configured with RESPONSE_BACKEND once per process.
+    Responses saved to it are flushed when the process exits.
+
+    Returns:
+        ResponseBackend: the backend sessions' responses are saved to and restored from
+
+    Raises:
+        ValueError: If RESPONSE_BACKEND is not a known backend
+    """
+    from utils.response_backend import ResponseBackend, SQLiteResponseBackend
+
+    if RESPONSE_BACKEND == "session":
+        return ResponseBackend()
+    if RESPONSE_BACKEND == "sqlite":
+        backend = SQLiteResponseBackend(RESPONSE_DB_PATH)
+        atexit.register(backend.close)
+        return backend
+    raise ValueError(f"Unknown response backend '{RESPONSE_BACKEND}', expected 'session' or 'sqlite'")
+
+
+def _is_session_id(value: str | None) -> bool:
+    return value is not None and len(value) == 32 and all(c in "0123456789abcdef" for c in value)
 
 
 def initialize_questions_cache() -> None:
     """
-    Load all questions with from questions.json and cache them in the streamlit state.
-    The state will store the text to display and responses.
+    Make sure the shared question bank is loaded and create this session's response overlay in the streamlit state.
+    The overlay is a ResponseStore that only holds the user's responses by question position, the question text
+    to display comes from the shared question bank.
+
+    With a persistent response backend, the session id is kept in the page's query parameters, and a session
+    reopened with it starts with its saved responses. Otherwise, if the page was opened with a saved response code
+    in its query parameters, the overlay starts with those responses so the assessment can be resumed.
     """
-    if QUESTIONS_CACHE_KEY in st.session_state:
+    load_question_bank()
+
+    if RESPONSES_CACHE_KEY in st.session_state:
         # Already initialized
         return
 
-    if not QUESTIONS_PATH.exists():
-        raise FileNotFoundError(f"Questions file not found: {QUESTIONS_PATH}")
+    backend = load_response_backend()
+    session_id = st.query_params.get(SESSION_QUERY_PARAM)
+    if not _is_session_id(session_id):
+        session_id = uuid.uuid4().hex
 
-    with open(QUESTIONS_PATH, "r") as f:
-        questions_data = json.load(f)
+    responses = ResponseStore(load_question_index())
+    saved = backend.load(session_id)
+    for question_id, response in saved.items():
+        try:
+            responses.set_response(question_id, response)
+        except ValueError:
+            # The question or its options changed since the response was saved
+            pass
 
-    input_questions = QuestionBank(**questions_data)
+    resume_code = st.query_params.get(RESUME_QUERY_PARAM)
+    if resume_code and not saved:
+        try:
+            responses.update(load_response_codec().decode(resume_code))
+        except ValueError as e:
+            responses.clear()
+            st.warning(f"Could not resume your saved answers: {e}")
+        backend.save(session_id, dict(responses))
+
+    st.session_state[SESSION_ID_KEY] = session_id
+    st.session_state[RESPONSES_CACHE_KEY] = responses
+    if backend.persistent:
+        st.query_params[SESSION_QUERY_PARAM] = session_id
+
+
+def restore_session() -> bool:
+    """
+    Make sure this session's responses are in the streamlit state, on pages other than the introduction.
+    A session that reconnected, e.g. to another replica or after a restart, is restored from a persistent
+    response backend if the page was opened with its session id.
+
+    Returns:
+        bool: whether the session has responses, if not it should start over from the introduction
+    """
+    if RESPONSES_CACHE_KEY in st.session_state:
+        return True
+    if not load_response_backend().persistent or not _is_session_id(st.query_params.get(SESSION_QUERY_PARAM)):
+        return False
+    initialize_questions_cache()
+    return True
+
+
+def session_query_params() -> dict[str, str]:
+    """Query parameters to keep when switching pages, so the session can be restored on the next page."""
+    if not load_response_backend().persistent or SESSION_ID_KEY not in st.session_state:
+        return {}
+    return {SESSION_QUERY_PARAM: st.session_state[SESSION_ID_KEY]}
+
+
+def save_responses(changes: Mapping[str, str | float | None]) -> None:
+    """Save changed responses of this session to the response backend, None for cleared answers."""
+    load_response_backend().save(st.session_state[SESSION_ID_KEY], changes)
+
+
+@dataclass
+class CollectionCacheStats:
+    """Counters for the process-level cache of parsed question collections"""
+
+    hits: int = 0
+    """Number of loads served from the cache without reading the file"""
+    misses: int = 0
+    """Number of loads that read, parsed and validated the file"""
+
+
+@dataclass(frozen=True)
+class _CachedCollection:
+    mtime_ns: int
+    size: int
+    question_lookup: Mapping[str, Question]
+    """The question bank the collection's question ids were validated against"""
+    collection: QuestionScoringCollection
 
-    question_lookup = {}
 
-    for q in input_questions.questions:
-        question_lookup[q.question_id] = q
+_collection_cache: dict[Path, _CachedCollection] = {}
+_collection_cache_lock = threading.Lock()
+collection_cache_stats = CollectionCacheStats()
 
-    st.session_state[QUESTIONS_CACHE_KEY] = question_lookup
 
+def clear_collection_cache() -> None:
+    """Drop all cached question collections and reset the cache counters."""
+    with _collection_cache_lock:
+        _collection_cache.clear()
+        collection_cache_stats.hits = 0
+        collection_cache_stats.misses = 0
 
-def load_question_collection(json_file_path: str) -> QuestionScoringCollection:
+
+def load_question_collection(json_file_path: str, questions_path: Path = QUESTIONS_PATH) -> QuestionScoringCollection:
     """
     Load questions from a category file, validate them against the questions cache and return as a QuestionCollection
     that can be used for display or scoring.
 
     The category file should contain a list of question IDs. Question details
-    are retrieved from the cached questions dictionary.
+    are retrieved from the shared question bank.
+
+    Validated collections are cached for the whole process and shared by all sessions, so they must not be modified.
+    A cached collection is reused until the file's modification time or size changes, so steady state reruns
+    don't read or validate the file again. Files that are unchanged since the question bank artifact was compiled
+    are taken from the artifact without validating them again.
 
     Args:
         json_file_path: Path to the category JSON file containing question IDs
+        questions_path: Path to the question bank JSON file the question IDs are validated against
 
     Returns:
         QuestionCollection: Collection of Question objects for this category
@@ -54,22 +298,101 @@ def load_question_collection(json_file_path: str) -> QuestionScoringCollection:
         FileNotFoundError: If the category file doesn't exist
         ValueError: If the JSON is invalid or question IDs are not found
     """
-    file_path = Path(json_file_path)
+    file_path = Path(os.path.abspath(json_file_path))
 
-    if not file_path.exists():
-        raise FileNotFoundError(f"Category file not found: {json_file_path}")
+    try:
+        file_stat = os.stat(file_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Category file not found: {json_file_path}") from None
+
+    question_lookup = load_question_bank(questions_path)
+    # Sessions run on threads, the counters are only updated under the lock so no increment is lost
+    with _collection_cache_lock:
+        cached = _collection_cache.get(file_path)
+        if (
+            cached is not None
+            and cached.mtime_ns == file_stat.st_mtime_ns
+            and cached.size == file_stat.st_size
+            and cached.question_lookup is question_lookup
+        ):
+            collection_cache_stats.hits += 1
+            return cached.collection
 
     # Load question IDs from category file
-    with open(file_path, "r") as f:
-        data = json.load(f)
+    with open(file_path, "rb") as f:
+        collection_bytes = f.read()
+
+    compiled = load_compiled_bank(questions_path)
+    questions_collection = None
+    if compiled is not None and compiled.question_lookup is question_lookup:
+        questions_collection = compiled.current_collection(file_path, collection_bytes)
 
-    questions_collection = QuestionScoringCollection.model_validate(data)
+    if questions_collection is None:
+        questions_collection = QuestionScoringCollection.model_validate(json.loads(collection_bytes))
 
-    # Build list of Question objects from cache
-    for qid in questions_collection.question_ids:
-        if qid not in st.session_state[QUESTIONS_CACHE_KEY]:
-            raise ValueError(
-                f"Question ID '{qid}' from {file_path} not found in questions cache. Check that all questions are defined in {QUESTIONS_PATH}"
-            )
+        # Check every question is defined in the question bank
+        for qid in questions_collection.question_ids:
+            if qid not in question_lookup:
+                raise ValueError(
+                    f"Question ID '{qid}' from {file_path} not found in question bank. Check that all questions are defined in {questions_path}"
+                )
+
+    with _collection_cache_lock:
+        collection_cache_stats.misses += 1
+        _collection_cache[file_path] = _CachedCollection(
+            mtime_ns=file_stat.st_mtime_ns,
+            size=file_stat.st_size,
+            question_lookup=question_lookup,
+            collection=questions_collection,
+        )
 
     return questions_collection
+
+
+_collection_matrix_cache: dict[tuple[Path, ...], tuple[tuple[QuestionScoringCollection, ...], "CollectionMatrix"]] = {}
+_collection_matrix_cache_lock = threading.Lock()
+
+
+def load_collection_matrix(json_file_paths: list[str]) -> "CollectionMatrix":
+    """
+    Load several scoring collections and compile them into one sparse matrix, for scoring a session's
+    responses against all of them while looking each answer up only once.
+
+    The matrix is cached for the whole process and rebuilt when any of the cached collections is reloaded.
+
+    Args:
+        json_file_paths: Paths to the category JSON files, one matrix row each
+
+    Returns:
+        CollectionMatrix: the compiled collections, in the order of the paths
+
+    Raises:
+        FileNotFoundError: If a category file doesn't exist
+        ValueError: If the JSON is invalid or question IDs are not found
+    """
+    key = tuple(Path(os.path.abspath(path)) for path in json_file_paths)
+    collections = tuple(load_question_collection(path) for path in json_file_paths)
+    cached = _collection_matrix_cache.get(key)
+    if cached is not None and all(a is b for a, b in zip(cached[0], collections)):
+        return cached[1]
+
+    from utils.collection_matrix import CollectionMatrix
+
+    collection_matrix = CollectionMatrix(load_question_bank(), load_question_index(), collections)
+    with _collection_matrix_cache_lock:
+        _collection_matrix_cache[key] = (collections, collection_matrix)
+    return collection_matrix
+
+
+@functools.cache
+def load_cohort_sketches() -> CohortSketches:
+    """
+    Load the score sketches of all completed assessments, shared by all sessions of this process.
+    Scores added by this process are also merged into the file when it exits.
+
+    Returns:
+        CohortSketches: the cohort's score sketches by collection name
+    """
+    sketches = CohortSketches(COHORT_SKETCH_PATH)
+    atexit.register(sketches.persist)
+    return sketches
@@ -2,29 +2,38 @@
 Pydantic models for questions and question collections.
 """
 
+import bisect
 import math
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from operator import itemgetter
 from typing import Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+
+from utils.config import SCORE_CONSISTENCY_CHECK
+from utils.response_store import CollectionTotals, ResponseStore
+
+_contribution_score = itemgetter(1)
 
 
 class Question(BaseModel):
     """
     Represents a single assessment question.
 
-    Immutable fields (should not be changed after initialization):
+    Questions are frozen so that one question bank can be shared read-only by every session.
+    User answers are not stored on the question, they live in a per-session response overlay
+    that maps question ids to responses (see `utils.loader.initialize_questions_cache`).
+
+    Fields:
     - question_id: Unique identifier for the question
     - question_text: The text displayed to users
     - question_type: Type of question (categorical or range)
     - answer_options: List of (option_text, score) tuples
     - description: Optional detailed description shown on mouseover
-
-    Mutable fields (can be changed):
     - importance_score: Weight of this question in overall scoring
-    - user_response: The user's answer to the question
     """
 
-    # Immutable fields
     question_id: str
     """Question identifier string, must be there and unique to the question"""
     question_text: str
@@ -35,35 +44,46 @@ class Question(BaseModel):
     """List of possible answer texts and their contribution to the score weight"""
     description: Optional[str] = None
     """Description of the question that provides additional context to the user"""
-
-    # Mutable fields
     importance_score: float = Field(default=1.0, ge=0)
     """Weight of this question in overall scoring"""
-    user_response: Optional[str | float] = None
-    """The response selected by the user"""
 
-    model_config = {"validate_assignment": True}
+    model_config = {"frozen": True}
+
+    _option_scores: dict[str, float] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, context) -> None:
+        # Option text to score lookup table, the first option wins if an option text is repeated
+        for option_text, score in self.answer_options:
+            self._option_scores.setdefault(option_text, score)
+
+    @property
+    def option_scores(self) -> Mapping[str, float]:
+        """Lookup table from answer option text to the option's score"""
+        return self._option_scores
 
-    def get_response_score(self) -> Optional[float]:
+    def get_response_score(self, responses: Mapping[str, str | float]) -> Optional[float]:
         """
-        Get the score associated with this question's user response.
+        Get the score associated with the user's response to this question.
+
+        Args:
+            responses: the session's response overlay, mapping question ids to user responses
 
         Returns:
             float: The score for the response, or None if no response provided
         """
-        if self.user_response is None:
+        if isinstance(responses, ResponseStore):
+            return responses.get_score(self.question_id)
+
+        user_response = responses.get(self.question_id)
+        if user_response is None:
             return None
 
         if self.question_type == "range":
             # For range questions, the response itself is the score
-            return float(self.user_response)
+            return float(user_response)
 
         # For categorical questions, look up the score from answer_options
-        for option_text, score in self.answer_options:
-            if option_text == self.user_response:
-                return score
-
-        return None
+        return self._option_scores.get(user_response)
 
 
 class ThresholdResponse(BaseModel):
@@ -90,6 +110,54 @@ class QuestionBank(BaseModel):
     """A list of all questions which can be considered for scoring"""
 
 
+@dataclass(frozen=True)
+class ContributionBreakdown:
+    """Per-question contributions of a score result partitioned by sign, each group sorted by magnitude"""
+
+    positive: list[tuple[str, float]] = field(default_factory=list)
+    """(question_id, contribution) pairs of answers that raise the score, largest first"""
+    negative: list[tuple[str, float]] = field(default_factory=list)
+    """(question_id, contribution) pairs of answers that lower the score, most negative first"""
+    neutral: list[tuple[str, float]] = field(default_factory=list)
+    """(question_id, contribution) pairs of answers that don't change the score, in collection question order"""
+
+    @classmethod
+    def partition(cls, contributions: Iterable[tuple[str, float]]) -> "ContributionBreakdown":
+        """Partition contributions in one pass and sort the positive and negative ones by magnitude.
+
+        Args:
+            contributions: (question_id, contribution) pairs in collection question order
+
+        Returns:
+            ContributionBreakdown: the partitioned contributions, ties kept in collection question order
+        """
+        positive = []
+        negative = []
+        neutral = []
+        for contribution in contributions:
+            score = contribution[1]
+            if score > 0:
+                positive.append(contribution)
+            elif score < 0:
+                negative.append(contribution)
+            else:
+                neutral.append(contribution)
+        positive.sort(key=_contribution_score, reverse=True)
+        negative.sort(key=_contribution_score)
+        return cls(positive, negative, neutral)
+
+    def top_drivers(self, k: int) -> tuple[list[tuple[str, float]], list[tuple[str, float]]]:
+        """The k answers that raise the score the most and the k answers that lower it the most.
+
+        Args:
+            k: maximum number of drivers in each direction
+
+        Returns:
+            tuple[list[tuple[str, float]], list[tuple[str, float]]]: positive and negative drivers, largest first
+        """
+        return self.positive[:k], self.negative[:k]
+
+
 class ScoreResult(BaseModel):
     """Represents the scoring results computed by QuestionCollection"""
 
@@ -105,46 +173,94 @@ class ScoreResult(BaseModel):
     """The minimum possible weighted score for this collection (all worst answers selected)."""
     question_contributions: list[tuple[str, float]] = Field(default_factory=list)
     """Per-question (question_id, raw_weighted_contribution) pairs in collection question order."""
+    breakdown: ContributionBreakdown | None = Field(default=None, exclude=True)
+    """The question contributions partitioned by sign and sorted by magnitude, built together with the result by
+    `calculate_score`. None for batch scoring results. Not serialized."""
 
 
-class QuestionScoringCollection(BaseModel):
+@dataclass(frozen=True)
+class ScoringPlan:
     """
-    Represents a collection of questions with scoring logic.
-
-    Currently uses uniform weighting for question importance,
-    but designed to be extensible for custom weighting strategies.
+    Scoring data for a QuestionScoringCollection compiled once from the question bank,
+    so scoring a response set is a single pass over the collection's questions.
+    All per-question tuples are in collection question order.
     """
 
-    header: str | None = None
-    """Brief description of the purpose for these questions"""
-    question_ids: list[str]
-    """List of question ids to be used for scoring"""
-    thresholds: list[ThresholdResponse] | None = None
-    """Define the responses that are triggered for various possible scores ranges"""
+    question_ids: tuple[str, ...]
+    """Question ids in collection order"""
+    weights: tuple[float, ...]
+    """Dense vector of question importance weights"""
+    option_scores: tuple[Mapping[str, float], ...]
+    """Per-question lookup table from answer option text to score"""
+    is_range: tuple[bool, ...]
+    """Per-question flag, True for range questions where the response itself is the score"""
+    min_raw_score: float
+    """Sum of the lowest option score of every question"""
+    max_raw_score: float
+    """Sum of the highest option score of every question"""
+    min_weighted_score: float
+    """Sum of the lowest option score of every question weighted by question importance"""
+    max_weighted_score: float
+    """Sum of the highest option score of every question weighted by question importance"""
+
+    @classmethod
+    def compile(
+        cls,
+        question_ids: list[str],
+        question_lookup: Mapping[str, Question],
+        importance_overrides: Mapping[str, float] | None = None,
+    ) -> "ScoringPlan":
+        """Build the scoring plan for the given questions.
+
+        Args:
+            question_ids: question ids in collection order
+            question_lookup: dictionary for looking up questions by question id
+            importance_overrides: optional importance weights by question id that replace the questions' own weights
+
+        Returns:
+            ScoringPlan: the compiled plan
+        """
+        importance_overrides = importance_overrides or {}
+        questions = [question_lookup[qid] for qid in question_ids]
+        weights = [importance_overrides.get(q.question_id, q.importance_score) for q in questions]
+        min_raw_score = max_raw_score = min_weighted_score = max_weighted_score = 0.0
+        for question, weight in zip(questions, weights):
+            score_options = [score for _, score in question.answer_options]
+            min_raw_score += min(score_options)
+            max_raw_score += max(score_options)
+            min_weighted_score += min(score_options) * weight
+            max_weighted_score += max(score_options) * weight
+
+        return cls(
+            question_ids=tuple(question_ids),
+            weights=tuple(weights),
+            option_scores=tuple(q.option_scores for q in questions),
+            is_range=tuple(q.question_type == "range" for q in questions),
+            min_raw_score=min_raw_score,
+            max_raw_score=max_raw_score,
+            min_weighted_score=min_weighted_score,
+            max_weighted_score=max_weighted_score,
+        )
 
-    def calculate_score(self, question_lookup: dict[str, Question]) -> ScoreResult:
-        """Calculates the raw and weighted score of the responses to the questions
+    def score_result(
+        self, weighted_contributions: Iterable[float], weighted_score: float, raw_score: float
+    ) -> ScoreResult:
+        """Build the score result from the totals and the weighted contribution of each question.
 
         Args:
-            question_lookup: dictionary for looking up questions and responses by question id
+            weighted_contributions: weighted contribution of each question in plan order, NaN where unanswered
+            weighted_score: sum of the weighted contributions of the answered questions
+            raw_score: sum of the response scores of the answered questions
 
         Returns:
             ScoreResult: the weighted, normalized weighted, raw score, and per-question contributions
         """
-        total_weighted_score = 0.0
-        total_response_score = 0.0
-        answered: list[tuple[str, float]] = []  # (qid, normalized_weighted_contribution)
-
-        _, max_weighted_score = self.get_extreme_score(question_lookup)
-        _, min_weighted_score = self.get_extreme_score(question_lookup, is_min=True)
+        max_weighted_score = self.max_weighted_score
+        min_weighted_score = self.min_weighted_score
 
-        for qid in self.question_ids:
-            question = question_lookup[qid]
-            response_score = question.get_response_score()
-            if response_score is not None:
-                wc = response_score * question.importance_score
-                total_response_score += response_score
-                total_weighted_score += wc
+        answered: list[tuple[str, float]] = []  # (qid, normalized_weighted_contribution)
+        for qid, wc in zip(self.question_ids, weighted_contributions):
+            if not math.isnan(wc):
                 if wc > 0:
                     norm_denominator = max_weighted_score
                 else:
@@ -152,57 +268,237 @@ class QuestionScoringCollection(BaseModel):
                 answered.append((qid, wc / norm_denominator))
 
         # If the weighted average score is greater than 0, normalize by the maximum weighted raw score
-        if total_weighted_score > 0:
+        if weighted_score > 0:
             weighted_norm_denominator = max_weighted_score
         else:
             # If the weighted score is less than 0, normalize by the minimum weighted score, but keep the negative sign
             weighted_norm_denominator = abs(min_weighted_score)
 
         return ScoreResult(
-            weighted_score=total_weighted_score,
-            normalized_weighted_score=total_weighted_score / weighted_norm_denominator,
-            raw_response_score=total_response_score,
+            weighted_score=weighted_score,
+            normalized_weighted_score=weighted_score / weighted_norm_denominator,
+            raw_response_score=raw_score,
             max_weighted_score=max_weighted_score,
             min_weighted_score=min_weighted_score,
             question_contributions=answered,
+            breakdown=ContributionBreakdown.partition(answered),
+        )
+
+    def score(self, responses: Mapping[str, str | float]) -> ScoreResult:
+        """Score a response set with a full pass over the plan's questions.
+
+        Args:
+            responses: mapping of question ids to user responses
+
+        Returns:
+            ScoreResult: the weighted, normalized weighted, raw score, and per-question contributions
+        """
+        total_weighted_score = 0.0
+        total_response_score = 0.0
+        weighted_contributions = []
+        for weight, response_score in zip(self.weights, self.response_scores(responses)):
+            if response_score is None:
+                weighted_contributions.append(math.nan)
+            else:
+                wc = response_score * weight
+                total_response_score += response_score
+                total_weighted_score += wc
+                weighted_contributions.append(wc)
+        return self.score_result(weighted_contributions, total_weighted_score, total_response_score)
+
+    def response_scores(self, responses: Mapping[str, str | float]) -> list[Optional[float]]:
+        """Scores of the responses to the plan's questions, None where unanswered.
+
+        Args:
+            responses: mapping of question ids to user responses, or a ResponseStore which is read directly
+
+        Returns:
+            list[Optional[float]]: response score of each question in plan order
+        """
+        if isinstance(responses, ResponseStore):
+            return responses.get_scores(self.question_ids)
+
+        response_scores = []
+        for qid, option_scores, is_range in zip(self.question_ids, self.option_scores, self.is_range):
+            user_response = responses.get(qid)
+            if user_response is None:
+                response_scores.append(None)
+            else:
+                # For range questions, the response itself is the score
+                response_scores.append(float(user_response) if is_range else option_scores.get(user_response))
+        return response_scores
+
+
+class QuestionScoringCollection(BaseModel):
+    """
+    Represents a collection of questions with scoring logic.
+
+    Currently uses uniform weighting for question importance,
+    but designed to be extensible for custom weighting strategies.
+    """
+
+    header: str | None = None
+    """Brief description of the purpose for these questions"""
+    question_ids: list[str]
+    """List of question ids to be used for scoring"""
+    thresholds: list[ThresholdResponse] | None = None
+    """Define the responses that are triggered for various possible scores ranges"""
+
+    _plan: ScoringPlan | None = PrivateAttr(default=None)
+    _plan_lookup: Mapping[str, Question] | None = PrivateAttr(default=None)
+    _threshold_boundaries: tuple[float, ...] = PrivateAttr(default=())
+
+    @model_validator(mode="after")
+    def index_thresholds(self) -> "QuestionScoringCollection":
+        """Sorts thresholds by lower bound and compiles their boundaries for bisect lookup.
+
+        Raises:
+            ValueError: If a threshold is empty or the [lower, upper) intervals of the thresholds
+                leave a gap or overlap
+        """
+        if not self.thresholds:
+            return self
+
+        self.thresholds = sorted(self.thresholds, key=lambda x: x.lower)
+        for threshold in self.thresholds:
+            if not threshold.lower < threshold.upper:
+                raise ValueError(
+                    f"Threshold '{threshold.header}' has lower bound {threshold.lower} not below upper bound {threshold.upper}"
+                )
+        for previous, following in zip(self.thresholds, self.thresholds[1:]):
+            if previous.upper < following.lower:
+                raise ValueError(
+                    f"Thresholds '{previous.header}' and '{following.header}' leave a gap between {previous.upper} and {following.lower}"
+                )
+            if previous.upper > following.lower:
+                raise ValueError(
+                    f"Thresholds '{previous.header}' and '{following.header}' overlap between {following.lower} and {previous.upper}"
+                )
+
+        self._threshold_boundaries = tuple(t.lower for t in self.thresholds) + (self.thresholds[-1].upper,)
+        return self
+
+    @property
+    def threshold_boundaries(self) -> tuple[float, ...]:
+        """Sorted interval boundaries of the thresholds: the lower bound of every threshold followed by
+        the upper bound of the last one. Empty if the collection has no thresholds."""
+        return self._threshold_boundaries
+
+    def get_scoring_plan(self, question_lookup: Mapping[str, Question]) -> ScoringPlan:
+        """Returns the compiled scoring plan for this collection, compiling it on first use.
+        The plan is rebuilt if a different question lookup is passed in.
+
+        Args:
+            question_lookup: dictionary for looking up questions by question id
+
+        Returns:
+            ScoringPlan: extremes, weights and option score tables for this collection's questions
+        """
+        if self._plan is None or self._plan_lookup is not question_lookup:
+            self._plan = ScoringPlan.compile(self.question_ids, question_lookup)
+            self._plan_lookup = question_lookup
+        return self._plan
+
+    def calculate_score(
+        self, question_lookup: Mapping[str, Question], responses: Mapping[str, str | float]
+    ) -> ScoreResult:
+        """Calculates the raw and weighted score of the responses to the questions.
+
+        A ResponseStore is scored from its running totals for this collection, which it keeps up to date as
+        responses change, with the store's importance overrides applied. Any other mapping is scored with a full
+        pass. With SCORE_CONSISTENCY_CHECK enabled, results from running totals are compared against a full pass.
+
+        Args:
+            question_lookup: dictionary for looking up questions by question id
+            responses: the session's response overlay, mapping question ids to user responses
+
+        Returns:
+            ScoreResult: the weighted, normalized weighted, raw score, and per-question contributions
+
+        Raises:
+            RuntimeError: If the consistency check is enabled and the running totals disagree with a full pass
+        """
+        plan = self.get_scoring_plan(question_lookup)
+        if not isinstance(responses, ResponseStore):
+            return plan.score(responses)
+
+        totals = responses.totals.get(self, plan)
+        if totals is None:
+            totals = self._track_totals(question_lookup, plan, responses)
+        if totals.result is None:
+            totals.result = totals.plan.score_result(
+                totals.weighted_contributions, totals.weighted_score, totals.raw_score
+            )
+        if SCORE_CONSISTENCY_CHECK:
+            self._check_totals(totals, responses)
+        return totals.result
+
+    def _track_totals(
+        self, question_lookup: Mapping[str, Question], plan: ScoringPlan, responses: ResponseStore
+    ) -> CollectionTotals:
+        """Start keeping running totals of this collection in a response store"""
+        importance_overrides = responses.importance_overrides
+        scoring_plan = plan
+        if importance_overrides and any(qid in importance_overrides for qid in self.question_ids):
+            # Weights changed in this session, so the cached plan's weights and extremes don't apply
+            scoring_plan = ScoringPlan.compile(self.question_ids, question_lookup, importance_overrides)
+        positions = responses.index.positions
+        return responses.totals.track(
+            self,
+            plan,
+            scoring_plan,
+            [positions.get(qid) for qid in scoring_plan.question_ids],
+            scoring_plan.response_scores(responses),
         )
 
+    def _check_totals(self, totals: CollectionTotals, responses: ResponseStore) -> None:
+        """Compare a result from running totals against a full pass over the responses"""
+        expected = totals.plan.score(responses)
+        result = totals.result
+        consistent = (
+            all(
+                math.isclose(getattr(result, field), getattr(expected, field), rel_tol=1e-9, abs_tol=1e-9)
+                for field in ("weighted_score", "normalized_weighted_score", "raw_response_score")
+            )
+            and [qid for qid, _ in result.question_contributions] == [qid for qid, _ in expected.question_contributions]
+            and all(
+                math.isclose(actual, full, rel_tol=1e-9, abs_tol=1e-9)
+                for (_, actual), (_, full) in zip(result.question_contributions, expected.question_contributions)
+            )
+        )
+        if not consistent:
+            raise RuntimeError(
+                f"Running score totals disagree with a full recompute: {result.model_dump()} != {expected.model_dump()}"
+            )
+
     def get_score_response(self, score: float) -> ThresholdResponse | None:
-        if self.thresholds is None:
-            return None
+        """Finds the threshold whose [lower, upper) range contains the score.
 
-        for bucket in self.thresholds:
-            # Check if the score is within the range [lower, upper)
-            lower_bound = bucket.lower
-            upper_bound = bucket.upper
+        Args:
+            score: the normalized weighted score
 
-            if lower_bound <= score < upper_bound:
-                return bucket
+        Returns:
+            ThresholdResponse | None: the matching threshold, or None if the collection has no thresholds
+                or the score is outside of all of them
+        """
+        boundaries = self._threshold_boundaries
+        if not boundaries or not boundaries[0] <= score < boundaries[-1]:
+            return None
 
-        return None
+        return self.thresholds[bisect.bisect_right(boundaries, score) - 1]
 
-    def get_extreme_score(self, question_lookup: dict[str, Question], is_min=False) -> tuple[float, float]:
+    def get_extreme_score(self, question_lookup: Mapping[str, Question], is_min=False) -> tuple[float, float]:
         """Returns the maxmimum (default) or minimum (is_min=True) scores possible as the raw value or final weighted value taking into account question importance weight for this set of questions.
 
         Args:
-            question_lookup: question_lookup: dictionary for looking up questions and responses by question id
+            question_lookup: question_lookup: dictionary for looking up questions by question id
             is_min: Set to True to return the minimum, rather than maximum values. Defaults to False.
 
         Returns:
             tuple[float, float]: the raw extreme value, the weighted extreme value taking into account
                 question importance
         """
-        final_raw_score = 0.0
-        final_weighted_score = 0.0
-        for qid in self.question_ids:
-            question = question_lookup[qid]
-            score_options = [score for _, score in question.answer_options]
-            if is_min:
-                extreme_response_score = min(score_options)
-            else:
-                extreme_response_score = max(score_options)
-
-            final_raw_score += extreme_response_score
-            final_weighted_score += extreme_response_score * question.importance_score
-
-        return final_raw_score, final_weighted_score
+        plan = self.get_scoring_plan(question_lookup)
+        if is_min:
+            return plan.min_raw_score, plan.min_weighted_score
+        return plan.max_raw_score, plan.max_weighted_score
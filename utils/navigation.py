@@ -6,8 +6,9 @@ from pathlib import Path
 
 import streamlit as st
 
-from utils.config import QUESTIONS_CACHE_KEY
+from utils.loader import restore_session, session_query_params
 from utils.question_renderer import question_interaction_section
+from utils.timing import rerun_scope, span
 
 
 # Define page order
@@ -45,7 +46,7 @@ def add_navigation_buttons(current_page_name: str):
         if current_index > 0:
             previous_page = PAGES[current_index - 1]
             if st.button("← Back", width="content", type="primary"):
-                st.switch_page(previous_page["path"])
+                st.switch_page(previous_page["path"], query_params=session_query_params())
 
     with col3:
         # Show Next button if not on last page
@@ -56,18 +57,20 @@ def add_navigation_buttons(current_page_name: str):
             else:
                 next_button_text = "Next →"
             if st.button(next_button_text, width="content", type="primary"):
-                st.switch_page(next_page["path"])
+                st.switch_page(next_page["path"], query_params=session_query_params())
 
 
 def add_question_page(page_title: str, page_intro_text: str, questions_path: Path):
-    # Redirect to Introduction page on uninitialized app
-    if st.session_state.get(QUESTIONS_CACHE_KEY) is None:
+    # Redirect to Introduction page on uninitialized app, unless the session can be restored
+    if not restore_session():
         st.switch_page("Introduction.py")
 
-    st.title(page_title)
-    st.write(page_intro_text)
+    with rerun_scope(page_title):
+        st.title(page_title)
+        st.write(page_intro_text)
 
-    question_interaction_section(questions_path)
+        question_interaction_section(questions_path)
 
-    # Add navigation buttons
-    add_navigation_buttons(page_title)
+        # Add navigation buttons
+        with span("navigation_buttons"):
+            add_navigation_buttons(page_title)
@@ -0,0 +1,241 @@
+"""
+Mergeable streaming quantile sketches of the scores of all completed assessments.
+
+Each scoring collection has a KLL sketch of its normalized weighted scores. A KLL sketch keeps a few
+hundred values in levels of compactors: values at level h stand for 2**h observations, and a full level is
+sorted and every other value moves up a level. Memory stays bounded however many scores are added, rank
+queries are accurate to about 1% of the cohort, and two sketches merge by concatenating their levels.
+
+Each app process keeps the sketches loaded from disk plus the scores it added since, and periodically merges
+those into the file on disk under a file lock, so all processes share one cohort.
+"""
+
+import bisect
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock, concurrent persists can drop each other's updates but never corrupt the file
+    fcntl = None
+
+DEFAULT_K = 200
+# Each level can hold at most this fraction of the capacity of the level above it
+CAPACITY_DECAY = 2 / 3
+# Scores added by this process are merged into the shared file at most this often
+PERSIST_INTERVAL_SECONDS = 30.0
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch of a stream of floats.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: int | None = None):
+        """
+        Args:
+            k: size of the top level compactor, larger is more accurate and uses more memory
+            seed: seed for the random choices when compacting, for reproducible sketches
+        """
+        self.k = k
+        self.n = 0
+        """Number of values added"""
+        self.compactors: list[list[float]] = [[]]
+        """Values of each level, values at level h stand for 2**h observations"""
+        self._rng = random.Random(seed)
+        # Sorted values and the total weight of all values up to each of them, rebuilt on the next query
+        self._values: list[float] | None = None
+        self._cumulative_weights: list[int] = []
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, math.ceil(self.k * CAPACITY_DECAY**depth))
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _compress(self) -> None:
+        """Compact full levels until the sketch is within its size budget"""
+        while self._size() >= self._max_size():
+            for level, compactor in enumerate(self.compactors):
+                if len(compactor) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                compactor.sort()
+                # An odd value out stays at this level, every other of the rest moves up with double weight
+                leftover = [compactor.pop()] if len(compactor) % 2 else []
+                offset = self._rng.randrange(2)
+                self.compactors[level + 1].extend(compactor[offset::2])
+                self.compactors[level] = leftover
+                break
+
+    def update(self, value: float) -> None:
+        """Add a value to the sketch."""
+        self.compactors[0].append(float(value))
+        self.n += 1
+        self._values = None
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def extend(self, values: Iterable[float]) -> None:
+        """Add several values to the sketch."""
+        for value in values:
+            self.update(value)
+
+    def merge(self, other: "KLLSketch") -> None:
+        """Add all values summarized by another sketch to this one."""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.n += other.n
+        self._values = None
+        self._compress()
+
+    def _build_cdf(self) -> None:
+        weighted = sorted((value, 1 << level) for level, compactor in enumerate(self.compactors) for value in compactor)
+        self._values = [value for value, _ in weighted]
+        self._cumulative_weights = []
+        total = 0
+        for _, weight in weighted:
+            total += weight
+            self._cumulative_weights.append(total)
+
+    def rank(self, value: float) -> float:
+        """Estimated share of the added values that are strictly less than a value, in O(log k) after the first query
+        following an update.
+
+        Returns:
+            float: share between 0 and 1, NaN if the sketch is empty
+        """
+        if self._values is None:
+            self._build_cdf()
+        if not self._values:
+            return math.nan
+        index = bisect.bisect_left(self._values, value)
+        below = self._cumulative_weights[index - 1] if index else 0
+        return below / self._cumulative_weights[-1]
+
+    def quantile(self, share: float) -> float:
+        """Estimated value below which the given share of the added values lie, NaN if the sketch is empty."""
+        if self._values is None:
+            self._build_cdf()
+        if not self._values:
+            return math.nan
+        index = bisect.bisect_left(self._cumulative_weights, share * self._cumulative_weights[-1])
+        return self._values[min(index, len(self._values) - 1)]
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "compactors": self.compactors}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch.n = data["n"]
+        sketch.compactors = [list(map(float, compactor)) for compactor in data["compactors"]] or [[]]
+        return sketch
+
+
+class CohortSketches:
+    """
+    Score sketches of all scoring collections, shared by the sessions of one process and
+    merged with the other processes through a file.
+    """
+
+    def __init__(self, path: Path, persist_interval: float = PERSIST_INTERVAL_SECONDS):
+        """
+        Args:
+            path: JSON file the sketches are persisted to
+            persist_interval: minimum number of seconds between merges into the file
+        """
+        self.path = path
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        # Sketches of the whole cohort as known to this process: the file at the last merge plus the pending scores
+        self._sketches: dict[str, KLLSketch] = self._read()
+        # Scores added by this process that are not in the file yet
+        self._pending: dict[str, KLLSketch] = {}
+        self._last_persist = time.monotonic()
+
+    def _read(self) -> dict[str, KLLSketch]:
+        try:
+            data = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+        return {name: KLLSketch.from_dict(sketch) for name, sketch in data.items()}
+
+    def add(self, scores: dict[str, float]) -> None:
+        """Add the scores of one completed assessment by collection name, and merge them into the file if it's time.
+
+        Args:
+            scores: normalized weighted score by collection name, NaN scores are skipped
+        """
+        with self._lock:
+            for name, score in scores.items():
+                if math.isnan(score):
+                    continue
+                self._sketches.setdefault(name, KLLSketch()).update(score)
+                self._pending.setdefault(name, KLLSketch()).update(score)
+            due = time.monotonic() - self._last_persist >= self.persist_interval
+        if due:
+            self.persist()
+
+    def persist(self) -> None:
+        """Merge the pending scores into the file under an exclusive file lock, and reload the cohort from it."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_persist = time.monotonic()
+
+        if not pending:
+            # Nothing to merge, just pick up the scores other processes merged since
+            merged = self._read()
+        else:
+            merged = self._merge_into_file(pending)
+
+        with self._lock:
+            # Scores added while merging are still pending, keep them in this process's view of the cohort
+            for name, sketch in self._pending.items():
+                merged.setdefault(name, KLLSketch()).merge(sketch)
+            self._sketches = merged
+
+    def _merge_into_file(self, pending: dict[str, KLLSketch]) -> dict[str, KLLSketch]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        lock_fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            merged = self._read()
+            for name, sketch in pending.items():
+                merged.setdefault(name, KLLSketch()).merge(sketch)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps({name: sketch.to_dict() for name, sketch in merged.items()}))
+            os.replace(tmp_path, self.path)
+        finally:
+            # Closing the file releases the lock
+            os.close(lock_fd)
+        return merged
+
+    def cohort_size(self, name: str) -> int:
+        """Number of scores in a collection's cohort."""
+        sketch = self._sketches.get(name)
+        return sketch.n if sketch is not None else 0
+
+    def share_below(self, name: str, score: float) -> float:
+        """Estimated share of the cohort of a collection that scored lower than a score, NaN if the cohort is empty."""
+        if time.monotonic() - self._last_persist >= self.persist_interval:
+            self.persist()
+        with self._lock:
+            sketch = self._sketches.get(name)
+            return sketch.rank(score) if sketch is not None else math.nan
@@ -2,12 +2,25 @@
 Utility functions for rendering questions in Streamlit with tooltip support.
 """
 
-import pandas as pd
+import threading
 import streamlit as st
-from typing import Optional
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
 
-from utils.loader import load_question_collection
-from utils.config import QUESTIONS_CACHE_KEY
+from utils.loader import load_question_bank, load_question_collection, save_responses
+from utils.config import RESPONSES_CACHE_KEY
+from utils.models import ContributionBreakdown, Question, QuestionScoringCollection
+from utils.response_store import ResponseStore
+from utils.timing import rerun_scope, span
+
+if TYPE_CHECKING:
+    # pandas is only needed on the Results page, so it is imported when a table is built
+    import pandas as pd
+
+# Number of collections' contribution tables kept by the process-level cache
+CONTRIBUTION_TABLES_CACHE_SIZE = 4096
 
 
 def render_question_with_help(question_id: str) -> Optional[str | float]:
@@ -16,14 +29,14 @@ def render_question_with_help(question_id: str) -> Optional[str | float]:
     Returns the response currently selected by the user
 
     Args:
-        question: The Question object to render
+        question_id: Id of the question in the shared question bank to render
 
     Returns:
         The user's response (str for categorical, float for range)
     """
-    # Get current value from session state or use default
-    question = st.session_state[QUESTIONS_CACHE_KEY].get(question_id, None)
-    current_value = question.user_response
+    # Question details come from the shared bank, the current value from this session's responses
+    question = load_question_bank()[question_id]
+    current_value = st.session_state[RESPONSES_CACHE_KEY].get(question_id)
 
     # Render appropriate input widget based on question type
     if question.question_type == "categorical":
@@ -64,21 +77,24 @@ def render_question_with_help(question_id: str) -> Optional[str | float]:
 
 
 def build_contributions_table(
-    contributions: list[tuple[str, float]], question_lookup: dict
-) -> pd.DataFrame:
+    contributions: list[tuple[str, float]], question_lookup: Mapping[str, Question], responses: Mapping[str, str | float]
+) -> "pd.DataFrame":
     """Build a DataFrame of question contributions for display in the scoring breakdown table.
 
     Args:
         contributions: list of (question_id, raw_weighted_contribution) pairs
         question_lookup: dictionary for looking up Question objects by question id
+        responses: the session's response overlay, mapping question ids to user responses
 
     Returns:
         DataFrame with columns: Question, Your answer, Description, Score Contribution
     """
+    import pandas as pd
+
     return pd.DataFrame([
         {
             "Question": question_lookup[qid].question_text,
-            "Your answer": question_lookup[qid].user_response,
+            "Your answer": responses.get(qid),
             "Description": question_lookup[qid].description,
             "Score Contribution": round(score, 2),
         }
@@ -86,12 +102,102 @@ def build_contributions_table(
     ])
 
 
+@dataclass
+class ContributionTablesCacheStats:
+    """Counters for the process-level cache of contribution tables"""
+
+    hits: int = 0
+    """Number of lookups that reused the tables of an unchanged set of answers"""
+    misses: int = 0
+    """Number of lookups that built new tables"""
+
+
+# (id of the collection, fingerprint of its responses) -> (collection, question bank, tables by contribution group)
+_contribution_tables: OrderedDict[
+    tuple[int, tuple], tuple[QuestionScoringCollection, Mapping[str, Question], dict[str, "pd.DataFrame"]]
+] = OrderedDict()
+_contribution_tables_lock = threading.Lock()
+contribution_tables_cache_stats = ContributionTablesCacheStats()
+
+
+def get_contribution_tables(
+    collection: QuestionScoringCollection,
+    breakdown: ContributionBreakdown,
+    question_lookup: Mapping[str, Question],
+    responses: ResponseStore,
+) -> dict[str, "pd.DataFrame"]:
+    """Contribution tables of a collection's score breakdown, reused while the collection's answers don't change.
+
+    Tables are cached for the whole process and shared by all sessions under the fingerprint of the collection's
+    answers and importance overrides, so they must not be modified. The least recently used tables are dropped
+    once CONTRIBUTION_TABLES_CACHE_SIZE collections are cached.
+
+    Args:
+        collection: the scored collection
+        breakdown: the breakdown of the collection's score for these responses
+        question_lookup: dictionary for looking up Question objects by question id
+        responses: the session's response store
+
+    Returns:
+        dict[str, pd.DataFrame]: the table of each nonempty group of the breakdown, keyed "positive", "negative"
+            and "neutral" in that order, rows sorted as in the breakdown
+    """
+    key = (id(collection), responses.fingerprint(collection.question_ids))
+    with _contribution_tables_lock:
+        cached = _contribution_tables.get(key)
+        # The cached collection keeps its id from being reused, the question bank changes when it is reloaded
+        if cached is not None and cached[0] is collection and cached[1] is question_lookup:
+            _contribution_tables.move_to_end(key)
+            contribution_tables_cache_stats.hits += 1
+            return cached[2]
+
+    tables = {
+        group: build_contributions_table(contributions, question_lookup, responses)
+        for group, contributions in [
+            ("positive", breakdown.positive),
+            ("negative", breakdown.negative),
+            ("neutral", breakdown.neutral),
+        ]
+        if contributions
+    }
+    with _contribution_tables_lock:
+        contribution_tables_cache_stats.misses += 1
+        _contribution_tables[key] = (collection, question_lookup, tables)
+        _contribution_tables.move_to_end(key)
+        while len(_contribution_tables) > CONTRIBUTION_TABLES_CACHE_SIZE:
+            _contribution_tables.popitem(last=False)
+    return tables
+
+
+@st.fragment
+def question_fragment(question_id: str):
+    """
+    Renders one question in its own rerun scope and stores its response.
+    Interacting with the question's widget only reruns this function, so the rest of the page is neither
+    re-executed nor re-sent, and interaction latency doesn't grow with the number of questions on the page.
+
+    Args:
+        question_id: Id of the question in the shared question bank to render
+    """
+    with rerun_scope("question_fragment", show_panel=False), span("render_question"):
+        response = render_question_with_help(question_id)
+        # Widget values are validated once here, when they enter the response store.
+        # The store lives in session state, so navigation and the Results page see the change without a full rerun.
+        responses = st.session_state[RESPONSES_CACHE_KEY]
+        previous = responses.get(question_id)
+        responses.set_response(question_id, response)
+        # Only actual changes reach the response backend, not every rerun of the question
+        if responses.get(question_id) != previous:
+            save_responses({question_id: responses.get(question_id)})
+
+
 def question_interaction_section(question_collection_path):
-    question_collection = load_question_collection(str(question_collection_path))
+    with span("load_question_collection"):
+        question_collection = load_question_collection(str(question_collection_path))
 
     # Render questions with tooltip support
-    st.markdown("---")
-    for qid in question_collection.question_ids:
-        response = render_question_with_help(qid)
-        st.session_state[QUESTIONS_CACHE_KEY][qid].user_response = response
+    with span("render_questions"):
         st.markdown("---")
+        for qid in question_collection.question_ids:
+            question_fragment(qid)
+            st.markdown("---")
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Backends keeping each session's responses outside of the Streamlit process.
+
+By default responses only live in the session state of the process serving the session. With
+RESPONSE_BACKEND=sqlite, every answer change is also saved to a SQLite database that all app processes on a
+host share, keyed by a session id carried in the page's query parameters. A session that reconnects to another
+replica, or to the same one after a restart, is restored from the database.
+
+Saving doesn't write to the database: changes are queued, repeated changes to the same answer are merged,
+and a background thread commits all queued changes in one transaction every fraction of a second. The database
+runs in WAL mode, so replicas can read while another one commits, and each process reuses a small pool of
+connections.
+
+Usage:
+    python -m utils.response_backend bench --sessions 500 --changes 40 --concurrency 32
+    python -m utils.response_backend bench --replicas 4
+    python -m utils.response_backend prune --days 30
+
+Options:
+    --db PATH: SQLite database (default: data/responses.sqlite3, bench: a temporary file)
+    --sessions N: bench: number of simulated sessions (default: 500)
+    --changes N: bench: answer changes per session (default: 40)
+    --concurrency N: bench: sessions answering at the same time per replica (default: 32)
+    --replicas N: bench: number of app processes sharing the database (default: 1)
+    --days N: prune: delete sessions that haven't changed an answer for this many days (default: 30)
+"""
+
+import argparse
+import logging
+import math
+import multiprocessing
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from utils.config import QUESTIONS_PATH, RESPONSE_DB_PATH
+
+DEFAULT_POOL_SIZE = 4
+# Queued changes are committed at least this often, and as soon as this many are queued
+DEFAULT_FLUSH_INTERVAL = 0.2
+DEFAULT_MAX_BATCH = 500
+# Seconds to wait for another process's write transaction before giving up
+BUSY_TIMEOUT = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    session_id TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    response,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (session_id, question_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_updated_at ON responses (updated_at);
+"""
+# The response column has no declared type, so SQLite keeps option texts as TEXT and range answers as REAL
+UPSERT = """
+INSERT INTO responses (session_id, question_id, response, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (session_id, question_id) DO UPDATE SET response = excluded.response, updated_at = excluded.updated_at
+"""
+DELETE = "DELETE FROM responses WHERE session_id = ? AND question_id = ?"
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseBackend:
+    """
+    Where sessions' responses are kept besides the Streamlit session state.
+    This base backend keeps nothing, so responses only live in the session state of one process.
+    """
+
+    persistent = False
+    """Whether sessions can be restored from this backend in another process"""
+
+    def load(self, session_id: str) -> dict[str, str | float]:
+        """Responses saved for a session by question id, empty if there are none."""
+        return {}
+
+    def save(self, session_id: str, responses: Mapping[str, str | float | None]) -> None:
+        """Save changed responses of a session, None for answers that were cleared."""
+
+    def flush(self) -> None:
+        """Write all saved responses through to storage."""
+
+    def close(self) -> None:
+        """Flush and release the backend's resources."""
+
+
+@dataclass
+class BackendStats:
+    """Counters of a write-behind backend"""
+
+    saves: int = 0
+    """Number of response changes saved"""
+    rows_written: int = 0
+    """Number of rows upserted or deleted, lower than `saves` when changes to the same answer were merged"""
+    transactions: int = 0
+    """Number of write transactions committed"""
+
+
+class SQLiteResponseBackend(ResponseBackend):
+    """
+    Responses in a SQLite database shared by the app processes of one host, written behind in batches.
+    """
+
+    persistent = True
+
+    def __init__(
+        self,
+        path: Path,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_batch: int = DEFAULT_MAX_BATCH,
+    ):
+        """
+        Args:
+            path: SQLite database file, created if it doesn't exist
+            pool_size: number of connections reused by this process
+            flush_interval: maximum number of seconds a saved change waits before it is committed
+            max_batch: number of queued changes that triggers a commit before the interval is over
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.stats = BackendStats()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+        # Changes waiting to be committed, and the batch that is being committed, by (session id, question id)
+        self._pending: dict[tuple[str, str], str | float | None] = {}
+        self._committing: dict[tuple[str, str], str | float | None] = {}
+        self._pending_lock = threading.Lock()
+        # Batches are committed one at a time, so a later change is never overwritten by an earlier one
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_behind, name="response-backend-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Transactions are started explicitly, and pooled connections are handed between threads
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, NORMAL only syncs at checkpoints: a power loss can lose the last commits, never corrupt
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        connection = self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    def load(self, session_id: str) -> dict[str, str | float]:
+        with self._connection() as connection:
+            rows = connection.execute(
+                "SELECT question_id, response FROM responses WHERE session_id = ?", (session_id,)
+            ).fetchall()
+        responses: dict[str, str | float | None] = dict(rows)
+        # Changes this process hasn't committed yet are newer than the database
+        with self._pending_lock:
+            for changes in (self._committing, self._pending):
+                for (change_session_id, question_id), response in changes.items():
+                    if change_session_id == session_id:
+                        responses[question_id] = response
+        return {question_id: response for question_id, response in responses.items() if response is not None}
+
+    def save(self, session_id: str, responses: Mapping[str, str | float | None]) -> None:
+        with self._pending_lock:
+            for question_id, response in responses.items():
+                self._pending[(session_id, question_id)] = response
+            self.stats.saves += len(responses)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+                self._committing = batch
+            if not batch:
+                return
+            now = time.time()
+            upserts = [(s, q, response, now) for (s, q), response in batch.items() if response is not None]
+            deletes = [key for key, response in batch.items() if response is None]
+            try:
+                with self._connection() as connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    try:
+                        connection.executemany(UPSERT, upserts)
+                        connection.executemany(DELETE, deletes)
+                        connection.execute("COMMIT")
+                    except BaseException:
+                        connection.execute("ROLLBACK")
+                        raise
+            except Exception:
+                # Requeue the batch for the next flush, without overwriting changes saved since
+                with self._pending_lock:
+                    self._pending = {**batch, **self._pending}
+                    self._committing = {}
+                raise
+            with self._pending_lock:
+                self._committing = {}
+                self.stats.rows_written += len(batch)
+                self.stats.transactions += 1
+
+    def _write_behind(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # The writer must keep running, or every later change would only pile up in the pending batch
+                logger.exception("Could not write responses to %s, retrying", self.path)
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Delete the responses of sessions that haven't changed an answer for a while.
+
+        Args:
+            max_age_seconds: minimum number of seconds since a session's last change
+
+        Returns:
+            int: number of deleted sessions
+        """
+        cutoff = time.time() - max_age_seconds
+        with self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                stale = connection.execute(
+                    "SELECT session_id FROM responses GROUP BY session_id HAVING MAX(updated_at) < ?", (cutoff,)
+                ).fetchall()
+                connection.executemany("DELETE FROM responses WHERE session_id = ?", stale)
+                connection.execute("COMMIT")
+            except BaseException:
+                # The connection goes back to the pool, it must not keep the write lock
+                connection.execute("ROLLBACK")
+                raise
+        return len(stale)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+        while not self._pool.empty():
+            self._pool.get().close()
+
+
+@dataclass
+class ReplicaResult:
+    """Load test results of one simulated app process"""
+
+    save_latencies: list[float]
+    """Seconds each save call took, as seen by the session"""
+    elapsed: float
+    """Seconds until all sessions finished answering"""
+    drained: float
+    """Seconds until all saved changes were committed"""
+    stats: BackendStats
+    mismatched_sessions: int
+    """Sessions whose responses loaded back from the database differ from their last answers"""
+
+
+def simulate_replica(
+    db_path: Path,
+    session_ids: list[str],
+    answer_options: list[tuple[str, list[str | float]]],
+    changes_per_session: int,
+    concurrency: int,
+    synchronous: bool,
+    seed: int,
+) -> ReplicaResult:
+    """Answer random questions from many concurrent sessions through one backend, like one app process would.
+
+    Args:
+        db_path: SQLite database shared by the replicas
+        session_ids: sessions served by this replica
+        answer_options: question ids with the answers to pick from
+        changes_per_session: number of answer changes per session
+        concurrency: number of sessions answering at the same time
+        synchronous: commit each change before the save returns, instead of writing behind
+        seed: seed for the random answers
+
+    Returns:
+        ReplicaResult: latencies, throughput counters and the consistency check of this replica
+    """
+    backend = SQLiteResponseBackend(db_path)
+    expected: dict[str, dict[str, str | float]] = {}
+
+    def run_session(session_index: int) -> list[float]:
+        session_id = session_ids[session_index]
+        rng = random.Random(seed * 1_000_003 + session_index)
+        answers: dict[str, str | float] = {}
+        latencies = []
+        for _ in range(changes_per_session):
+            question_id, options = rng.choice(answer_options)
+            answers[question_id] = rng.choice(options)
+            start = time.perf_counter()
+            backend.save(session_id, {question_id: answers[question_id]})
+            if synchronous:
+                backend.flush()
+            latencies.append(time.perf_counter() - start)
+        expected[session_id] = answers
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = [latency for session in executor.map(run_session, range(len(session_ids))) for latency in session]
+    elapsed = time.perf_counter() - start
+    backend.close()
+    drained = time.perf_counter() - start
+
+    # A fresh backend only sees what was committed
+    check = SQLiteResponseBackend(db_path)
+    mismatched = sum(check.load(session_id) != answers for session_id, answers in expected.items())
+    check.close()
+    return ReplicaResult(latencies, elapsed, drained, backend.stats, mismatched)
+
+
+def _simulate_replica(args: tuple) -> ReplicaResult:
+    return simulate_replica(*args)
+
+
+def run_load_test(
+    db_path: Path, n_sessions: int, changes_per_session: int, concurrency: int, n_replicas: int, synchronous: bool
+) -> None:
+    """Simulate sessions answering questions across replicas sharing one database and print write throughput."""
+    from utils.models import QuestionBank
+
+    questions = QuestionBank.model_validate_json(QUESTIONS_PATH.read_bytes()).questions
+    answer_options = [
+        (
+            question.question_id,
+            [text for text, _ in question.answer_options]
+            if question.question_type == "categorical"
+            else [float(score) for _, score in question.answer_options],
+        )
+        for question in questions
+    ]
+    session_ids = [f"{'sync' if synchronous else 'behind'}-{i:06d}" for i in range(n_sessions)]
+    replica_args = [
+        (db_path, session_ids[i::n_replicas], answer_options, changes_per_session, concurrency, synchronous, i)
+        for i in range(n_replicas)
+    ]
+    if n_replicas == 1:
+        results = [_simulate_replica(replica_args[0])]
+    else:
+        with multiprocessing.Pool(n_replicas) as pool:
+            results = pool.map(_simulate_replica, replica_args)
+
+    latencies = sorted(latency for result in results for latency in result.save_latencies)
+    elapsed = max(result.elapsed for result in results)
+    drained = max(result.drained for result in results)
+    saves = sum(result.stats.saves for result in results)
+    rows = sum(result.stats.rows_written for result in results)
+    transactions = sum(result.stats.transactions for result in results)
+    mismatched = sum(result.mismatched_sessions for result in results)
+
+    def percentile(p: int) -> float:
+        return latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)] * 1000
+
+    label = "synchronous" if synchronous else "write-behind"
+    print(
+        f"{label}: {saves} changes from {n_sessions} sessions on {n_replicas} replica(s) in {elapsed:.2f}s, "
+        f"{saves / elapsed:.0f} changes/s, save latency p50 {percentile(50):.3f} ms, p99 {percentile(99):.3f} ms"
+    )
+    print(
+        f"{label}: {rows} rows committed in {transactions} transactions, all committed after {drained:.2f}s, "
+        f"{mismatched} sessions loaded back differently"
+    )
+
+
+def main():
+    """Main function to load test or prune the SQLite response backend."""
+    parser = argparse.ArgumentParser(description="SQLite backend for session responses")
+    parser.add_argument("command", choices=["bench", "prune"], help="Load test the backend or delete stale sessions")
+    parser.add_argument(
+        "--db", type=Path, help="SQLite database (default: data/responses.sqlite3, bench: a temporary file)"
+    )
+    parser.add_argument("--sessions", type=int, default=500, help="bench: number of simulated sessions (default: 500)")
+    parser.add_argument("--changes", type=int, default=40, help="bench: answer changes per session (default: 40)")
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="bench: sessions answering at the same time per replica (default: 32)"
+    )
+    parser.add_argument(
+        "--replicas", type=int, default=1, help="bench: number of app processes sharing the database (default: 1)"
+    )
+    parser.add_argument(
+        "--days", type=float, default=30, help="prune: delete sessions unchanged for this many days (default: 30)"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        backend = SQLiteResponseBackend(args.db or RESPONSE_DB_PATH)
+        print(f"Deleted {backend.prune(args.days * 24 * 3600)} stale sessions")
+        backend.close()
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Each mode writes to its own database, so the second doesn't start with a larger table
+        for synchronous in (False, True):
+            db_path = args.db or Path(tmp_dir) / f"responses-{'sync' if synchronous else 'behind'}.sqlite3"
+            run_load_test(db_path, args.sessions, args.changes, args.concurrency, args.replicas, synchronous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Compact, URL-safe encoding of a response set for saving, resuming and sharing assessments.
+
+Layout of the encoded bytes:
+- 1 byte format version
+- 4 bytes of the SHA-256 hash of questions.json, so codes from a different question bank are rejected
+- a bit stream with one field per question in question bank order:
+  - categorical questions: 0 if unanswered, otherwise 1 + the option index, in the fewest bits that fit
+  - range questions: 0 if unanswered, otherwise the value quantized to 1..255 across the option score range
+
+The bytes are URL-safe base64 encoded without padding, so an assessment of a few dozen questions
+fits in a few dozen characters of a query parameter.
+"""
+
+import base64
+import binascii
+import hashlib
+from collections.abc import Mapping
+
+from utils.models import Question
+
+FORMAT_VERSION = 1
+BANK_HASH_BYTES = 4
+RANGE_BITS = 8
+RANGE_LEVELS = (1 << RANGE_BITS) - 2  # Quantization steps between the minimum and maximum, 0 means unanswered
+
+
+def question_bank_hash(questions_json: bytes) -> bytes:
+    """Short hash identifying a version of the question bank file."""
+    return hashlib.sha256(questions_json).digest()[:BANK_HASH_BYTES]
+
+
+class ResponseCodec:
+    """
+    Encodes and decodes response sets for one version of the question bank.
+
+    All per-question tables are compiled once, so encoding and decoding are a single pass over
+    the questions without any model validation.
+    """
+
+    def __init__(self, question_lookup: Mapping[str, Question], bank_hash: bytes):
+        """
+        Args:
+            question_lookup: dictionary for looking up questions by question id, in question bank order
+            bank_hash: hash of the question bank file from `question_bank_hash`
+        """
+        self.header = bytes([FORMAT_VERSION]) + bank_hash
+        self.question_ids = list(question_lookup)
+        self.option_texts = []
+        self.option_indices = []
+        self.ranges: list[tuple[float, float] | None] = []
+        self.widths = []
+        for question in question_lookup.values():
+            option_texts = [option_text for option_text, _ in question.answer_options]
+            self.option_texts.append(option_texts)
+            self.option_indices.append({text: i for i, text in reversed(list(enumerate(option_texts)))})
+            if question.question_type == "range":
+                scores = [score for _, score in question.answer_options]
+                self.ranges.append((min(scores), max(scores)))
+                self.widths.append(RANGE_BITS)
+            else:
+                self.ranges.append(None)
+                self.widths.append(len(option_texts).bit_length())
+
+    def encode(self, responses: Mapping[str, str | float]) -> str:
+        """Encode a response set as a URL-safe string.
+        Responses to questions that are not in the bank, or that are not valid options, are left out.
+
+        Args:
+            responses: mapping of question ids to user responses
+
+        Returns:
+            str: URL-safe base64 code of the responses
+        """
+        out = bytearray(self.header)
+        buffer = 0
+        n_bits = 0
+        for qid, width, option_indices, value_range in zip(
+            self.question_ids, self.widths, self.option_indices, self.ranges
+        ):
+            response = responses.get(qid)
+            field = 0
+            if response is not None:
+                if value_range is None:
+                    option_index = option_indices.get(response)
+                    field = 0 if option_index is None else option_index + 1
+                else:
+                    low, high = value_range
+                    fraction = (float(response) - low) / (high - low) if high > low else 0.0
+                    field = 1 + round(min(max(fraction, 0.0), 1.0) * RANGE_LEVELS)
+
+            buffer = (buffer << width) | field
+            n_bits += width
+            while n_bits >= 8:
+                n_bits -= 8
+                out.append((buffer >> n_bits) & 0xFF)
+            buffer &= (1 << n_bits) - 1
+
+        if n_bits:
+            out.append((buffer << (8 - n_bits)) & 0xFF)
+        return base64.urlsafe_b64encode(bytes(out)).rstrip(b"=").decode("ascii")
+
+    def decode(self, code: str) -> dict[str, str | float]:
+        """Decode a string from `encode` back into a response set.
+
+        Args:
+            code: URL-safe base64 code of the responses
+
+        Returns:
+            dict[str, str | float]: mapping of question ids to responses for the answered questions
+
+        Raises:
+            ValueError: If the code is malformed or was encoded for a different version of the question bank
+        """
+        try:
+            data = base64.urlsafe_b64decode(code + "=" * (-len(code) % 4))
+        except (binascii.Error, ValueError):
+            raise ValueError("Response code is not valid URL-safe base64") from None
+        if data[:1] != self.header[:1]:
+            raise ValueError("Response code has an unknown format version")
+        if data[: len(self.header)] != self.header:
+            raise ValueError("Response code was saved for a different version of the questions")
+        if (len(data) - len(self.header)) * 8 < sum(self.widths):
+            raise ValueError("Response code is too short for the questions")
+
+        responses: dict[str, str | float] = {}
+        stream = iter(data[len(self.header) :])
+        buffer = 0
+        n_bits = 0
+        for qid, width, option_texts, value_range in zip(
+            self.question_ids, self.widths, self.option_texts, self.ranges
+        ):
+            while n_bits < width:
+                buffer = (buffer << 8) | next(stream)
+                n_bits += 8
+            n_bits -= width
+            field = buffer >> n_bits
+            buffer &= (1 << n_bits) - 1
+
+            if field == 0:
+                continue
+            if value_range is None:
+                if field > len(option_texts):
+                    raise ValueError(f"Response code has an invalid option for question '{qid}'")
+                responses[qid] = option_texts[field - 1]
+            else:
+                low, high = value_range
+                responses[qid] = low + (field - 1) / RANGE_LEVELS * (high - low)
+        return responses
@@ -0,0 +1,477 @@
+"""
+Per-session store of question responses and importance overrides.
+
+Question ids are interned once per question bank into positions, and each session only keeps
+compact arrays indexed by those positions. Values are validated once when they are written, e.g. when
+widget values come in, so reading responses and scores back is plain array and tuple indexing.
+
+Each store also keeps running score totals for the scoring collections it has been scored against,
+so a single answer change only updates the collections containing that question.
+"""
+
+import math
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from utils.models import Question, QuestionScoringCollection, ScoreResult, ScoringPlan
+
+UNANSWERED = -1
+# Running totals are re-summed from the contributions after this many updates, bounding floating point drift
+RESUM_INTERVAL = 1024
+
+
+class QuestionIndex:
+    """
+    Question positions and answer option tables of a question bank.
+    Built once per process and shared read-only by every session's ResponseStore.
+    """
+
+    __slots__ = ("question_ids", "positions", "option_texts", "option_positions", "option_scores", "ranges", "importance_scores")
+
+    def __init__(self, question_lookup: Mapping[str, "Question"]):
+        """
+        Args:
+            question_lookup: dictionary for looking up questions by question id, in question bank order
+        """
+        self.question_ids: tuple[str, ...] = tuple(question_lookup)
+        """Question ids in question bank order"""
+        self.positions: dict[str, int] = {qid: i for i, qid in enumerate(self.question_ids)}
+        """Position of each question id"""
+        self.option_texts: tuple[tuple[str, ...], ...] = tuple(
+            tuple(option_text for option_text, _ in q.answer_options) for q in question_lookup.values()
+        )
+        """Answer option texts of each question"""
+        self.option_positions: tuple[dict[str, int], ...] = tuple(
+            {text: i for i, text in reversed(list(enumerate(texts)))} for texts in self.option_texts
+        )
+        """Lookup from option text to option index for each question, the first option wins if a text is repeated"""
+        self.option_scores: tuple[tuple[float, ...], ...] = tuple(
+            tuple(score for _, score in q.answer_options) for q in question_lookup.values()
+        )
+        """Answer option scores of each question"""
+        self.ranges: tuple[tuple[float, float] | None, ...] = tuple(
+            (min(scores), max(scores)) if q.question_type == "range" else None
+            for q, scores in zip(question_lookup.values(), self.option_scores)
+        )
+        """(minimum, maximum) value of range questions, None for categorical questions"""
+        self.importance_scores: tuple[float, ...] = tuple(q.importance_score for q in question_lookup.values())
+        """Default importance weight of each question"""
+
+    def __len__(self) -> int:
+        return len(self.question_ids)
+
+    def position(self, question_id: str) -> int:
+        """Position of a question id.
+
+        Raises:
+            ValueError: If the question id is not in the question bank
+        """
+        try:
+            return self.positions[question_id]
+        except KeyError:
+            raise ValueError(f"Question ID '{question_id}' not found in question bank") from None
+
+
+class CollectionTotals:
+    """Running totals of one scoring collection for one session"""
+
+    __slots__ = (
+        "collection",
+        "base_plan",
+        "plan",
+        "weighted_contributions",
+        "response_scores",
+        "weighted_score",
+        "raw_score",
+        "updates",
+        "result",
+    )
+
+    def __init__(
+        self,
+        collection: "QuestionScoringCollection",
+        base_plan: "ScoringPlan",
+        plan: "ScoringPlan",
+        response_scores: Sequence[Optional[float]],
+        weighted_contributions: Sequence[float] | None = None,
+        totals: tuple[float, float] | None = None,
+    ):
+        """
+        Args:
+            collection: the tracked scoring collection
+            base_plan: the collection's cached plan, used to detect a changed question bank
+            plan: the plan the totals are computed with, including the session's importance overrides
+            response_scores: current response score of each question in plan order, None where unanswered
+            weighted_contributions: optional precomputed weighted contribution of each question in plan order.
+                If given, unanswered questions must be NaN in both this and `response_scores`.
+            totals: optional precomputed (weighted, raw) totals of the answered questions, summed in plan order
+        """
+        self.collection = collection
+        self.base_plan = base_plan
+        self.plan = plan
+        # Response score and weighted contribution of each question in plan order, NaN where unanswered
+        if weighted_contributions is None:
+            self.response_scores = array("d", (math.nan if score is None else score for score in response_scores))
+            self.weighted_contributions = array(
+                "d",
+                (math.nan if score is None else score * weight for score, weight in zip(response_scores, plan.weights)),
+            )
+        else:
+            self.response_scores = array("d", response_scores)
+            self.weighted_contributions = array("d", weighted_contributions)
+        if totals is None:
+            self.resum()
+        else:
+            self.weighted_score, self.raw_score = totals
+            self.updates = 0
+        self.result: "ScoreResult | None" = None
+        """Score result built from the totals, None until it is requested after a change"""
+
+    def resum(self) -> None:
+        """Recompute the totals from the per-question contributions, in plan order like a full recompute"""
+        self.weighted_score = 0.0
+        self.raw_score = 0.0
+        for score, weighted_contribution in zip(self.response_scores, self.weighted_contributions):
+            if not math.isnan(score):
+                self.raw_score += score
+                self.weighted_score += weighted_contribution
+        self.updates = 0
+
+
+class ScoreTotals:
+    """
+    Running weighted and raw totals per scoring collection, kept up to date as responses change.
+
+    A reverse index from question position to the (collection, occurrence) pairs containing the question
+    turns a response change into a constant-time delta on the affected collections only.
+    """
+
+    __slots__ = ("_collections", "_occurrences")
+
+    def __init__(self):
+        self._collections: dict[int, CollectionTotals] = {}
+        # Question position -> [(totals, index of the question in the collection's plan), ...]
+        self._occurrences: dict[int, list[tuple[CollectionTotals, int]]] = {}
+
+    def get(self, collection: "QuestionScoringCollection", base_plan: "ScoringPlan") -> CollectionTotals | None:
+        """The totals of a collection, or None if it isn't tracked or its plan was recompiled since."""
+        totals = self._collections.get(id(collection))
+        if totals is None or totals.base_plan is not base_plan:
+            return None
+        return totals
+
+    def track(
+        self,
+        collection: "QuestionScoringCollection",
+        base_plan: "ScoringPlan",
+        plan: "ScoringPlan",
+        positions: list[int | None],
+        response_scores: Sequence[Optional[float]],
+        weighted_contributions: Sequence[float] | None = None,
+        totals: tuple[float, float] | None = None,
+    ) -> CollectionTotals:
+        """Start keeping totals for a collection, replacing any stale totals of it.
+
+        Args:
+            collection: the scoring collection
+            base_plan: the collection's cached plan
+            plan: the plan to compute the totals with, including importance overrides
+            positions: question bank position of each question in plan order, None for questions missing from
+                the question bank, which can't be answered
+            response_scores: current response score of each question in plan order, None where unanswered
+            weighted_contributions: optional precomputed weighted contributions, see `CollectionTotals`
+            totals: optional precomputed (weighted, raw) totals, see `CollectionTotals`
+
+        Returns:
+            CollectionTotals: the new totals
+        """
+        self.untrack(collection)
+        collection_totals = CollectionTotals(
+            collection, base_plan, plan, response_scores, weighted_contributions, totals
+        )
+        # The totals hold a reference to the collection, so its id can't be reused while it is tracked
+        self._collections[id(collection)] = collection_totals
+        for occurrence, position in enumerate(positions):
+            if position is not None:
+                self._occurrences.setdefault(position, []).append((collection_totals, occurrence))
+        return collection_totals
+
+    def untrack(self, collection: "QuestionScoringCollection") -> None:
+        """Stop keeping totals for a collection."""
+        totals = self._collections.pop(id(collection), None)
+        if totals is None:
+            return
+        for position, occurrences in list(self._occurrences.items()):
+            occurrences[:] = [(t, occurrence) for t, occurrence in occurrences if t is not totals]
+            if not occurrences:
+                del self._occurrences[position]
+
+    def tracks(self, position: int) -> bool:
+        """Whether a question position is part of any tracked collection"""
+        return position in self._occurrences
+
+    def apply(self, position: int, old_score: Optional[float], new_score: Optional[float]) -> None:
+        """Update the totals of every collection containing the question after its response changed.
+
+        Args:
+            position: question bank position of the question
+            old_score: the previous response score, None if it was unanswered
+            new_score: the new response score, None if it is now unanswered
+        """
+        if old_score == new_score:
+            return
+        for totals, occurrence in self._occurrences.get(position, ()):
+            old_contribution = totals.weighted_contributions[occurrence]
+            if new_score is None:
+                totals.response_scores[occurrence] = math.nan
+                totals.weighted_contributions[occurrence] = math.nan
+            else:
+                new_contribution = new_score * totals.plan.weights[occurrence]
+                totals.response_scores[occurrence] = new_score
+                totals.weighted_contributions[occurrence] = new_contribution
+                totals.weighted_score += new_contribution
+                totals.raw_score += new_score
+            if old_score is not None:
+                totals.weighted_score -= old_contribution
+                totals.raw_score -= old_score
+            totals.result = None
+            totals.updates += 1
+            if totals.updates >= RESUM_INTERVAL:
+                totals.resum()
+
+    def invalidate(self, position: int) -> None:
+        """Drop the totals of every collection containing the question, e.g. after its weight changed."""
+        for totals, _ in list(self._occurrences.get(position, ())):
+            self.untrack(totals.collection)
+
+    def clear(self) -> None:
+        """Drop all totals."""
+        self._collections.clear()
+        self._occurrences.clear()
+
+
+class ResponseStore(Mapping):
+    """
+    One session's responses and importance overrides, readable as a mapping of question ids to responses.
+
+    Categorical answers are stored as option indices, range answers as floats, and importance overrides
+    as floats with NaN meaning the question bank's default weight.
+    """
+
+    __slots__ = ("index", "_options", "_values", "_importance", "totals")
+
+    def __init__(self, index: QuestionIndex, responses: Mapping[str, str | float] | None = None):
+        """
+        Args:
+            index: the shared question index of the question bank
+            responses: optional initial responses, validated with `set_response`
+        """
+        self.index = index
+        # Option index of categorical answers, 0 for answered range questions, UNANSWERED otherwise
+        self._options = array("h", [UNANSWERED]) * len(index)
+        # Range answers are only allocated if the bank has range questions
+        has_ranges = any(value_range is not None for value_range in index.ranges)
+        self._values = array("d", [math.nan]) * len(index) if has_ranges else None
+        # Importance overrides are only allocated once one is set
+        self._importance: array | None = None
+        self.totals = ScoreTotals()
+        """Running score totals of the collections this store has been scored against"""
+        if responses:
+            self.update(responses)
+
+    @property
+    def option_indices(self) -> array:
+        """Option index of the answer to each question by position, -1 where unanswered and 0 for range questions.
+        Read-only view for vectorized scoring, write responses with `set_response`."""
+        return self._options
+
+    @property
+    def range_values(self) -> array | None:
+        """Answer to each range question by position, None if the question bank has no range questions.
+        Only valid where `option_indices` isn't -1. Read-only view for vectorized scoring."""
+        return self._values
+
+    @property
+    def importance_weights(self) -> array | None:
+        """Importance override of each question by position, NaN where the question bank's weight applies, None if
+        no weight was ever overridden. Read-only view for vectorized scoring, write overrides with `set_importance`."""
+        return self._importance
+
+    def set_response(self, question_id: str, response: str | float | None) -> None:
+        """Validate and store a response. This is the only place responses are validated.
+
+        Args:
+            question_id: the question being answered
+            response: option text for categorical questions, number for range questions, None to clear the answer
+
+        Raises:
+            ValueError: If the question id is unknown, or the response is not one of the question's options
+                or is outside the range of a range question
+        """
+        position = self.index.position(question_id)
+        tracked = self.totals.tracks(position)
+        old_score = self._score_at(position) if tracked else None
+
+        if response is None:
+            self._options[position] = UNANSWERED
+        elif self.index.ranges[position] is None:
+            option = self.index.option_positions[position].get(response)
+            if option is None:
+                raise ValueError(f"'{response}' is not an answer option of question '{question_id}'")
+            self._options[position] = option
+        else:
+            value = float(response)
+            low, high = self.index.ranges[position]
+            if not low <= value <= high:
+                raise ValueError(f"{value} is outside of the range [{low}, {high}] of question '{question_id}'")
+            self._values[position] = value
+            self._options[position] = 0
+
+        if tracked:
+            self.totals.apply(position, old_score, self._score_at(position))
+
+    def update(self, responses: Mapping[str, str | float | None]) -> None:
+        """Validate and store several responses, see `set_response`."""
+        for question_id, response in responses.items():
+            self.set_response(question_id, response)
+
+    def clear(self) -> None:
+        """Remove all responses and importance overrides."""
+        self._options = array("h", [UNANSWERED]) * len(self.index)
+        self._importance = None
+        self.totals.clear()
+
+    def get(self, question_id: str, default=None) -> str | float | None:
+        """The response to a question, or default if it is unanswered or not in the question bank."""
+        position = self.index.positions.get(question_id)
+        if position is None:
+            return default
+        option = self._options[position]
+        if option == UNANSWERED:
+            return default
+        if self.index.ranges[position] is not None:
+            return self._values[position]
+        return self.index.option_texts[position][option]
+
+    def get_score(self, question_id: str) -> Optional[float]:
+        """The score of the response to a question, or None if it is unanswered or not in the question bank."""
+        position = self.index.positions.get(question_id)
+        if position is None:
+            return None
+        return self._score_at(position)
+
+    def get_scores(self, question_ids: Iterable[str]) -> list[Optional[float]]:
+        """The scores of the responses to several questions, None where unanswered or not in the question bank."""
+        positions = self.index.positions
+        options = self._options
+        option_scores = self.index.option_scores
+        ranges = self.index.ranges
+        values = self._values
+        scores = []
+        for qid in question_ids:
+            position = positions.get(qid)
+            option = UNANSWERED if position is None else options[position]
+            if option == UNANSWERED:
+                scores.append(None)
+            elif ranges[position] is not None:
+                scores.append(values[position])
+            else:
+                scores.append(option_scores[position][option])
+        return scores
+
+    def fingerprint(self, question_ids: Sequence[str]) -> tuple:
+        """Hashable key of the answers and importance overrides of some questions, e.g. of a scoring collection.
+
+        Two fingerprints of the same questions from one question index are equal exactly when the questions have
+        the same answers and weights, so anything derived only from them can be cached under the fingerprint.
+
+        Args:
+            question_ids: the questions to include, in a fixed order
+
+        Returns:
+            tuple: option index or range answer of each question, and their importance overrides or None
+        """
+        positions = self.index.positions
+        options = self._options
+        ranges = self.index.ranges
+        values = self._values
+        answers = []
+        for qid in question_ids:
+            position = positions.get(qid)
+            option = UNANSWERED if position is None else options[position]
+            answers.append(values[position] if option != UNANSWERED and ranges[position] is not None else option)
+        if self._importance is None:
+            return tuple(answers), None
+        # NaN marks the question bank's weight and never equals itself, so it can't be part of a key
+        weights = [self._importance[positions[qid]] if qid in positions else math.nan for qid in question_ids]
+        overrides = tuple(None if math.isnan(weight) else weight for weight in weights)
+        return tuple(answers), overrides if any(weight is not None for weight in overrides) else None
+
+    def _score_at(self, position: int) -> Optional[float]:
+        option = self._options[position]
+        if option == UNANSWERED:
+            return None
+        if self.index.ranges[position] is not None:
+            # For range questions, the response itself is the score
+            return self._values[position]
+        return self.index.option_scores[position][option]
+
+    def set_importance(self, question_id: str, importance_score: float | None) -> None:
+        """Override the importance weight of a question for this session.
+
+        Args:
+            question_id: the question to reweight
+            importance_score: the new non-negative weight, None to go back to the question bank's weight
+
+        Raises:
+            ValueError: If the question id is unknown or the weight is negative
+        """
+        position = self.index.position(question_id)
+        if importance_score is None:
+            if self._importance is not None:
+                self._importance[position] = math.nan
+                self.totals.invalidate(position)
+            return
+        if not importance_score >= 0:
+            raise ValueError(f"Importance score of question '{question_id}' must be non-negative, got {importance_score}")
+        if self._importance is None:
+            self._importance = array("d", [math.nan]) * len(self.index)
+        self._importance[position] = importance_score
+        # Weights and extremes of the collections containing the question change, so their totals are rebuilt
+        self.totals.invalidate(position)
+
+    def get_importance(self, question_id: str) -> float:
+        """The importance weight of a question, taking this session's override into account."""
+        position = self.index.position(question_id)
+        if self._importance is not None and not math.isnan(self._importance[position]):
+            return self._importance[position]
+        return self.index.importance_scores[position]
+
+    @property
+    def importance_overrides(self) -> dict[str, float]:
+        """Importance weights overridden in this session by question id, empty if there are none."""
+        if self._importance is None:
+            return {}
+        return {
+            self.index.question_ids[position]: weight
+            for position, weight in enumerate(self._importance)
+            if not math.isnan(weight)
+        }
+
+    def __getitem__(self, question_id: str) -> str | float:
+        response = self.get(question_id)
+        if response is None:
+            raise KeyError(question_id)
+        return response
+
+    def __iter__(self) -> Iterator[str]:
+        question_ids = self.index.question_ids
+        return (question_ids[position] for position, option in enumerate(self._options) if option != UNANSWERED)
+
+    def __len__(self) -> int:
+        return len(self._options) - self._options.count(UNANSWERED)
+
+    def __repr__(self) -> str:
+        return f"ResponseStore({dict(self)!r})"
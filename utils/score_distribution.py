@@ -0,0 +1,207 @@
+"""
+Distribution of normalized scores over every possible combination of answers to a scoring collection.
+
+Each question's weighted score options are placed on a shared grid of weighted score values, and the
+per-question distributions are convolved together. This gives the exact share of answer combinations
+for every total score, without enumerating the combinations, as long as all weighted option scores are
+multiples of the grid step. When they are not, the step is chosen so the grid stays at most `max_bins` wide.
+"""
+
+import math
+from collections.abc import Mapping
+from dataclasses import dataclass
+from fractions import Fraction
+
+import numpy as np
+
+from utils.batch_score import classify_scores
+from utils.models import Question, QuestionScoringCollection, ThresholdResponse
+
+DEFAULT_RANGE_STEPS = 21
+DEFAULT_MAX_BINS = 20_000
+DEFAULT_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+# Largest denominator tried when looking for a grid step that represents every option score exactly
+MAX_EXACT_DENOMINATOR = 1000
+# Convolutions above this many multiply-adds are done with FFTs
+FFT_CONVOLVE_SIZE = 1_000_000
+
+
+@dataclass
+class ScoreDistribution:
+    """Probability of each achievable weighted total score of a collection"""
+
+    weighted_scores: np.ndarray
+    """Ascending grid of weighted total scores"""
+    probabilities: np.ndarray
+    """Probability (share of answer combinations) of each weighted total score"""
+    max_weighted_score: float
+    """The maximum possible weighted score, used for normalizing positive scores"""
+    min_weighted_score: float
+    """The minimum possible weighted score, used for normalizing negative scores"""
+    step: float
+    """Grid step of the weighted scores"""
+    is_exact: bool
+    """True if every weighted option score falls exactly on the grid"""
+
+    @property
+    def normalized_scores(self) -> np.ndarray:
+        """The weighted score grid normalized the same way as `QuestionScoringCollection.calculate_score`"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.weighted_scores / np.where(
+                self.weighted_scores > 0, self.max_weighted_score, abs(self.min_weighted_score)
+            )
+
+    def percentiles(self, percentiles=DEFAULT_PERCENTILES) -> dict[float, float]:
+        """Normalized weighted score at each of the given percentiles.
+
+        Args:
+            percentiles: percentiles between 0 and 100
+
+        Returns:
+            dict[float, float]: the lowest normalized score reached by at least that percentage of combinations,
+                NaN for every percentile if the distribution is empty
+        """
+        if not len(self.probabilities):
+            return {p: math.nan for p in percentiles}
+        cumulative = np.cumsum(self.probabilities)
+        cumulative /= cumulative[-1]
+        normalized = self.normalized_scores
+        indices = np.searchsorted(cumulative, np.asarray(percentiles, dtype=float) / 100 - 1e-12)
+        indices = np.minimum(indices, len(normalized) - 1)
+        return {p: float(normalized[i]) for p, i in zip(percentiles, indices)}
+
+    def bucket_shares(self, collection: QuestionScoringCollection) -> list[tuple[ThresholdResponse | None, float]]:
+        """Share of answer combinations that fall in each of the collection's thresholds.
+
+        Args:
+            collection: the scoring collection whose thresholds are used
+
+        Returns:
+            list[tuple[ThresholdResponse | None, float]]: (threshold, share) pairs in threshold order,
+                followed by (None, share) if some scores are not covered by any threshold
+        """
+        thresholds = collection.thresholds or []
+        buckets = classify_scores(collection, self.normalized_scores)
+        shares = np.bincount(buckets + 1, weights=self.probabilities, minlength=len(thresholds) + 1)
+        result = [(threshold, float(share)) for threshold, share in zip(thresholds, shares[1:])]
+        if shares[0] > 0:
+            result.append((None, float(shares[0])))
+        return result
+
+
+def question_score_options(
+    question: Question,
+    frequencies: Mapping[str, float] | None = None,
+    range_steps: int = DEFAULT_RANGE_STEPS,
+) -> tuple[np.ndarray, np.ndarray]:
+    """The weighted score values a question can contribute and their probabilities.
+
+    Args:
+        question: the question
+        frequencies: optional observed answer counts by option text, answers are equally likely if not given
+            or if all counts are zero
+        range_steps: number of equally spaced values used to discretize range questions
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: weighted score values and their probabilities
+    """
+    if question.question_type == "range":
+        scores = [score for _, score in question.answer_options]
+        values = np.linspace(min(scores), max(scores), range_steps)
+        probabilities = np.full(len(values), 1.0)
+    else:
+        values = np.array([score for _, score in question.answer_options], dtype=float)
+        if frequencies:
+            probabilities = np.array([frequencies.get(text, 0.0) for text, _ in question.answer_options], dtype=float)
+        if not frequencies or not probabilities.sum() > 0:
+            # Without observed answers to the question, e.g. when nobody answered it, answers are equally likely
+            probabilities = np.ones(len(values))
+    return values * question.importance_score, probabilities / probabilities.sum()
+
+
+def _exact_step(values: np.ndarray) -> float | None:
+    """The largest grid step that every value is a multiple of, None if there is no step with small denominators"""
+    fractions = [Fraction(float(v)).limit_denominator(MAX_EXACT_DENOMINATOR) for v in values]
+    if any(not math.isclose(float(f), float(v), abs_tol=1e-12) for f, v in zip(fractions, values)):
+        return None
+    denominator = math.lcm(*(f.denominator for f in fractions))
+    numerator = math.gcd(*(int(f * denominator) for f in fractions))
+    return numerator / denominator if numerator else None
+
+
+def _convolve(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if len(a) * len(b) <= FFT_CONVOLVE_SIZE:
+        return np.convolve(a, b)
+    n = len(a) + len(b) - 1
+    result = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)
+    # FFT round-off can leave tiny negative probabilities
+    return np.clip(result, 0.0, None)
+
+
+def _convolve_all(distributions: list[np.ndarray]) -> np.ndarray:
+    """Convolve distributions pairwise in a balanced tree so the large convolutions happen as rarely as possible"""
+    while len(distributions) > 1:
+        paired = [_convolve(a, b) for a, b in zip(distributions[::2], distributions[1::2])]
+        if len(distributions) % 2:
+            paired.append(distributions[-1])
+        distributions = paired
+    return distributions[0]
+
+
+def weighted_score_distribution(
+    collection: QuestionScoringCollection,
+    question_lookup: Mapping[str, Question],
+    answer_frequencies: Mapping[str, Mapping[str, float]] | None = None,
+    range_steps: int = DEFAULT_RANGE_STEPS,
+    max_bins: int = DEFAULT_MAX_BINS,
+) -> ScoreDistribution:
+    """Compute the distribution of weighted total scores over all combinations of answers to the collection.
+
+    Args:
+        collection: the scoring collection
+        question_lookup: dictionary for looking up questions by question id
+        answer_frequencies: optional observed answer counts, by question id and then option text.
+            Questions without frequencies, or with all counts zero, have equally likely answers.
+        range_steps: number of equally spaced values used to discretize range questions
+        max_bins: largest number of grid points used for the weighted score when scores can't be represented exactly
+
+    Returns:
+        ScoreDistribution: probabilities of the weighted total scores
+    """
+    answer_frequencies = answer_frequencies or {}
+    options = [
+        question_score_options(question_lookup[qid], answer_frequencies.get(qid), range_steps)
+        for qid in collection.question_ids
+    ]
+    _, min_weighted_score = collection.get_extreme_score(question_lookup, is_min=True)
+    _, max_weighted_score = collection.get_extreme_score(question_lookup)
+
+    all_values = np.unique(np.concatenate([values for values, _ in options]))
+    step = _exact_step(all_values)
+    is_exact = step is not None and (max_weighted_score - min_weighted_score) / step <= max_bins
+    if not is_exact:
+        step = max((max_weighted_score - min_weighted_score) / max_bins, np.finfo(float).eps)
+
+    # Put every question's options on the grid, offset so the lowest option is at index 0
+    offset = 0
+    distributions = []
+    for values, probabilities in options:
+        grid_index = np.rint(values / step).astype(np.intp)
+        low = grid_index.min()
+        distribution = np.zeros(grid_index.max() - low + 1)
+        np.add.at(distribution, grid_index - low, probabilities)
+        distributions.append(distribution)
+        offset += low
+
+    probabilities = _convolve_all(distributions) if distributions else np.ones(1)
+    weighted_scores = (offset + np.arange(len(probabilities))) * step
+    # Only keep achievable totals
+    achievable = probabilities > 0
+    return ScoreDistribution(
+        weighted_scores=weighted_scores[achievable],
+        probabilities=probabilities[achievable] / probabilities[achievable].sum(),
+        max_weighted_score=max_weighted_score,
+        min_weighted_score=min_weighted_score,
+        step=float(step),
+        is_exact=is_exact,
+    )
@@ -0,0 +1,224 @@
+"""
+Find single answer changes that would move a scoring collection into a different threshold bucket.
+
+Every alternative answer of every question in a collection is compiled into flat arrays once,
+so the effect of all one-answer changes on the normalized score is computed in one vectorized pass
+from the current weighted totals, instead of rerunning calculate_score per alternative.
+"""
+
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.batch_score import classify_scores
+from utils.models import Question, QuestionScoringCollection, ScoringPlan, ThresholdResponse
+
+# Number of compiled analyses kept by the process-level cache, one per collection and set of importance overrides
+BUCKET_SENSITIVITY_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class BucketFlip:
+    """A single answer change that moves the collection's score into a different threshold"""
+
+    question_id: str
+    """The question whose answer changes"""
+    current_response: str | float | None
+    """The current response to the question, None if unanswered"""
+    new_response: str | float
+    """The alternative response"""
+    normalized_weighted_score: float
+    """The collection's normalized weighted score after the change"""
+    score_delta: float
+    """Change in the normalized weighted score"""
+    threshold: ThresholdResponse | None
+    """The threshold the score moves into, None if it is outside of all thresholds"""
+
+
+class BucketSensitivity:
+    """
+    Compiled one-answer-change analysis for a scoring collection.
+
+    Questions that appear several times in the collection are changed everywhere at once.
+    """
+
+    def __init__(
+        self,
+        collection: QuestionScoringCollection,
+        question_lookup: Mapping[str, Question],
+        importance_overrides: Mapping[str, float] | None = None,
+    ):
+        """
+        Args:
+            collection: the scoring collection to analyze
+            question_lookup: dictionary for looking up questions by question id
+            importance_overrides: optional importance weights by question id that replace the questions' own
+                weights, e.g. a session's overrides, so the scores match the scores shown for the session
+        """
+        self.collection = collection
+        importance_overrides = importance_overrides or {}
+        if any(qid in importance_overrides for qid in collection.question_ids):
+            plan = ScoringPlan.compile(collection.question_ids, question_lookup, importance_overrides)
+        else:
+            plan = collection.get_scoring_plan(question_lookup)
+        self.max_weighted_score = plan.max_weighted_score
+        self.min_weighted_score = plan.min_weighted_score
+
+        # Unique questions in collection order, weighted by how often they count in the collection
+        multiplicity: dict[str, int] = {}
+        for qid in plan.question_ids:
+            multiplicity[qid] = multiplicity.get(qid, 0) + 1
+        self.question_ids = list(multiplicity)
+        self.option_scores = [question_lookup[qid].option_scores for qid in self.question_ids]
+        self.is_range = [question_lookup[qid].question_type == "range" for qid in self.question_ids]
+        self.weights = np.array(
+            [
+                importance_overrides.get(qid, question_lookup[qid].importance_score) * count
+                for qid, count in multiplicity.items()
+            ],
+            dtype=float,
+        )
+
+        # Flat arrays with one entry per (question, alternative answer)
+        alternative_questions = []
+        self.alternative_responses: list[str | float] = []
+        alternative_scores = []
+        for i, qid in enumerate(self.question_ids):
+            for option_text, score in question_lookup[qid].answer_options:
+                alternative_questions.append(i)
+                # For range questions, the response itself is the score
+                self.alternative_responses.append(score if self.is_range[i] else option_text)
+                alternative_scores.append(score)
+        self.alternative_questions = np.array(alternative_questions, dtype=np.intp)
+        self.alternative_weighted_scores = np.array(alternative_scores, dtype=float) * self.weights[
+            self.alternative_questions
+        ]
+
+    def weighted_contributions(self, responses: Mapping[str, str | float]) -> np.ndarray:
+        """Weighted score contribution of each unique question for a response set, 0 where unanswered"""
+        contributions = np.zeros(len(self.question_ids))
+        for i, (qid, option_scores, is_range) in enumerate(zip(self.question_ids, self.option_scores, self.is_range)):
+            user_response = responses.get(qid)
+            if user_response is None:
+                continue
+            response_score = float(user_response) if is_range else option_scores.get(user_response)
+            if response_score is not None:
+                contributions[i] = response_score
+        return contributions * self.weights
+
+    def normalize(self, weighted_scores: np.ndarray) -> np.ndarray:
+        """Normalize weighted totals the same way as `QuestionScoringCollection.calculate_score`"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return weighted_scores / np.where(
+                weighted_scores > 0, self.max_weighted_score, abs(self.min_weighted_score)
+            )
+
+    def alternative_scores(self, weighted_contributions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Normalized score now and after each one-answer change, for one or many response sets.
+
+        Args:
+            weighted_contributions: weighted contribution per unique question, shape (questions,) or
+                (submissions, questions) for a batch of response sets
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: the current normalized scores, shape () or (submissions,),
+                and the normalized scores after each alternative answer, shape (alternatives,) or
+                (submissions, alternatives)
+        """
+        totals = weighted_contributions.sum(axis=-1)
+        changed_totals = (
+            totals[..., np.newaxis]
+            - weighted_contributions[..., self.alternative_questions]
+            + self.alternative_weighted_scores
+        )
+        return self.normalize(totals), self.normalize(changed_totals)
+
+    def flip_mask(self, weighted_contributions: np.ndarray) -> np.ndarray:
+        """Which alternative answers move each response set into a different threshold bucket.
+
+        Args:
+            weighted_contributions: (submissions, questions) weighted contributions per unique question
+
+        Returns:
+            np.ndarray: (submissions, alternatives) boolean array
+        """
+        current, changed = self.alternative_scores(weighted_contributions)
+        current_buckets = classify_scores(self.collection, current)
+        return classify_scores(self.collection, changed) != current_buckets[..., np.newaxis]
+
+    def bucket_flips(self, responses: Mapping[str, str | float]) -> list[BucketFlip]:
+        """All single answer changes that move the response set into a different threshold bucket.
+
+        Args:
+            responses: the session's response overlay, mapping question ids to user responses
+
+        Returns:
+            list[BucketFlip]: the changes that flip the bucket, largest normalized score change first
+        """
+        contributions = self.weighted_contributions(responses)
+        current, changed = self.alternative_scores(contributions)
+        current_bucket = classify_scores(self.collection, current)
+        changed_buckets = classify_scores(self.collection, changed)
+        deltas = changed - current
+
+        flips = np.flatnonzero(changed_buckets != current_bucket)
+        thresholds = self.collection.thresholds or []
+        return [
+            BucketFlip(
+                question_id=self.question_ids[self.alternative_questions[i]],
+                current_response=responses.get(self.question_ids[self.alternative_questions[i]]),
+                new_response=self.alternative_responses[i],
+                normalized_weighted_score=float(changed[i]),
+                score_delta=float(deltas[i]),
+                threshold=thresholds[changed_buckets[i]] if changed_buckets[i] >= 0 else None,
+            )
+            for i in flips[np.argsort(-np.abs(deltas[flips]), kind="stable")]
+        ]
+
+
+# (id of the collection, its importance overrides) -> (collection, question bank, compiled analysis)
+_sensitivities: OrderedDict[
+    tuple[int, tuple[tuple[str, float], ...]], tuple[QuestionScoringCollection, Mapping[str, Question], BucketSensitivity]
+] = OrderedDict()
+_sensitivities_lock = threading.Lock()
+
+
+def get_bucket_sensitivity(
+    collection: QuestionScoringCollection,
+    question_lookup: Mapping[str, Question],
+    importance_overrides: Mapping[str, float] | None = None,
+) -> BucketSensitivity:
+    """The compiled analysis of a collection, compiled once per collection and set of importance overrides.
+
+    Analyses are cached for the whole process and shared by all sessions, so they must not be modified. The least
+    recently used analyses are dropped once BUCKET_SENSITIVITY_CACHE_SIZE are cached.
+
+    Args:
+        collection: the scoring collection to analyze
+        question_lookup: dictionary for looking up questions by question id
+        importance_overrides: optional importance weights by question id, e.g. a session's overrides
+
+    Returns:
+        BucketSensitivity: the compiled analysis
+    """
+    importance_overrides = importance_overrides or {}
+    # Only the overrides of the collection's own questions change its analysis
+    overrides = tuple(sorted((qid, w) for qid, w in importance_overrides.items() if qid in collection.question_ids))
+    key = (id(collection), overrides)
+    with _sensitivities_lock:
+        cached = _sensitivities.get(key)
+        # The cached collection keeps its id from being reused, the question bank changes when it is reloaded
+        if cached is not None and cached[0] is collection and cached[1] is question_lookup:
+            _sensitivities.move_to_end(key)
+            return cached[2]
+
+    sensitivity = BucketSensitivity(collection, question_lookup, dict(overrides))
+    with _sensitivities_lock:
+        _sensitivities[key] = (collection, question_lookup, sensitivity)
+        _sensitivities.move_to_end(key)
+        while len(_sensitivities) > BUCKET_SENSITIVITY_CACHE_SIZE:
+            _sensitivities.popitem(last=False)
+    return sensitivity
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Headless scoring service for systems that need scores without the Streamlit interface.
+
+The question bank and scoring collections are loaded and compiled once at startup. Requests carry
+complete response sets and the service keeps no state between them, so several worker processes
+can run behind a load balancer.
+
+Endpoints:
+    GET  /health       -> {"status": "ok", "collections": [...]}
+    POST /score        {"responses": {question_id: answer}}
+                       -> {"result": {collection: {"score": ScoreResult, "threshold": ThresholdResponse | null}}}
+    POST /score/batch  {"responses": [{question_id: answer}, ...]}
+                       -> {"results": [{collection: {...}}, ...]}
+
+Requests with unknown question ids or answers that aren't options of their question are rejected with 400
+and {"error": ...}, with the messages of `ResponseStore.set_response`.
+
+Usage:
+    python -m utils.service serve --port 8502
+    python -m utils.service bench --requests 2000 --batch_size 100
+
+Options:
+    --questions PATH: Path to questions.json (default: data/questions.json)
+    --scoring_configs PATHS: Scoring configuration JSON files (default: data/*_scoring_questions.json)
+"""
+
+import argparse
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.batch_score import BatchScorer, load_batch_scorer
+from utils.config import DATA_DIR, QUESTIONS_PATH, SCORING_COLLECTIONS_GLOB
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+# Largest number of response sets accepted in a single batch request
+MAX_BATCH_SIZE = 10_000
+
+
+def _finite_or_none(value: float) -> float | None:
+    """JSON has no NaN or infinity, so scores that can't be normalized are returned as null"""
+    return value if math.isfinite(value) else None
+
+
+def validate_response_set(scorer: BatchScorer, response_set: dict) -> None:
+    """Check that every answer of a response set could be stored in a ResponseStore, with the same messages.
+
+    Only questions scored by one of the collections are known to the service. None and empty strings are unanswered.
+
+    Args:
+        scorer: the compiled scorer
+        response_set: mapping of question ids to answers
+
+    Raises:
+        ValueError: If a question id is unknown, or an answer is not one of the question's options
+            or is outside the range of a range question
+    """
+    for question_id, answer in response_set.items():
+        column = scorer.question_index.get(question_id)
+        if column is None:
+            raise ValueError(f"Question ID '{question_id}' not found in question bank")
+        if answer is None or answer == "":
+            continue
+        option_table = scorer.option_tables[column]
+        if not scorer.is_range[column]:
+            if not isinstance(answer, str) or answer not in option_table:
+                raise ValueError(f"'{answer}' is not an answer option of question '{question_id}'")
+            continue
+        value = float(answer)
+        low, high = min(option_table.values()), max(option_table.values())
+        if not low <= value <= high:
+            raise ValueError(f"{value} is outside of the range [{low}, {high}] of question '{question_id}'")
+
+
+def score_response_sets(scorer: BatchScorer, response_sets: list[dict]) -> list[dict]:
+    """Score response sets against every collection and build the JSON response body for each.
+
+    Args:
+        scorer: the compiled scorer
+        response_sets: one mapping of question ids to answers per response set
+
+    Returns:
+        list[dict]: for each response set, the score and threshold of each collection by name
+
+    Raises:
+        ValueError: If a response set is not a JSON object of answers, or has an unknown question id or an invalid
+            answer (see `validate_response_set`). In batches of several response sets, the message starts with the
+            position of the invalid response set.
+    """
+    for i, response_set in enumerate(response_sets):
+        if not isinstance(response_set, dict) or not all(
+            isinstance(answer, (str, int, float)) or answer is None for answer in response_set.values()
+        ):
+            raise ValueError("Each response set must be an object mapping question ids to answers")
+        try:
+            validate_response_set(scorer, response_set)
+        except ValueError as e:
+            if len(response_sets) == 1:
+                raise
+            raise ValueError(f"Response set {i}: {e}") from None
+
+    results = scorer.score(scorer.responses_matrix(response_sets))
+    thresholds = {
+        name: [t.model_dump(exclude={"lower", "upper"}) for t in collection.thresholds or []]
+        for name, collection in scorer.collections.items()
+    }
+    buckets = {name: result.bucket.tolist() for name, result in results.items()}
+
+    bodies = []
+    for i, score_results in enumerate(scorer.score_results(results)):
+        body = {}
+        for name, score_result in score_results.items():
+            score = score_result.model_dump()
+            for field in ("weighted_score", "normalized_weighted_score", "raw_response_score"):
+                score[field] = _finite_or_none(score[field])
+            bucket = buckets[name][i]
+            body[name] = {"score": score, "threshold": thresholds[name][bucket] if bucket >= 0 else None}
+        bodies.append(body)
+    return bodies
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    """Handles scoring requests with the scorer attached to the server"""
+
+    server: "ScoringServer"
+    # Headers and body are written separately, don't let Nagle's algorithm hold back the body
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+        self._send_json(200, {"status": "ok", "collections": list(self.server.scorer.collections)})
+
+    def do_POST(self):
+        if self.path not in ("/score", "/score/batch"):
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            responses = request["responses"]
+            if self.path == "/score":
+                self._send_json(200, {"result": score_response_sets(self.server.scorer, [responses])[0]})
+                return
+            if not isinstance(responses, list) or len(responses) > MAX_BATCH_SIZE:
+                raise ValueError(f"Batch responses must be a list of at most {MAX_BATCH_SIZE} response sets")
+            self._send_json(200, {"results": score_response_sets(self.server.scorer, responses)})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"Invalid request: {e}"})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """HTTP server sharing one read-only BatchScorer between all request threads"""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], scorer: BatchScorer, quiet: bool = False):
+        super().__init__(address, ScoringRequestHandler)
+        self.scorer = scorer
+        self.quiet = quiet
+
+
+def run_benchmark(host: str, port: int, scorer: BatchScorer, n_requests: int, batch_size: int, concurrency: int):
+    """Send random response sets to a running service and print single and batched throughput."""
+    rng = random.Random(0)
+    # Range questions are answered with a value from their range, categorical questions with an option text
+    option_texts = [
+        list(option_table.values()) if is_range else list(option_table)
+        for option_table, is_range in zip(scorer.option_tables, scorer.is_range.tolist())
+    ]
+
+    def random_response_set() -> dict:
+        return {qid: rng.choice(options) for qid, options in zip(scorer.question_ids, option_texts)}
+
+    def post(path: str, body: bytes) -> None:
+        connection = http.client.HTTPConnection(host, port)
+        connection.request("POST", path, body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"Request to {path} failed with status {response.status}")
+
+    single_bodies = [json.dumps({"responses": random_response_set()}).encode() for _ in range(n_requests)]
+    n_batches = max(n_requests // batch_size, 1)
+    batch_bodies = [
+        json.dumps({"responses": [random_response_set() for _ in range(batch_size)]}).encode()
+        for _ in range(n_batches)
+    ]
+
+    for label, path, bodies, sets_per_request in [
+        ("single", "/score", single_bodies, 1),
+        (f"batch of {batch_size}", "/score/batch", batch_bodies, batch_size),
+    ]:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda body: post(path, body), bodies))
+        elapsed = time.perf_counter() - start
+        print(
+            f"{label}: {len(bodies)} requests in {elapsed:.2f}s, {len(bodies) / elapsed:.0f} requests/s, "
+            f"{len(bodies) * sets_per_request / elapsed:.0f} response sets/s"
+        )
+
+
+def main():
+    """Main function to run or benchmark the scoring service."""
+    parser = argparse.ArgumentParser(description="Headless scoring service")
+    parser.add_argument("command", choices=["serve", "bench"], help="Run the service or benchmark it on localhost")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Host to bind or connect to (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, help=f"Port to bind or connect to (default: {DEFAULT_PORT} for serve)")
+    parser.add_argument(
+        "--questions",
+        type=Path,
+        default=QUESTIONS_PATH,
+        help="Path to questions.json (default: data/questions.json)",
+    )
+    parser.add_argument(
+        "--scoring_configs",
+        type=Path,
+        nargs="+",
+        default=sorted(DATA_DIR.glob(SCORING_COLLECTIONS_GLOB)),
+        help="Scoring configuration JSON files (default: data/*_scoring_questions.json)",
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="bench: number of single requests (default: 1000)")
+    parser.add_argument("--batch_size", type=int, default=100, help="bench: response sets per batch (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=8, help="bench: concurrent client threads (default: 8)")
+
+    args = parser.parse_args()
+
+    scorer = load_batch_scorer(args.questions, args.scoring_configs)
+
+    if args.command == "serve":
+        server = ScoringServer((args.host, args.port or DEFAULT_PORT), scorer)
+        print(f"Scoring service listening on http://{args.host}:{server.server_port}")
+        server.serve_forever()
+        return
+
+    # Without a port, benchmark a service started in this process on a free port
+    server = None
+    port = args.port
+    if port is None:
+        server = ScoringServer((args.host, 0), scorer, quiet=True)
+        port = server.server_port
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        run_benchmark(args.host, port, scorer, args.requests, args.batch_size, args.concurrency)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
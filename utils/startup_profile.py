@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Measure the import time of the Streamlit entry points, to catch cold start regressions.
+
+Each entry point's imports are run in a fresh Python process with `-X importtime`, and the
+slowest modules are reported together with the total. Heavy dependencies that are only needed
+on some pages (pandas, plotly, numpy) are flagged when an entry point loads them.
+
+Usage:
+    python -m utils.startup_profile
+    python -m utils.startup_profile pages/1_Organizational_Constraints.py --budget_ms 800
+
+Arguments:
+    entry_points: Streamlit scripts to measure (default: Introduction.py and pages/*.py)
+
+Options:
+    --top N: Number of slowest modules to list per entry point (default: 10)
+    --budget_ms MS: Exit with an error if any entry point takes longer than this to import
+"""
+
+import argparse
+import ast
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+from utils.config import PROJECT_ROOT
+
+HEAVY_MODULES = ("pandas", "plotly.graph_objects", "numpy")
+
+
+@dataclass
+class ModuleImportTime:
+    module: str
+    """Fully qualified module name"""
+    self_us: int
+    """Time spent importing the module itself, in microseconds"""
+    cumulative_us: int
+    """Time spent importing the module and everything it imported first, in microseconds"""
+
+
+def entry_point_imports(script_path: Path) -> list[str]:
+    """The top level import statements of a Streamlit script, without running the script."""
+    tree = ast.parse(script_path.read_text(), filename=str(script_path))
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def measure_imports(import_statements: list[str]) -> list[ModuleImportTime]:
+    """Run the import statements in a fresh interpreter and parse its `-X importtime` report.
+
+    Args:
+        import_statements: Python import statements to run
+
+    Returns:
+        list[ModuleImportTime]: import time of every module loaded, in import order
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "\n".join(import_statements)],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        timings.append(ModuleImportTime(module.strip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def total_import_ms(timings: list[ModuleImportTime]) -> float:
+    """Total import time in milliseconds, the sum of the self time of every module"""
+    return sum(t.self_us for t in timings) / 1000
+
+
+def main():
+    """Main function to report the import time of the Streamlit entry points."""
+    parser = argparse.ArgumentParser(description="Report the import time of each Streamlit entry point")
+    parser.add_argument(
+        "entry_points",
+        type=Path,
+        nargs="*",
+        default=[PROJECT_ROOT / "Introduction.py", *sorted((PROJECT_ROOT / "pages").glob("*.py"))],
+        help="Streamlit scripts to measure (default: Introduction.py and pages/*.py)",
+    )
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest modules to list (default: 10)")
+    parser.add_argument(
+        "--budget_ms", type=float, help="Exit with an error if an entry point takes longer than this to import"
+    )
+
+    args = parser.parse_args()
+
+    over_budget = []
+    for entry_point in args.entry_points:
+        timings = measure_imports(entry_point_imports(entry_point))
+        total_ms = total_import_ms(timings)
+        loaded = {t.module for t in timings}
+
+        print(f"\n{entry_point.name}: {total_ms:.1f} ms to import {len(timings)} modules")
+        heavy = [module for module in HEAVY_MODULES if module in loaded]
+        if heavy:
+            print("  Heavy dependencies loaded:", ", ".join(heavy))
+        for timing in sorted(timings, key=lambda t: t.cumulative_us, reverse=True)[: args.top]:
+            print(f"  {timing.cumulative_us / 1000:8.1f} ms cumulative {timing.self_us / 1000:8.1f} ms self  {timing.module}")
+
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            over_budget.append(entry_point.name)
+
+    if over_budget:
+        print(f"\nOver the {args.budget_ms} ms import budget:", ", ".join(over_budget))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Lightweight timing spans for Streamlit reruns.
+
+Pages wrap their script in `rerun_scope` and the expensive steps in `span`. At the end of each rerun, the span
+durations are added to rolling windows per page, written as one JSON log line, and shown in an opt-in sidebar panel
+with rolling percentiles. Timing is enabled by running the app with RERUN_TIMING=1. When it is disabled, `span` and
+`rerun_scope` return a shared no-op context manager, so instrumented code pays for one function call per span.
+"""
+
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+
+import streamlit as st
+
+from utils.config import RERUN_TIMING_ENABLED
+
+# Number of most recent reruns per page that the rolling percentiles are computed over
+ROLLING_WINDOW = 200
+PERCENTILES = (50, 90, 99)
+TOTAL_SPAN = "total"
+
+logger = logging.getLogger(__name__)
+if RERUN_TIMING_ENABLED and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_NO_TIMING = nullcontext()
+# Streamlit runs each session's script in its own thread, so the active rerun is tracked per thread
+_active = threading.local()
+_durations: dict[str, dict[str, deque[float]]] = {}
+_durations_lock = threading.Lock()
+
+
+@dataclass
+class RerunTimings:
+    """Span durations of one rerun of a page"""
+
+    page: str
+    """Name of the page or fragment that reran"""
+    spans: dict[str, float] = field(default_factory=dict)
+    """Total duration of each span name in milliseconds, spans with the same name are added up"""
+
+
+def span(name: str) -> AbstractContextManager:
+    """Time a block of code as part of the active rerun.
+
+    Args:
+        name: name of the span, durations of spans with the same name in one rerun are added up
+
+    Returns:
+        AbstractContextManager: context manager timing the block, a no-op if timing is disabled
+    """
+    if not RERUN_TIMING_ENABLED:
+        return _NO_TIMING
+    return _timed_span(name)
+
+
+@contextmanager
+def _timed_span(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        rerun: RerunTimings | None = getattr(_active, "rerun", None)
+        if rerun is not None:
+            rerun.spans[name] = rerun.spans.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def rerun_scope(page: str, show_panel: bool = True) -> AbstractContextManager:
+    """Collect the spans of one rerun of a page.
+
+    If a rerun is already being timed, e.g. a fragment during a full rerun, the spans are added to that rerun instead.
+
+    Args:
+        page: name of the page or fragment the spans are aggregated under
+        show_panel: whether to show the timing panel in the sidebar at the end of the rerun. Fragment reruns
+            can't add elements to the sidebar, so they only log and aggregate their timings.
+
+    Returns:
+        AbstractContextManager: context manager around the rerun, a no-op if timing is disabled
+    """
+    if not RERUN_TIMING_ENABLED or getattr(_active, "rerun", None) is not None:
+        return _NO_TIMING
+    return _timed_rerun(page, show_panel)
+
+
+@contextmanager
+def _timed_rerun(page: str, show_panel: bool) -> Iterator[None]:
+    rerun = RerunTimings(page)
+    _active.rerun = rerun
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.rerun = None
+    # Reruns interrupted by an exception, e.g. st.switch_page, are not recorded
+    rerun.spans[TOTAL_SPAN] = (time.perf_counter() - start) * 1000
+    record_rerun(rerun)
+    logger.info(
+        json.dumps({"event": "rerun_timing", "page": page, "spans_ms": {k: round(v, 3) for k, v in rerun.spans.items()}})
+    )
+    if show_panel:
+        render_timing_panel(rerun)
+
+
+def record_rerun(rerun: RerunTimings) -> None:
+    """Add the span durations of a rerun to the rolling windows of its page."""
+    with _durations_lock:
+        page_durations = _durations.setdefault(rerun.page, {})
+        for name, duration in rerun.spans.items():
+            page_durations.setdefault(name, deque(maxlen=ROLLING_WINDOW)).append(duration)
+
+
+def rolling_percentiles(page: str) -> dict[str, dict[str, float]]:
+    """Rolling percentiles of each span of a page over its most recent reruns.
+
+    Args:
+        page: name of the page
+
+    Returns:
+        dict[str, dict[str, float]]: for each span name, the nearest-rank percentiles in milliseconds keyed
+            like "p50", and the number of reruns "n" they are computed over
+    """
+    with _durations_lock:
+        windows = {name: sorted(durations) for name, durations in _durations.get(page, {}).items()}
+    percentiles = {}
+    for name, durations in windows.items():
+        percentiles[name] = {
+            f"p{p}": durations[max(math.ceil(p / 100 * len(durations)) - 1, 0)] for p in PERCENTILES
+        }
+        percentiles[name]["n"] = len(durations)
+    return percentiles
+
+
+def render_timing_panel(rerun: RerunTimings) -> None:
+    """Show the spans of this rerun and the page's rolling percentiles in the sidebar."""
+    percentiles = rolling_percentiles(rerun.page)
+    header = "| Span | This rerun | " + " | ".join(f"p{p}" for p in PERCENTILES) + " | Reruns |"
+    rows = [header, "|" + " --- |" * (len(PERCENTILES) + 3)]
+    for name, duration in rerun.spans.items():
+        span_percentiles = percentiles.get(name, {})
+        rows.append(
+            f"| {name} | {duration:.1f} ms | "
+            + " | ".join(f"{span_percentiles.get(f'p{p}', math.nan):.1f} ms" for p in PERCENTILES)
+            + f" | {span_percentiles.get('n', 0)} |"
+        )
+    with st.sidebar.expander("Rerun timings", expanded=False):
+        st.markdown("\n".join(rows))
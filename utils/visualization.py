@@ -2,7 +2,15 @@
 Visualization utilities for score display.
 """
 
-import plotly.graph_objects as go
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Plotly is imported by the functions that build figures to keep it off the cold start path
+    import plotly.graph_objects as go
 
 BADGE_COLOR_MAP = {
     "red": "#FF4B4B",
@@ -14,8 +22,33 @@ BADGE_COLOR_MAP = {
 }
 
 
-def render_score_bar(score: float, thresholds: list) -> go.Figure:
-    """Render a horizontal bar showing colored threshold intervals with a marker at the user's score."""
+@dataclass
+class ScoreBarCacheStats:
+    """Counters for the cache of threshold background figures used by render_score_bar"""
+
+    base_builds: int = 0
+    """Number of threshold background figures built and serialized"""
+    base_hits: int = 0
+    """Number of renders that reused a cached background figure"""
+    base_payload_bytes: int = 0
+    """Total size of the serialized background figures, built once per set of thresholds"""
+
+
+_base_figures: dict[str, str] = {}
+_base_figures_lock = threading.Lock()
+score_bar_cache_stats = ScoreBarCacheStats()
+
+
+def thresholds_key(thresholds: list) -> str:
+    """Hash of the threshold fields that are drawn in the score bar, used as the background figure cache key."""
+    drawn = [(t.lower, t.upper, t.header, t.color) for t in thresholds]
+    return hashlib.sha1(json.dumps(drawn).encode()).hexdigest()
+
+
+def _build_base_figure(thresholds: list) -> "go.Figure":
+    """Build the score bar without a score marker: one colored bar and label per threshold."""
+    import plotly.graph_objects as go
+
     fig = go.Figure()
     threshold_boundaries = set()
     for threshold in thresholds:
@@ -50,17 +83,6 @@ def render_score_bar(score: float, thresholds: list) -> go.Figure:
             font=dict(size=12),
         )
 
-    fig.add_trace(
-        go.Scatter(
-            x=[score],
-            y=[0],
-            mode="markers",
-            marker=dict(symbol="circle", size=36, color="DarkSlateGrey"),
-            hovertemplate=f"Your score: {score:.2f}<extra></extra>",
-            showlegend=False,
-        )
-    )
-
     tick_vals = sorted(threshold_boundaries)
     fig.update_layout(
         barmode="overlay",
@@ -82,3 +104,50 @@ def render_score_bar(score: float, thresholds: list) -> go.Figure:
         paper_bgcolor="rgba(0,0,0,0)",
     )
     return fig
+
+
+def get_base_figure_json(thresholds: list) -> str:
+    """Returns the serialized threshold background of the score bar, building it the first time
+    a set of thresholds is seen in this process."""
+    import plotly.io as pio
+
+    key = thresholds_key(thresholds)
+    base_json = _base_figures.get(key)
+    if base_json is not None:
+        score_bar_cache_stats.base_hits += 1
+        return base_json
+
+    base_json = pio.to_json(_build_base_figure(thresholds), validate=False)
+    with _base_figures_lock:
+        _base_figures[key] = base_json
+        score_bar_cache_stats.base_builds += 1
+        score_bar_cache_stats.base_payload_bytes += len(base_json)
+    return base_json
+
+
+def score_marker(score: float) -> "go.Scatter":
+    """The marker of the user's score that is drawn over the threshold background of the score bar."""
+    import plotly.graph_objects as go
+
+    return go.Scatter(
+        x=[score],
+        y=[0],
+        mode="markers",
+        marker=dict(symbol="circle", size=36, color="DarkSlateGrey"),
+        hovertemplate=f"Your score: {score:.2f}<extra></extra>",
+        showlegend=False,
+    )
+
+
+def render_score_bar(score: float, thresholds: list) -> "go.Figure":
+    """Render a horizontal bar showing colored threshold intervals with a marker at the user's score.
+
+    The threshold background is built once per set of thresholds and copied from its cached JSON,
+    only the score marker is added on each render.
+    """
+    import plotly.graph_objects as go
+
+    # The cached background was validated when it was built, so skip validating the copy
+    fig = go.Figure(json.loads(get_base_figure_json(thresholds)), _validate=False)
+    fig.add_trace(score_marker(score))
+    return fig
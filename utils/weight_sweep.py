@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Sweep candidate importance weights against historical responses to see how threshold assignments shift.
+
+Every scoring collection's score is linear in the importance weights: for a matrix of response scores
+(submissions x questions) and a matrix of candidate weights (questions x candidates), one matrix product gives the
+weighted score of every submission under every candidate. The weighted extremes are linear in the weights too, so
+normalizing and classifying the scores of thousands of candidates takes a few array operations per chunk of
+submissions instead of one calculate_score call per submission and candidate.
+
+For each collection, the sweep reports the share of submissions in each threshold under every candidate, and the
+agreement rate: the share of submissions assigned the same threshold as under the reference weights, which are the
+question bank's importance scores unless given.
+
+Usage:
+    python -m utils.weight_sweep --random_candidates 5000 --spread 0.3
+    python -m utils.weight_sweep --candidates candidates.csv --responses responses.jsonl --output sweep.csv
+
+Options:
+    --questions PATH: Path to questions.json (default: data/questions.json)
+    --scoring_configs PATHS: Scoring configuration JSON files (default: data/*_scoring_questions.json)
+    --log_dir PATH: Assessment logs to take the historical responses from (default: data/assessments)
+    --responses PATH: Take the historical responses from a CSV or JSONL file instead, in the input format of
+        `python -m utils.batch_score`
+    --candidates PATH: CSV file with a header row of question ids and one candidate weight vector per row,
+        or JSONL file with one {question_id: weight} object per line. Questions without a weight keep the
+        reference weight.
+    --random_candidates N: Generate N candidates by scaling each reference weight by a random log-normal factor
+    --spread SIGMA: Standard deviation of the log of the random factors (default: 0.25)
+    --seed N: Seed for the random candidates (default: 0)
+    --reference PATH: JSON file of {question_id: weight} replacing the question bank's weights in the reference
+    --output PATH: Write the agreement rate and threshold shares of every candidate and collection as CSV
+    --candidates_output PATH: Write the candidate weights as CSV, in the format accepted by --candidates
+    --top N: Number of candidates with the lowest agreement rate to print per collection (default: 5)
+"""
+
+import argparse
+import csv
+import json
+import time
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from utils.assessment_log import AssessmentLog
+from utils.batch_score import BatchScorer, load_batch_scorer, read_chunks
+from utils.config import ASSESSMENT_LOG_DIR, DATA_DIR, QUESTIONS_PATH, SCORING_COLLECTIONS_GLOB
+from utils.models import QuestionScoringCollection
+
+DEFAULT_SPREAD = 0.25
+# Upper bound on the submissions x (collections x candidates) score matrix of one chunk, about 160 MB of floats
+MAX_CHUNK_ELEMENTS = 20_000_000
+# Submissions read from a responses file at a time
+READ_CHUNK_SIZE = 10_000
+OUTSIDE_THRESHOLDS = "Outside all thresholds"
+
+
+@dataclass
+class SweepResult:
+    """Threshold assignments of one collection's submissions under every candidate weight vector"""
+
+    collection_name: str
+    """Name of the scoring collection"""
+    bucket_headers: list[str]
+    """Threshold headers in threshold order, followed by OUTSIDE_THRESHOLDS"""
+    n_submissions: int
+    """Number of historical submissions scored"""
+    reference_counts: np.ndarray
+    """Number of submissions in each bucket under the reference weights"""
+    bucket_counts: np.ndarray
+    """Candidates x buckets number of submissions in each bucket under each candidate"""
+    agreements: np.ndarray
+    """Number of submissions assigned the same bucket as under the reference weights, for each candidate"""
+
+    @property
+    def agreement_rates(self) -> np.ndarray:
+        """Share of submissions assigned the same bucket as under the reference weights, for each candidate"""
+        return self.agreements / max(self.n_submissions, 1)
+
+    @property
+    def bucket_shares(self) -> np.ndarray:
+        """Candidates x buckets share of submissions in each bucket"""
+        return self.bucket_counts / max(self.n_submissions, 1)
+
+
+class WeightSweep:
+    """
+    Accumulates the threshold assignments of batches of submissions under many candidate weight vectors.
+    """
+
+    def __init__(self, scorer: BatchScorer, candidates: np.ndarray, reference: np.ndarray):
+        """
+        Args:
+            scorer: compiled scoring collections, candidate weights are in its `question_ids` column order
+            candidates: candidates x questions array of non-negative importance weights
+            reference: importance weight of each question the candidates are compared against
+
+        Raises:
+            ValueError: If the weights don't have one column per question of the scorer, or are negative
+        """
+        n_questions = len(scorer.question_ids)
+        candidates = np.asarray(candidates, dtype=float).reshape(-1, n_questions)
+        reference = np.asarray(reference, dtype=float).reshape(n_questions)
+        if (candidates < 0).any() or (reference < 0).any():
+            raise ValueError("Importance weights must not be negative")
+
+        self.scorer = scorer
+        self.n_candidates = len(candidates)
+        # The reference is scored as candidate 0, so it goes through exactly the same arithmetic
+        weights = np.vstack([reference, candidates])
+        n_columns = len(weights)
+
+        max_options = np.array([max(table.values()) for table in scorer.option_tables])
+        min_options = np.array([min(table.values()) for table in scorer.option_tables])
+        # Questions x (collections x columns) weights of each question in each collection's score under each column
+        self._weight_matrix = np.hstack([membership[:, None] * weights.T for membership in scorer.membership])
+        # The weighted extremes of each collection under each column, flattened like the weight matrix columns
+        self._max_weighted = np.concatenate([weights @ (membership * max_options) for membership in scorer.membership])
+        self._min_weighted = np.concatenate([weights @ (membership * min_options) for membership in scorer.membership])
+
+        self._n_buckets = [len(collection.thresholds or []) + 1 for collection in scorer.collections.values()]
+        self._bucket_counts = [np.zeros((n_columns, n_buckets), dtype=np.int64) for n_buckets in self._n_buckets]
+        self._agreements = [np.zeros(n_columns, dtype=np.int64) for _ in self._n_buckets]
+        self.n_submissions = 0
+
+    @property
+    def chunk_rows(self) -> int:
+        """Number of submissions scored at a time, bounding the memory of the score matrix"""
+        return max(MAX_CHUNK_ELEMENTS // self._weight_matrix.shape[1], 1)
+
+    def add(self, response_scores: np.ndarray) -> None:
+        """Add the threshold assignments of a batch of submissions under every candidate.
+
+        Args:
+            response_scores: submissions x questions raw response scores in the scorer's `question_ids` column order,
+                NaN where unanswered
+        """
+        raw = np.nan_to_num(np.asarray(response_scores, dtype=float), nan=0.0)
+        n_columns = self.n_candidates + 1
+        for start in range(0, len(raw), self.chunk_rows):
+            totals = raw[start : start + self.chunk_rows] @ self._weight_matrix
+            # Normalize positive totals by the maximum and the rest by the absolute minimum
+            with np.errstate(divide="ignore", invalid="ignore"):
+                normalized = np.divide(totals, np.abs(self._min_weighted))
+                np.divide(totals, self._max_weighted, out=normalized, where=totals > 0)
+
+            for c, collection in enumerate(self.scorer.collections.values()):
+                codes, counts = bucket_codes(collection, normalized[:, c * n_columns : (c + 1) * n_columns])
+                self._bucket_counts[c] += counts
+                self._agreements[c] += np.count_nonzero(codes == codes[:, :1], axis=0)
+        self.n_submissions += len(raw)
+
+    def results(self) -> list[SweepResult]:
+        """Threshold assignments of all submissions added so far, for each collection."""
+        results = []
+        for c, (name, collection) in enumerate(self.scorer.collections.items()):
+            # Move the outside-thresholds count from the first to the last bucket
+            counts = np.roll(self._bucket_counts[c], -1, axis=1)
+            results.append(
+                SweepResult(
+                    collection_name=name,
+                    bucket_headers=[t.header for t in collection.thresholds or []] + [OUTSIDE_THRESHOLDS],
+                    n_submissions=self.n_submissions,
+                    reference_counts=counts[0],
+                    bucket_counts=counts[1:],
+                    agreements=self._agreements[c][1:],
+                )
+            )
+        return results
+
+
+def bucket_codes(collection: QuestionScoringCollection, scores: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Threshold buckets of a matrix of normalized scores, and the number of scores in each bucket per column.
+
+    Gives the same buckets as `classify_scores`. Collections have a handful of thresholds, so comparing
+    against each boundary is faster than a sorted search for every score.
+
+    Args:
+        collection: the scoring collection whose thresholds are used
+        scores: submissions x columns array of normalized weighted scores
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: bucket of each score shifted by one, with 0 for scores outside all thresholds,
+            and the columns x buckets number of scores in each shifted bucket
+    """
+    boundaries = collection.threshold_boundaries
+    codes = np.zeros(scores.shape, dtype=np.uint8)
+    # Number of scores in each column at or above each boundary, NaN is never at or above
+    at_least = np.zeros((len(boundaries), scores.shape[1]), dtype=np.int64)
+    for i, boundary in enumerate(boundaries):
+        above = scores >= boundary
+        codes += above
+        at_least[i] = np.count_nonzero(above, axis=0)
+    counts = np.zeros((scores.shape[1], max(len(boundaries), 1)), dtype=np.int64)
+    if boundaries:
+        # Scores at or above the highest upper bound are outside all thresholds too
+        codes[codes == len(boundaries)] = 0
+        counts[:, 1:] = (at_least[:-1] - at_least[1:]).T
+    counts[:, 0] = len(scores) - counts[:, 1:].sum(axis=1)
+    return codes, counts
+
+
+def log_response_scores(scorer: BatchScorer, log: AssessmentLog, rows: np.ndarray) -> np.ndarray:
+    """Response scores of assessment log rows, for the questions the scorer uses.
+
+    Answers are matched to the scorer's questions by question id and option text, so logs written with an older
+    question bank can be used. Questions or options that no longer exist count as unanswered.
+
+    Args:
+        scorer: compiled scoring collections
+        log: the log the rows come from
+        rows: structured array of log rows
+
+    Returns:
+        np.ndarray: submissions x questions raw response scores in the scorer's `question_ids` column order,
+            NaN where unanswered
+    """
+    schema_columns = dict(zip(log.schema.question_ids, log.schema.option_texts))
+    scores = np.full((len(rows), len(scorer.question_ids)), np.nan)
+    for j, (qid, option_table) in enumerate(zip(scorer.question_ids, scorer.option_tables)):
+        if qid not in schema_columns:
+            continue
+        column = rows[f"question:{qid}"]
+        texts = schema_columns[qid]
+        if texts is None:
+            if scorer.is_range[j]:
+                scores[:, j] = column
+            continue
+        # The score of each logged option index, with the unanswered index -1 mapped to the trailing NaN
+        option_scores = np.array([option_table.get(text, np.nan) for text in texts] + [np.nan])
+        scores[:, j] = option_scores[column]
+    return scores
+
+
+def historical_response_scores(
+    scorer: BatchScorer, log_dir: Path | None = None, responses_path: Path | None = None
+) -> Iterator[np.ndarray]:
+    """Stream the response scores of historical submissions in chunks.
+
+    Args:
+        scorer: compiled scoring collections
+        log_dir: directory of assessment logs to read all rows of
+        responses_path: CSV or JSONL file of response sets to read instead of the logs
+
+    Yields:
+        np.ndarray: submissions x questions raw response scores, NaN where unanswered
+    """
+    if responses_path is not None:
+        for chunk in read_chunks(responses_path, READ_CHUNK_SIZE):
+            yield scorer.response_scores(scorer.responses_matrix(chunk))
+        return
+    for log in AssessmentLog.open_all(log_dir):
+        for rows in log.chunks():
+            yield log_response_scores(scorer, log, rows)
+
+
+def candidate_weights(
+    question_ids: list[str], reference: np.ndarray, weight_sets: Iterable[Mapping[str, str | float | None]]
+) -> np.ndarray:
+    """Candidate weight matrix from weight sets keyed by question id.
+
+    Args:
+        question_ids: questions in column order
+        reference: reference weight of each question, used where a weight set has no weight
+        weight_sets: one mapping of question ids to weights per candidate, empty values keep the reference weight
+
+    Returns:
+        np.ndarray: candidates x questions array of weights
+
+    Raises:
+        ValueError: If a weight set has a question id that isn't used by any collection
+    """
+    column_of = {qid: j for j, qid in enumerate(question_ids)}
+    rows = []
+    for weight_set in weight_sets:
+        row = np.array(reference, dtype=float)
+        for qid, weight in weight_set.items():
+            if weight is None or weight == "":
+                continue
+            if qid not in column_of:
+                raise ValueError(f"Question ID '{qid}' of a candidate is not used by any scoring collection")
+            row[column_of[qid]] = float(weight)
+        rows.append(row)
+    return np.array(rows, dtype=float).reshape(-1, len(question_ids))
+
+
+def random_candidates(reference: np.ndarray, n: int, spread: float, rng: np.random.Generator) -> np.ndarray:
+    """Candidates that scale each reference weight by an independent log-normal factor with median 1.
+
+    Args:
+        reference: reference weight of each question
+        n: number of candidates
+        spread: standard deviation of the log of the factors
+        rng: random number generator
+
+    Returns:
+        np.ndarray: candidates x questions array of weights
+    """
+    return reference * np.exp(rng.normal(0.0, spread, size=(n, len(reference))))
+
+
+def write_results(results: list[SweepResult], output_path: Path) -> None:
+    """Write the agreement rate and bucket shares of every candidate and collection as CSV, one row each."""
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["candidate", "collection", "agreement_rate", "bucket", "share"])
+        for result in results:
+            shares = result.bucket_shares.tolist()
+            for candidate, (agreement_rate, candidate_shares) in enumerate(zip(result.agreement_rates.tolist(), shares)):
+                for header, share in zip(result.bucket_headers, candidate_shares):
+                    writer.writerow([candidate, result.collection_name, f"{agreement_rate:.6f}", header, f"{share:.6f}"])
+
+
+def write_candidates(question_ids: list[str], candidates: np.ndarray, output_path: Path) -> None:
+    """Write candidate weights as CSV, in the format read by --candidates."""
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(question_ids)
+        writer.writerows(candidates.round(6).tolist())
+
+
+def print_results(results: list[SweepResult], top: int) -> None:
+    """Print the reference distribution, the spread of agreement rates and the most disruptive candidates."""
+    for result in results:
+        print(f"\nScoring Config: {result.collection_name}")
+        print("-" * 80)
+        if not result.n_submissions:
+            print("No historical submissions")
+            continue
+        reference_shares = result.reference_counts / result.n_submissions
+        print("Reference share of submissions per threshold:")
+        for header, share in zip(result.bucket_headers, reference_shares.tolist()):
+            print(f"\t{header}: {share:.2%}")
+        rates = result.agreement_rates
+        print(
+            f"Agreement with the reference: min {rates.min():.2%}, median {np.median(rates):.2%}, max {rates.max():.2%}"
+        )
+        print(f"Candidates with the lowest agreement (top {top}):")
+        for candidate in np.argsort(rates, kind="stable")[:top].tolist():
+            shares = ", ".join(
+                f"{header} {share:.1%}" for header, share in zip(result.bucket_headers, result.bucket_shares[candidate])
+            )
+            print(f"\tCandidate {candidate}: agreement {rates[candidate]:.2%}; {shares}")
+
+
+def main():
+    """Main function to sweep candidate importance weights."""
+    parser = argparse.ArgumentParser(description="Sweep candidate importance weights against historical responses")
+    parser.add_argument(
+        "--questions",
+        type=Path,
+        default=QUESTIONS_PATH,
+        help="Path to questions.json (default: data/questions.json)",
+    )
+    parser.add_argument(
+        "--scoring_configs",
+        type=Path,
+        nargs="+",
+        default=sorted(DATA_DIR.glob(SCORING_COLLECTIONS_GLOB)),
+        help="Scoring configuration JSON files (default: data/*_scoring_questions.json)",
+    )
+    parser.add_argument(
+        "--log_dir",
+        type=Path,
+        default=ASSESSMENT_LOG_DIR,
+        help="Assessment logs to take the historical responses from (default: data/assessments)",
+    )
+    parser.add_argument("--responses", type=Path, help="CSV or JSONL file of historical responses instead of the logs")
+    candidates_source = parser.add_mutually_exclusive_group(required=True)
+    candidates_source.add_argument(
+        "--candidates", type=Path, help="CSV or JSONL file of candidate weights by question id"
+    )
+    candidates_source.add_argument("--random_candidates", type=int, help="Number of random candidates to generate")
+    parser.add_argument(
+        "--spread",
+        type=float,
+        default=DEFAULT_SPREAD,
+        help=f"Standard deviation of the log of the random weight factors (default: {DEFAULT_SPREAD})",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random candidates (default: 0)")
+    parser.add_argument("--reference", type=Path, help="JSON file of reference weights by question id")
+    parser.add_argument("--output", type=Path, help="Write the results of every candidate as CSV")
+    parser.add_argument("--candidates_output", type=Path, help="Write the candidate weights as CSV")
+    parser.add_argument(
+        "--top", type=int, default=5, help="Candidates with the lowest agreement to print per collection (default: 5)"
+    )
+
+    args = parser.parse_args()
+
+    scorer = load_batch_scorer(args.questions, args.scoring_configs)
+    reference_overrides = json.loads(args.reference.read_text()) if args.reference else {}
+    reference = candidate_weights(scorer.question_ids, scorer.weights, [reference_overrides])[0]
+    if args.candidates:
+        candidates = candidate_weights(
+            scorer.question_ids, reference, (row for chunk in read_chunks(args.candidates, READ_CHUNK_SIZE) for row in chunk)
+        )
+    else:
+        candidates = random_candidates(reference, args.random_candidates, args.spread, np.random.default_rng(args.seed))
+    if args.candidates_output:
+        write_candidates(scorer.question_ids, candidates, args.candidates_output)
+
+    sweep = WeightSweep(scorer, candidates, reference)
+    start = time.perf_counter()
+    for response_scores in historical_response_scores(scorer, args.log_dir, args.responses):
+        sweep.add(response_scores)
+    elapsed = time.perf_counter() - start
+
+    results = sweep.results()
+    print(
+        f"Swept {len(candidates)} candidates over {sweep.n_submissions} submissions and {len(results)} collections "
+        f"in {elapsed:.2f}s"
+    )
+    print("=" * 80)
+    print_results(results, args.top)
+    if args.output:
+        write_results(results, args.output)
+        print(f"\nWrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()